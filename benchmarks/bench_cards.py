@@ -0,0 +1,61 @@
+# coding: utf-8
+"""
+Card provider detection, chain of regular expressions vs. ``get_card_provider`` and ``get_card_providers``
+
+    python benchmarks/bench_cards.py [--count 100000]
+
+Reports masked card numbers per second, numbers are random BINs of known providers.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycsob import cards, conf  # noqa: E402
+
+# regular expressions used before the lookup table
+REGEXES = (
+    (conf.CARD_PROVIDER_VISA, re.compile(r'^4\d{5}$')),
+    (conf.CARD_PROVIDER_AMEX, re.compile(r'^3[47]\d{4}$')),
+    (conf.CARD_PROVIDER_DINERS, re.compile(r'^3(?:0[0-5]|[68][0-9])[0-9]{3}$')),
+    (conf.CARD_PROVIDER_JCB, re.compile(r'^(?:2131|1800|35[0-9]{2})[0-9]{2}$')),
+    (conf.CARD_PROVIDER_MC, re.compile(
+        r'^(?:5[1-5][0-9]{4}|222[1-9][0-9]{2}|22[3-9][0-9]{3}|2[3-6][0-9]{4}|27[01][0-9]{3}|2720[0-9]{2})$')),
+)
+
+
+def regex_provider(long_masked_number):
+    for provider_id, rx in REGEXES:
+        if rx.match(long_masked_number[:6]):
+            return provider_id, conf.CARD_PROVIDERS[provider_id]
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    prefixes = ('4', '51', '55', '2221', '2720', '300', '36', '34', '37', '35', '1800')
+    numbers = [(p + ''.join(rnd.choice('0123456789') for _ in range(6)))[:6] + '****1234'
+               for p in (rnd.choice(prefixes) for _ in range(args.count))]
+    candidates = (
+        ('regex chain', lambda: [regex_provider(n) for n in numbers]),
+        ('get_card_provider', lambda: [cards.get_card_provider(n) for n in numbers]),
+        ('get_card_providers', lambda: cards.get_card_providers(numbers)),
+    )
+    assert len(set(tuple(func()) for name, func in candidates)) == 1, 'providers differ'
+
+    for name, func in candidates:
+        start = time.perf_counter()
+        func()
+        print('%-24s %10.0f numbers/s' % (name, args.count / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# coding: utf-8
+"""
+Signatures per second, inline signing vs. ``ProcessPoolBackend``
+
+    python benchmarks/bench_crypto.py [--key private.key] [--count 2000] [--workers 4]
+
+Without ``--key`` a RSA-2048 key (size used by the gateway) is generated.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.PublicKey import RSA  # noqa: E402
+
+from pycsob import utils  # noqa: E402
+from pycsob.crypto import ProcessPoolBackend  # noqa: E402
+from pycsob.keys import CsobKey  # noqa: E402
+
+
+def digests(count):
+    return [utils.msg_digest(OrderedDict((
+        ('merchantId', 'M1E3CB2577'),
+        ('payId', '%015x' % i),
+        ('dttm', '20190502161426'),
+    ))) for i in range(count)]
+
+
+def bench(name, func, msgs):
+    func(msgs[:10])  # warm up, workers are started and keys parsed
+    start = time.perf_counter()
+    func(msgs)
+    elapsed = time.perf_counter() - start
+    print('%-32s %10.0f signatures/s' % (name, len(msgs) / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--key', help='private key file')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    source = args.key or RSA.generate(2048)
+    msgs = digests(args.count)
+
+    inline = CsobKey(source)
+    bench('inline', lambda m: [inline.sign_digest(one) for one in m], msgs)
+
+    with ProcessPoolBackend(max_workers=args.workers) as backend:
+        key = CsobKey(source, crypto_backend=backend)
+        bench('process pool (%d workers)' % args.workers, key.sign_many, msgs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# coding: utf-8
+"""
+Import time of pycsob modules and of the first client call, ``python -X importtime`` based
+
+    python benchmarks/bench_import.py [--runs 10]
+
+Each module is imported in new interpreter, median of cumulative import times is reported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('pycsob.conf', 'pycsob.utils', 'pycsob.returns', 'pycsob.client', 'pycsob.aio', 'requests')
+
+
+def import_time(module):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                          stderr=subprocess.PIPE, env=dict(os.environ, PYTHONPATH=ROOT), check=True,
+                          universal_newlines=True)
+    for line in proc.stderr.splitlines():
+        if line.endswith('| %s' % module):
+            return int(line.split('|')[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        try:
+            times = sorted(import_time(module) for _ in range(args.runs))
+        except subprocess.CalledProcessError:
+            print('%-24s %10s' % (module, 'n/a'))
+            continue
+        print('%-24s %10.1f ms' % (module, times[len(times) // 2] / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
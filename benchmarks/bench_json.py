@@ -0,0 +1,86 @@
+# coding: utf-8
+"""
+JSON encoding of request bodies and decoding of responses, previous path vs. serializers
+
+    python benchmarks/bench_json.py [--count 20000]
+
+Request is signed ``payment/init`` payload with two cart items, response is ``payment/status``
+with two ``maskClnRP`` extensions. Decoding includes extraction of signed values and their digests,
+RSA verification is not included.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycsob import conf, serializers, utils  # noqa: E402
+from pycsob.keys import CsobKey  # noqa: E402
+from pycsob.results import MaskedCardExtension  # noqa: E402
+
+from suite import INIT_PAIRS, KEY_PATH, mk_response, response_body  # noqa: E402
+
+
+def previous_decode(body):
+    "``response.json()`` and copies of signed values as before"
+    data = mk_response(body).json()
+    signature = data.pop('signature')
+    payload = OrderedDict((k, data[k]) for k in conf.RESPONSE_KEYS if k in data)
+    signed = [(utils.msg_digest(payload), signature)]
+    for one in data.get('extensions', ()):
+        o = OrderedDict((k, one[k]) for k in MaskedCardExtension.keys if k in one)
+        signed.append((utils.msg_digest(o), one['signature']))
+    return signed
+
+
+def decode(serializer, body):
+    data = serializer.loads(mk_response(body).content)
+    signed = [(utils.msg_digest(data, conf.RESPONSE_KEYS), data['signature'])]
+    for one in data.get('extensions', ()):
+        signed.append((utils.msg_digest(one, MaskedCardExtension.keys), one['signature']))
+    return signed
+
+
+def rate(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    key = CsobKey(KEY_PATH)
+    payload = utils.mk_payload(key, INIT_PAIRS)
+    body = response_body(key, extensions=2)
+
+    available = []
+    for cls in serializers.SERIALIZERS:
+        try:
+            available.append(cls())
+        except ImportError:
+            print('%s is not installed' % cls.name)
+
+    encoders = [('json.dumps', lambda: json.dumps(payload).encode())]
+    decoders = [('response.json + copy', lambda: previous_decode(body))]
+    for serializer in available:
+        encoders.append((serializer.name, lambda s=serializer: s.dumps(payload)))
+        decoders.append((serializer.name, lambda s=serializer: decode(s, body)))
+    assert len(set(tuple(func()) for name, func in decoders)) == 1, 'digests differ'
+
+    print('%-24s %12s' % ('encode request', 'calls/s'))
+    for name, func in encoders:
+        print('%-24s %12.0f' % (name, rate(func, args.count)))
+    print('\n%-24s %12s' % ('decode response', 'calls/s'))
+    for name, func in decoders:
+        print('%-24s %12.0f' % (name, rate(func, args.count)))
+
+
+if __name__ == '__main__':
+    main()
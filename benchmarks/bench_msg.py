@@ -0,0 +1,54 @@
+# coding: utf-8
+"""
+Message digest for signing, ``sha1(mk_msg_for_sign(payload))`` vs. streaming ``msg_digest(payload)``
+
+    python benchmarks/bench_msg.py [--count 100000]
+
+Reports calls per second and peak memory allocated by one call.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from hashlib import sha1
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycsob import utils  # noqa: E402
+
+from suite import INIT_PAIRS  # noqa: E402
+
+
+def peak_alloc(func):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    payload = OrderedDict(INIT_PAIRS)
+    candidates = (
+        ('sha1(mk_msg_for_sign)', lambda: sha1(utils.mk_msg_for_sign(payload)).digest()),
+        ('msg_digest', lambda: utils.msg_digest(payload)),
+    )
+    assert len(set(func() for name, func in candidates)) == 1, 'digests differ'
+
+    for name, func in candidates:
+        start = time.perf_counter()
+        for _ in range(args.count):
+            func()
+        rate = args.count / (time.perf_counter() - start)
+        print('%-24s %10.0f calls/s %8d B peak alloc/call' % (name, rate, peak_alloc(func)))
+
+
+if __name__ == '__main__':
+    main()
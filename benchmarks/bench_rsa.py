@@ -0,0 +1,88 @@
+# coding: utf-8
+"""
+Sign/verify operations per second of RSA backends on payloads built by ``CsobClient``
+
+    python benchmarks/bench_rsa.py [--key private.key] [--count 1000]
+
+Without ``--key`` a RSA-2048 key (size used by the gateway) is generated.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.PublicKey import RSA  # noqa: E402
+
+from pycsob import backends, utils  # noqa: E402
+from pycsob.keys import CsobKey  # noqa: E402
+
+PAYLOADS = {
+    'payment/init': OrderedDict([
+        ('merchantId', 'M1E3CB2577'),
+        ('orderNo', '5547'),
+        ('dttm', '20190502161426'),
+        ('payOperation', 'payment'),
+        ('payMethod', 'card'),
+        ('totalAmount', 1789600),
+        ('currency', 'CZK'),
+        ('closePayment', True),
+        ('returnUrl', 'https://shop.example.com/return'),
+        ('returnMethod', 'POST'),
+        ('cart', [
+            OrderedDict([('name', 'Nákup: vasobchod.cz'), ('quantity', 1), ('amount', 1789600)]),
+            OrderedDict([('name', 'Poštovné'), ('quantity', 1), ('amount', 0)]),
+        ]),
+        ('description', 'Nákup na vasobchod.cz (Lenovo ThinkPad Edge E540, Doprava PPL)'),
+        ('language', 'CZ'),
+        ('ttlSec', 600),
+    ]),
+    'payment/status': OrderedDict([
+        ('merchantId', 'M1E3CB2577'),
+        ('payId', '34ae55eb69e2cBF'),
+        ('dttm', '20190502161426'),
+    ]),
+}
+
+
+def bench(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--key', help='private key file')
+    parser.add_argument('--count', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.key:
+        with open(args.key, 'rb') as fp:
+            pem = fp.read()
+    else:
+        pem = RSA.generate(2048).export_key()
+
+    keys = []
+    for cls in backends.BACKENDS:
+        try:
+            keys.append(CsobKey(pem, rsa_backend=cls()))
+        except ImportError:
+            print('%s backend is not available' % cls.name)
+
+    for endpoint, payload in sorted(PAYLOADS.items()):
+        signatures = set(utils.sign(payload, key) for key in keys)
+        assert len(signatures) == 1, 'signatures differ'
+        signature = signatures.pop()
+        for key in keys:
+            sign = bench(lambda: utils.sign(payload, key), args.count)
+            verify = bench(lambda: utils.verify(payload, signature, key), args.count)
+            print('%-16s %-14s sign %8.0f ops/s   verify %8.0f ops/s' % (
+                endpoint, key.rsa_backend.name, sign, verify))
+
+
+if __name__ == '__main__':
+    main()
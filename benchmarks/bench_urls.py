@@ -0,0 +1,57 @@
+# coding: utf-8
+"""
+Payment process urls per second, loop of ``get_payment_process_url`` vs. ``get_payment_process_urls``
+
+    python benchmarks/bench_urls.py [--key private.key] [--count 5000] [--workers 4]
+
+Without ``--key`` a RSA-2048 key (size used by the gateway) is generated.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.PublicKey import RSA  # noqa: E402
+
+from pycsob.client import CsobClient  # noqa: E402
+from pycsob.crypto import ProcessPoolBackend  # noqa: E402
+from pycsob.keys import CsobKey  # noqa: E402
+
+BASE_URL = 'https://iapi.iplatebnibrana.csob.cz/api/v1.7/'
+
+
+def bench(name, func, pay_ids):
+    list(func(pay_ids[:10]))  # warm up, workers are started and keys parsed
+    start = time.perf_counter()
+    for _ in func(pay_ids):
+        pass
+    elapsed = time.perf_counter() - start
+    print('%-40s %10.0f urls/s' % (name, len(pay_ids) / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--key', help='private key file')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    source = CsobKey(args.key or RSA.generate(2048).export_key())
+    pay_ids = ['%015x' % i for i in range(args.count)]
+
+    c = CsobClient('M1E3CB2577', BASE_URL, source, source)
+    bench('get_payment_process_url loop', lambda ids: [c.get_payment_process_url(one) for one in ids], pay_ids)
+    bench('get_payment_process_urls', c.get_payment_process_urls, pay_ids)
+    bench('get_payment_process_urls (%d threads)' % args.workers,
+          lambda ids: c.get_payment_process_urls(ids, workers=args.workers), pay_ids)
+
+    with ProcessPoolBackend(max_workers=args.workers) as backend:
+        key = CsobKey(source.pem, crypto_backend=backend)
+        c = CsobClient('M1E3CB2577', BASE_URL, key, key)
+        bench('get_payment_process_urls (%d processes)' % args.workers, c.get_payment_process_urls, pay_ids)
+
+
+if __name__ == '__main__':
+    main()
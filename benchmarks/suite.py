@@ -0,0 +1,219 @@
+# coding: utf-8
+"""
+Benchmark suite of signing, verification and request building hot paths
+
+    python benchmarks/suite.py [--duration 1.0] [--output results.json] [--compare baseline.json]
+
+Each benchmark reports ops/s, latency percentiles and peak memory allocated by one call.
+Client operations run end to end against a local mock gateway, no network access is needed.
+Results are saved as JSON so runs of different releases can be compared with ``--compare``.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from pycsob import __versionstr__, conf, utils  # noqa: E402
+from pycsob.client import CsobClient  # noqa: E402
+from pycsob.keys import CsobKey  # noqa: E402
+from pycsob.mock_gateway import MockGateway  # noqa: E402
+from pycsob.serializers import get_serializer  # noqa: E402
+
+KEY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'tests_pycsob', 'fixtures', 'test.key')
+PAY_ID = '34ae55eb69e2cBF'
+CART = [
+    OrderedDict([('name', 'Nákup: vasobchod.cz'), ('quantity', 1), ('amount', 1789600)]),
+    OrderedDict([('name', 'Poštovné'), ('quantity', 1), ('amount', 0)]),
+]
+INIT_PAIRS = (
+    ('merchantId', 'M1E3CB2577'),
+    ('orderNo', '5547'),
+    ('dttm', '20190502161426'),
+    ('payOperation', 'payment'),
+    ('payMethod', 'card'),
+    ('totalAmount', 1789600),
+    ('currency', 'CZK'),
+    ('closePayment', True),
+    ('returnUrl', 'https://shop.example.com/return'),
+    ('returnMethod', 'POST'),
+    ('cart', CART),
+    ('description', 'Nákup na vasobchod.cz (Lenovo ThinkPad Edge E540, Doprava PPL)'),
+    ('language', 'CZ'),
+    ('ttlSec', 600),
+)
+
+
+def response_body(key, extensions=0):
+    payload = utils.mk_payload(key, pairs=(
+        ('payId', PAY_ID),
+        ('dttm', '20190502161426'),
+        ('resultCode', conf.RETURN_CODE_OK),
+        ('resultMessage', 'OK'),
+        ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+        ('authCode', '042760'),
+    ))
+    if extensions:
+        payload['extensions'] = [utils.mk_payload(key, pairs=(
+            ('extension', 'maskClnRP'),
+            ('dttm', '20190502161426'),
+            ('maskedCln', '****1234'),
+            ('expiration', '12/20'),
+            ('longMaskedCln', '423451****1234'),
+        )) for _ in range(extensions)]
+    return json.dumps(payload).encode()
+
+
+def mk_response(body):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    return response
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1))))]
+
+
+def measure(func, duration):
+    func()  # warm up
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while True:
+        start = time.perf_counter()
+        func()
+        end = time.perf_counter()
+        latencies.append(end - start)
+        if end >= deadline:
+            break
+
+    peaks = []
+    for _ in range(5):
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return OrderedDict([
+        ('ops_per_sec', len(latencies) / sum(latencies)),
+        ('p50_us', percentile(latencies, 50) * 1e6),
+        ('p95_us', percentile(latencies, 95) * 1e6),
+        ('p99_us', percentile(latencies, 99) * 1e6),
+        ('alloc_peak_bytes', sorted(peaks)[len(peaks) // 2]),
+        ('iterations', len(latencies)),
+    ])
+
+
+def benchmarks(key):
+    payload = OrderedDict(INIT_PAIRS)
+    signature = utils.sign(payload, key)
+    status_payload = utils.mk_payload(key, pairs=(
+        ('merchantId', 'M1E3CB2577'), ('payId', PAY_ID), ('dttm', '20190502161426')))
+    body = response_body(key)
+    body_ext = response_body(key, extensions=2)
+    return_data = dict(utils.mk_payload(key, pairs=(
+        ('payId', PAY_ID),
+        ('dttm', '20190502161426'),
+        ('resultCode', str(conf.RETURN_CODE_OK)),
+        ('resultMessage', 'OK'),
+        ('paymentStatus', str(conf.PAYMENT_STATUS_WAITING)),
+        ('authCode', '042760'),
+        ('merchantData', 'Rm9v'),
+    )))
+    client = CsobClient('M1E3CB2577', 'https://gw.example.com/api/v1.7/', key, key)
+
+    return OrderedDict([
+        ('mk_msg_for_sign', lambda: utils.mk_msg_for_sign(payload)),
+        ('msg_digest', lambda: utils.msg_digest(payload)),
+        ('sign', lambda: utils.sign(payload, key)),
+        ('verify', lambda: utils.verify(payload, signature, key)),
+        ('mk_payload', lambda: utils.mk_payload(key, INIT_PAIRS)),
+        ('mk_url', lambda: utils.mk_url('https://gw.example.com/api/v1.7/', 'payment/status/', status_payload)),
+        ('validate_response', lambda: utils.validate_response(mk_response(body), key)),
+        ('validate_response_extensions', lambda: utils.validate_response(mk_response(body_ext), key)),
+        ('validate_response_lazy_extensions',
+         lambda: utils.validate_response(mk_response(body_ext), key, lazy_extensions=True)),
+        ('gateway_return', lambda: client.gateway_return(return_data)),
+        ('return_verifier.verify_many', lambda: client.return_verifier.verify_many([return_data] * 10)),
+        ('dttm_decode', lambda: utils.dttm_decode('20190502161426')),
+        ('get_card_provider', lambda: utils.get_card_provider('423451****1234')),
+    ])
+
+
+def client_benchmarks(key, base_url):
+    client = CsobClient('M1E3CB2577', base_url, key, key)
+    pay_id = client.payment_init(5547, 1789600, 'https://shop.example.com/return', 'Nákup na vasobchod.cz',
+                                 cart=CART).payload['payId']
+    return OrderedDict([
+        ('client.payment_init', lambda: client.payment_init(
+            5547, 1789600, 'https://shop.example.com/return', 'Nákup na vasobchod.cz', cart=CART)),
+        ('client.payment_status', lambda: client.payment_status(pay_id)),
+        ('client.payment_close', lambda: client.payment_close(pay_id)),
+        ('client.echo', lambda: client.echo()),
+    ])
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as fp:
+        baseline = json.load(fp)['results']
+    print('\n%-32s %12s %12s %8s' % ('compared to %s' % os.path.basename(baseline_file), 'baseline', 'current',
+                                     'ratio'))
+    for name, one in results.items():
+        if name in baseline:
+            old, new = baseline[name]['ops_per_sec'], one['ops_per_sec']
+            print('%-32s %12.0f %12.0f %7.2fx' % (name, old, new, new / old))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--key', default=KEY_PATH, help='private key file (test key by default)')
+    parser.add_argument('--duration', type=float, default=1.0, help='seconds per benchmark')
+    parser.add_argument('--filter', default='', help='run benchmarks containing this string only')
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--compare', help='compare with results saved by --output')
+    args = parser.parse_args()
+
+    key = CsobKey(args.key)
+    gateway = MockGateway(key=key).start()
+
+    todo = benchmarks(key)
+    todo.update(client_benchmarks(key, gateway.base_url))
+
+    results = OrderedDict()
+    print('%-32s %12s %10s %10s %10s %12s' % ('benchmark', 'ops/s', 'p50 us', 'p95 us', 'p99 us', 'alloc B'))
+    for name, func in todo.items():
+        if args.filter not in name:
+            continue
+        one = results[name] = measure(func, args.duration)
+        print('%-32s %12.0f %10.1f %10.1f %10.1f %12d' % (
+            name, one['ops_per_sec'], one['p50_us'], one['p95_us'], one['p99_us'], one['alloc_peak_bytes']))
+    gateway.stop()
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(OrderedDict([
+                ('pycsob', __versionstr__),
+                ('python', platform.python_version()),
+                ('platform', platform.platform()),
+                ('rsa_backend', key.rsa_backend.name),
+                ('serializer', get_serializer().name),
+                ('date', datetime.datetime.now().isoformat()),
+                ('results', results),
+            ]), fp, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
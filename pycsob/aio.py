@@ -0,0 +1,312 @@
+# coding: utf-8
+import asyncio
+import functools
+import time
+from collections import deque
+
+try:
+    from contextvars import copy_context
+except ImportError:  # Python < 3.7
+    copy_context = None
+
+try:
+    from asyncio import _get_running_loop as _running_loop
+except ImportError:  # Python < 3.5.3
+    def _running_loop():
+        return None
+
+import httpx
+
+from . import batch, conf, metrics, utils
+from .client import CsobClient, PoolStats, log
+
+
+class AsyncBatch(object):
+    """
+    Async iterator calling coroutine function for each item with bounded concurrency
+
+    Yields ``BatchResult`` as calls complete, see ``pycsob.batch.run_batch``.
+    """
+
+    def __init__(self, func, items, concurrency=10, max_retries=5, backoff=1.0):
+        self.func = func
+        self.items = iter(items)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.throttle = batch.Throttle()
+        self._semaphore = None
+        self._pending = set()
+        self._done = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._semaphore is None:
+            # created lazily to be bound to the running loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        while not self._done:
+            self._fill()
+            if not self._pending:
+                raise StopAsyncIteration
+            done, self._pending = await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+            self._done.extend(task.result() for task in done)
+        return self._done.popleft()
+
+    def _fill(self):
+        while len(self._pending) < 2 * self.concurrency:
+            try:
+                item = next(self.items)
+            except StopIteration:
+                return
+            self._pending.add(asyncio.ensure_future(self._call(item)))
+
+    async def _call(self, item):
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                delay = self.throttle.delay()
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    return batch.BatchResult(item, await self.func(item), None)
+                except Exception as e:
+                    if batch.status_code(e) != batch.TOO_MANY_REQUESTS or attempt >= self.max_retries:
+                        return batch.BatchResult(item, None, e)
+                    self.throttle.pause(batch.retry_after(e, self.backoff * 2 ** attempt))
+                    attempt += 1
+
+    async def aclose(self):
+        "Cancel calls in progress"
+        for task in self._pending:
+            task.cancel()
+        if self._pending:
+            await asyncio.wait(self._pending)
+        self._pending = set()
+
+
+class AsyncCsobClient(CsobClient):
+    """
+    Asyncio client built on ``httpx.AsyncClient``
+
+    It has the same methods as ``CsobClient``. Methods calling the gateway return
+    coroutines, ``get_payment_process_url`` and ``gateway_return`` stay synchronous.
+    Keep-alive connections are pooled, use one client per event loop::
+
+        async with AsyncCsobClient(...) as c:
+            r = await c.payment_status(pay_id)
+
+    With ``crypto_backend`` (e.g. ``ProcessPoolBackend``) signing and verification run in default
+    executor of the loop, the loop is not blocked while waiting for the backend.
+    """
+    transport_errors = (httpx.TransportError,)
+
+    def __init__(self, merchant_id, base_url, private_key_file, csob_pub_key_file,
+                 max_connections=100, max_keepalive_connections=20, keepalive_expiry=5.0,
+                 http2=False, transport=None, crypto_backend=None, rsa_backend=None, retry=None,
+                 circuit_breaker=None, metrics_sink=None, cache=None, rate_limiter=None, serializer=None,
+                 state_tracker=None, lazy_extensions=False):
+        """
+        :param max_connections: max number of concurrent connections to the gateway
+        :param max_keepalive_connections: max number of idle connections kept in the pool
+        :param keepalive_expiry: seconds after which idle connection is closed
+        :param http2: use HTTP/2 (``h2`` package must be installed)
+        :param transport: custom ``httpx`` transport
+        :param cache: ``pycsob.cache.Cache``, it is called synchronously so it should be fast (``MemoryCache``)
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.transport = transport
+        # pool statistics, updated in the event loop only
+        self._requests = self._connections = self._in_use = self._peak_in_use = 0
+        # loop of the last request, connections belong to it
+        self._loop = None
+        super(AsyncCsobClient, self).__init__(merchant_id, base_url, private_key_file, csob_pub_key_file,
+                                              crypto_backend=crypto_backend, rsa_backend=rsa_backend,
+                                              retry=retry, circuit_breaker=circuit_breaker,
+                                              metrics_sink=metrics_sink, cache=cache,
+                                              rate_limiter=rate_limiter, serializer=serializer,
+                                              state_tracker=state_tracker, lazy_extensions=lazy_extensions)
+
+    def _create_session(self):
+        connect_timeout, read_timeout = conf.HTTP_TIMEOUT
+        return httpx.AsyncClient(
+            headers=conf.HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=self.limits,
+            http2=self.http2,
+            transport=self.transport,
+        )
+
+    async def _call(self, method, endpoint_url, payload, in_url=False, idempotent=False):
+        if self.metrics_sink is None:
+            return await self._call_with_retry(method, endpoint_url, payload, in_url, idempotent)
+        with metrics.operation(self.metrics_sink, method, endpoint_url):
+            return await self._call_with_retry(method, endpoint_url, payload, in_url, idempotent)
+
+    async def _call_with_retry(self, method, endpoint_url, payload, in_url, idempotent):
+        op = metrics.current()
+        bucket = None if self.rate_limiter is None else self.rate_limiter.bucket(endpoint_url)
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                if bucket is not None:
+                    delay = bucket.reserve()
+                    if delay:
+                        if op is not None:
+                            op.add('throttle', delay)
+                        await asyncio.sleep(delay)
+                if callable(payload):
+                    signed = await self._offload(metrics.timed, 'build', payload)
+                else:
+                    signed = payload
+                if op is None:
+                    r = await self._send(method, endpoint_url, signed, in_url)
+                else:
+                    start = time.perf_counter()
+                    r = await self._send(method, endpoint_url, signed, in_url)
+                    op.add('http', time.perf_counter() - start)
+                    op.status_code = r.status_code
+                if bucket is not None:
+                    self.rate_limiter.record(bucket, r)
+                r.raise_for_status()
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(e, self.transport_errors)
+                attempt += 1
+                if not (idempotent and self.retry is not None
+                        and self.retry.should_retry(e, attempt, self.transport_errors)):
+                    raise
+                delay = self.retry.delay(e, attempt)
+                log.info('Retrying %s %s in %.2fs (attempt %d): %s', method, endpoint_url, delay, attempt, e)
+                if op is not None:
+                    op.retries = attempt
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_abort()
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            response = await self._offload(utils.validate_response, r, self.pubkey, self.serializer,
+                                           self.lazy_extensions)
+            if op is not None:
+                op.result_code = response.result_code
+            self._record(endpoint_url, response)
+            return response
+
+    async def _offload(self, func, *args):
+        "Call function, in executor when keys dispatch RSA operations to ``crypto_backend`` (blocking wait)"
+        if self.key.crypto_backend is None and self.pubkey.crypto_backend is None:
+            return func(*args)
+        call = functools.partial(func, *args)
+        if copy_context is not None:
+            # metrics of the operation are kept in context variable
+            call = functools.partial(copy_context().run, call)
+        return await asyncio.get_event_loop().run_in_executor(None, call)
+
+    async def _send(self, method, endpoint_url, payload, in_url):
+        self._loop = _running_loop()
+        self._requests += 1
+        self._in_use += 1
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        extensions = {'trace': self._trace}
+        try:
+            if in_url:
+                url = utils.mk_url(base_url=self.base_url, endpoint_url=endpoint_url, payload=payload)
+                return await self._client.request(method, url, extensions=extensions)
+            url = utils.mk_url(base_url=self.base_url, endpoint_url=endpoint_url)
+            return await self._client.request(method, url, content=self.serializer.dumps(payload),
+                                              extensions=extensions)
+        finally:
+            self._in_use -= 1
+
+    async def payment_status(self, pay_id, use_cache=True):
+        if self.cache is not None and use_cache:
+            cached = self.cache.get_status(pay_id)
+            if cached is not None:
+                return cached
+        response = await self._call('GET', 'payment/status/', lambda: self.req_payload(pay_id=pay_id),
+                                    in_url=True, idempotent=True)
+        if self.cache is not None:
+            self.cache.set_status(pay_id, response)
+        return response
+
+    def payment_status_many(self, pay_ids, concurrency=10, max_retries=5, use_cache=True):
+        """
+        Get statuses of many payments concurrently, see ``CsobClient.payment_status_many``::
+
+            async for pay_id, response, error in c.payment_status_many(pay_ids, concurrency=50):
+                ...
+
+        :return: async iterator of ``BatchResult(pay_id, response, error)``
+        """
+        func = self.payment_status if use_cache else functools.partial(self.payment_status, use_cache=False)
+        return AsyncBatch(func, pay_ids, concurrency=concurrency, max_retries=max_retries)
+
+    def pool_stats(self):
+        """
+        Statistics of the connection pool, use them to set ``max_keepalive_connections``.
+        Connections are counted by ``httpcore`` trace events, custom transport reports
+        only requests (``connections`` and ``idle`` are 0).
+
+        :return: ``PoolStats``
+        """
+        return PoolStats(self._requests, self._connections, self._idle_connections(), self._in_use,
+                         self._peak_in_use)
+
+    def _idle_connections(self):
+        "Idle connections of ``httpcore`` pool of the default transport, 0 when they cannot be counted"
+        # private attributes of httpx, custom transport or other httpx version may not have them
+        pool = getattr(getattr(self._session, '_transport', None), '_pool', None)
+        try:
+            return sum(1 for connection in pool.connections if connection.is_idle())
+        except (AttributeError, TypeError):
+            return 0
+
+    async def _trace(self, event_name, info):
+        if event_name.startswith('connection.connect_') and event_name.endswith('.complete'):
+            self._connections += 1
+
+    def close(self):
+        """
+        Close all pooled connections, prefer ``await aclose()``
+
+        :return: task closing the connections when called in running event loop, None otherwise
+        """
+        if self._session is None:
+            return None
+        if _running_loop() is not None:
+            return asyncio.ensure_future(self.aclose())
+        if self._loop is None:
+            # nothing was sent, there are no connections
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.aclose())
+            finally:
+                loop.close()
+        elif not self._loop.is_closed():
+            self._loop.run_until_complete(self.aclose())
+        else:
+            # connections of closed loop cannot be closed gracefully, they are dropped
+            self._session = None
+        return None
+
+    async def aclose(self):
+        "Close all pooled connections"
+        if self._session is not None:
+            await self._session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,159 @@
+# coding: utf-8
+"""
+RSA implementations used by ``CsobKey``
+
+Both backends produce identical PKCS#1 v1.5 SHA-1 signatures (the scheme is deterministic).
+``OpenSSLBackend`` (``cryptography`` package) is faster and releases the GIL,
+it is selected automatically when ``cryptography`` is installed.
+
+Keys sign and verify SHA-1 digests, messages are hashed by ``utils.msg_digest``.
+"""
+
+
+class RSABackend(object):
+    """
+    RSA implementation, ``load_key`` returns key object with methods
+    ``sign(digest) -> bytes``, ``verify(digest, signature) -> bool`` and attributes
+    ``key`` (native key object), ``pem`` and ``public_pem``.
+    """
+    name = None
+
+    def load_key(self, source):
+        """
+        :param source: PEM content as bytes or native key object
+        """
+        raise NotImplementedError
+
+
+class SHA1Digest(object):
+    "Precomputed SHA-1 digest in place of pycryptodome hash object (PKCS#1 v1.5 uses oid and digest only)"
+    __slots__ = ('_digest',)
+    oid = '1.3.14.3.2.26'
+    digest_size = 20
+
+    def __init__(self, digest):
+        self._digest = digest
+
+    def digest(self):
+        return self._digest
+
+
+class PycryptodomeKey(object):
+    __slots__ = ('key', '_pkcs')
+
+    def __init__(self, key, pkcs):
+        self.key = key
+        self._pkcs = pkcs
+
+    @property
+    def pem(self):
+        return self.key.export_key()
+
+    @property
+    def public_pem(self):
+        return self.key.publickey().export_key()
+
+    def sign(self, digest):
+        return self._pkcs.sign(SHA1Digest(digest))
+
+    def verify(self, digest, signature):
+        return self._pkcs.verify(SHA1Digest(digest), signature)
+
+
+class PycryptodomeBackend(RSABackend):
+    name = 'pycryptodome'
+
+    def __init__(self):
+        from Crypto.PublicKey import RSA
+        from Crypto.Signature import PKCS1_v1_5
+        self._rsa = RSA
+        self._pkcs = PKCS1_v1_5
+
+    def load_key(self, source):
+        key = source if isinstance(source, self._rsa.RsaKey) else self._rsa.importKey(source)
+        return PycryptodomeKey(key, self._pkcs.new(key))
+
+
+class OpenSSLKey(object):
+    __slots__ = ('key', '_public', '_backend')
+
+    def __init__(self, key, backend):
+        self.key = key
+        self._public = key.public_key() if hasattr(key, 'private_bytes') else key
+        self._backend = backend
+
+    @property
+    def public_pem(self):
+        serialization = self._backend.serialization
+        return self._public.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    @property
+    def pem(self):
+        serialization = self._backend.serialization
+        if self._public is self.key:
+            return self.public_pem
+        return self.key.private_bytes(serialization.Encoding.PEM,
+                                      serialization.PrivateFormat.TraditionalOpenSSL,
+                                      serialization.NoEncryption())
+
+    def sign(self, digest):
+        return self.key.sign(digest, self._backend.padding, self._backend.prehashed)
+
+    def verify(self, digest, signature):
+        try:
+            self._public.verify(signature, digest, self._backend.padding, self._backend.prehashed)
+        except self._backend.InvalidSignature:
+            return False
+        return True
+
+
+class OpenSSLBackend(RSABackend):
+    name = 'openssl'
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
+        self.InvalidSignature = InvalidSignature
+        self.serialization = serialization
+        self.padding = padding.PKCS1v15()
+        self.prehashed = utils.Prehashed(hashes.SHA1())
+        self._key_types = (rsa.RSAPrivateKey, rsa.RSAPublicKey)
+
+    def load_key(self, source):
+        if isinstance(source, self._key_types):
+            return OpenSSLKey(source, self)
+        if hasattr(source, 'export_key'):
+            # pycryptodome RsaKey
+            source = source.export_key()
+        if isinstance(source, str):
+            source = source.encode('ascii')
+        if b'PRIVATE KEY-----' in source:
+            key = self.serialization.load_pem_private_key(source, password=None)
+        else:
+            key = self.serialization.load_pem_public_key(source)
+        return OpenSSLKey(key, self)
+
+
+BACKENDS = (OpenSSLBackend, PycryptodomeBackend)
+_default = None
+
+
+def get_backend(name=None):
+    """
+    Return RSA backend by name ('openssl' or 'pycryptodome'), best available one by default
+    """
+    global _default
+    if name is not None:
+        for cls in BACKENDS:
+            if cls.name == name:
+                return cls()
+        raise ValueError('Unknown RSA backend %r' % name)
+    if _default is None:
+        for cls in BACKENDS:
+            try:
+                _default = cls()
+            except ImportError:
+                continue
+            break
+    return _default
@@ -0,0 +1,93 @@
+# coding: utf-8
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+BatchResult = namedtuple('BatchResult', ('pay_id', 'response', 'error'))
+BatchResult.__doc__ = """
+Result of one item of batch call, ``error`` is exception raised by the call or None
+"""
+
+TOO_MANY_REQUESTS = 429
+
+
+def status_code(exc):
+    "HTTP status code of the exception raised by HTTP library or None"
+    return getattr(getattr(exc, 'response', None), 'status_code', None)
+
+
+def retry_after(exc, default):
+    "Seconds from ``Retry-After`` header of the failed response or default"
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return default
+
+
+class Throttle(object):
+    """
+    Pause shared by all workers of a batch, the gateway answered 429 Too Many Requests
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def delay(self):
+        "Seconds to wait before next request"
+        with self._lock:
+            return max(0.0, self._resume_at - time.monotonic())
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+def call_throttled(func, item, throttle, max_retries=5, backoff=1.0):
+    """
+    Call ``func(item)`` and retry it when the gateway answers 429
+
+    :return: ``BatchResult``, exceptions are not raised but returned in ``error``
+    """
+    attempt = 0
+    while True:
+        delay = throttle.delay()
+        if delay:
+            time.sleep(delay)
+        try:
+            return BatchResult(item, func(item), None)
+        except Exception as e:
+            if status_code(e) != TOO_MANY_REQUESTS or attempt >= max_retries:
+                return BatchResult(item, None, e)
+            throttle.pause(retry_after(e, backoff * 2 ** attempt))
+            attempt += 1
+
+
+def run_batch(func, items, concurrency=10, max_retries=5, backoff=1.0):
+    """
+    Call ``func`` for each item in thread pool and yield ``BatchResult`` as they complete
+
+    Items are consumed lazily, at most ``2 * concurrency`` of them are pending at once.
+
+    :param func: function of one argument
+    :param items: iterable of arguments
+    :param concurrency: number of worker threads
+    :param max_retries: max number of retries after 429 response
+    :param backoff: base of exponential delay after 429 without ``Retry-After`` header
+    """
+    throttle = Throttle()
+    window = 2 * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(call_throttled, func, item, throttle, max_retries, backoff))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,286 @@
+# coding: utf-8
+"""
+Bulk close, refund and reverse of payments
+
+``BulkExecutor`` runs operations concurrently and records their outcome in a journal.
+When the run is interrupted, run it again with the same journal and items, operations
+which went through are skipped::
+
+    journal = SQLiteJournal('close-2020-10-01.sqlite')
+    executor = BulkExecutor(client, journal, concurrency=10, rate=50, progress=print)
+    summary = executor.execute(('close', pay_id, None) for pay_id in pay_ids)
+
+Failures which do not tell whether the operation went through (timeout, connection error,
+5xx, invalid response signature or "payment not in valid state") are verified by ``payment_status``.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from . import batch, conf, utils
+from .ratelimit import TokenBucket
+from .retry import CsobCircuitOpenError
+from .states import CsobStateError
+
+log = logging.getLogger('pycsob')
+
+BulkItem = namedtuple('BulkItem', ('operation', 'pay_id', 'amount'))
+
+BulkResult = namedtuple('BulkResult', ('operation', 'pay_id', 'amount', 'outcome', 'result_code',
+                                       'payment_status', 'error'))
+BulkResult.__doc__ = """
+Outcome of one operation, one of ``OK`` (gateway confirmed it), ``VERIFIED`` (call failed
+but ``payment_status`` shows it went through), ``FAILED`` or ``UNKNOWN`` (status could not be checked)
+"""
+
+OK = 'ok'
+VERIFIED = 'verified'
+FAILED = 'failed'
+UNKNOWN = 'unknown'
+DONE = frozenset((OK, VERIFIED))
+
+# payment statuses reached by operations
+TARGET_STATUSES = {
+    'close': frozenset((conf.PAYMENT_STATUS_WAITING, conf.PAYMENT_STATUS_RECOGNIZED)),
+    'reverse': frozenset((conf.PAYMENT_STATUS_REVERSED,)),
+    'refund': frozenset((conf.PAYMENT_STATUS_RETURN_WAITING, conf.PAYMENT_STATUS_RETURNED)),
+}
+
+
+class BulkProgress(namedtuple('BulkProgress', ('completed', 'succeeded', 'failed', 'skipped', 'elapsed'))):
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        "Completed operations per second"
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return '%d done (%d ok, %d failed, %d skipped) in %.1fs, %.1f/s' % (
+            self.completed, self.succeeded, self.failed, self.skipped, self.elapsed, self.throughput)
+
+
+def item_key(item):
+    "Journal key of the item"
+    return '%s:%s:%s' % (item.operation, item.pay_id, '' if item.amount is None else item.amount)
+
+
+class Journal(object):
+    """
+    Record of finished operations, subclasses implement ``load`` and ``record``
+    """
+
+    def load(self):
+        "Return dict of item key -> outcome of the last attempt"
+        raise NotImplementedError
+
+    def record(self, key, result):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryJournal(Journal):
+
+    def __init__(self):
+        self.outcomes = {}
+
+    def load(self):
+        return dict(self.outcomes)
+
+    def record(self, key, result):
+        self.outcomes[key] = result.outcome
+
+
+class FileJournal(Journal):
+    """
+    Journal in file, one JSON object per line, each line is flushed
+    """
+
+    def __init__(self, path, fsync=False):
+        """
+        :param fsync: sync the file to disk after each line
+        """
+        self.path = path
+        self.fsync = fsync
+        self._fp = None
+
+    def load(self):
+        outcomes = {}
+        if os.path.exists(self.path):
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:  # line cut by crash
+                        continue
+                    outcomes[data['key']] = data['outcome']
+        return outcomes
+
+    def record(self, key, result):
+        if self._fp is None:
+            self._fp = open(self.path, 'a')
+        self._fp.write(json.dumps({
+            'key': key,
+            'outcome': result.outcome,
+            'resultCode': result.result_code,
+            'paymentStatus': result.payment_status,
+            'error': None if result.error is None else repr(result.error),
+            'dttm': utils.dttm(),
+        }) + '\n')
+        self._fp.flush()
+        if self.fsync:
+            os.fsync(self._fp.fileno())
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class SQLiteJournal(Journal):
+    "Journal in SQLite database, each record is committed"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS pycsob_bulk (key TEXT PRIMARY KEY, outcome TEXT, '
+                         'result_code INTEGER, payment_status INTEGER, error TEXT, dttm TEXT)')
+        self._db.commit()
+
+    def load(self):
+        with self._lock:
+            return dict(self._db.execute('SELECT key, outcome FROM pycsob_bulk'))
+
+    def record(self, key, result):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO pycsob_bulk VALUES (?, ?, ?, ?, ?, ?)', (
+                key, result.outcome, result.result_code, result.payment_status,
+                None if result.error is None else repr(result.error), utils.dttm()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class BulkExecutor(object):
+
+    def __init__(self, client, journal=None, concurrency=10, rate=None, progress=None, progress_interval=1.0,
+                 max_retries=5):
+        """
+        :param client: ``CsobClient``
+        :param journal: ``Journal`` of finished operations, ``MemoryJournal`` by default
+        :param concurrency: number of concurrent calls
+        :param rate: max number of operations per second
+        :param progress: function called with ``BulkProgress`` every ``progress_interval`` seconds
+                         and when the run ends
+        :param max_retries: max number of retries of one call after 429
+        """
+        self.client = client
+        self.journal = journal if journal is not None else MemoryJournal()
+        self.concurrency = concurrency
+        self.rate_limit = TokenBucket(rate, burst=1) if rate else None
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.summary = None
+
+    def _call(self, item):
+        if item.operation == 'close':
+            return self.client.payment_close(item.pay_id, total_amount=item.amount)
+        if item.operation == 'refund':
+            return self.client.payment_refund(item.pay_id, amount=item.amount)
+        return self.client.payment_reverse(item.pay_id)
+
+    def _verify(self, item, result_code, error):
+        "Check status of the payment after ambiguous failure"
+        try:
+            status = self.client.payment_status(item.pay_id, use_cache=False).payment_status
+        except Exception as e:
+            log.warning('Status of payment %s after failed %s is unknown: %s', item.pay_id, item.operation, e)
+            return BulkResult(item.operation, item.pay_id, item.amount, UNKNOWN, result_code, None, error)
+        outcome = VERIFIED if status in TARGET_STATUSES[item.operation] else FAILED
+        return BulkResult(item.operation, item.pay_id, item.amount, outcome, result_code, status, error)
+
+    def _run_one(self, item):
+        if item.operation not in TARGET_STATUSES:
+            return BulkResult(item.operation, item.pay_id, item.amount, FAILED, None, None,
+                              ValueError('Unknown operation %r' % item.operation))
+        if self.rate_limit is not None:
+            self.rate_limit.acquire()
+        try:
+            response = self._call(item)
+        except Exception as e:
+            code = batch.status_code(e)
+            if code == batch.TOO_MANY_REQUESTS:
+                raise  # not processed, retried by the batch
+            if isinstance(e, (CsobCircuitOpenError, CsobStateError)) or (code is not None and code < 500):
+                return BulkResult(item.operation, item.pay_id, item.amount, FAILED, None, None, e)
+            return self._verify(item, None, e)
+
+        result_code = response.result_code
+        if result_code == conf.RETURN_CODE_OK:
+            return BulkResult(item.operation, item.pay_id, item.amount, OK, result_code,
+                              response.payment_status, None)
+        error = utils.CsobVerifyError('%s: %s' % (result_code, response.result_message))
+        if result_code == conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE:
+            # it may have been done by previous interrupted run
+            return self._verify(item, result_code, error)
+        return BulkResult(item.operation, item.pay_id, item.amount, FAILED, result_code,
+                          response.payment_status, error)
+
+    def run(self, items):
+        """
+        Run operations and yield ``BulkResult`` as they complete, operations done
+        according to the journal are skipped
+
+        :param items: iterable of ``(operation, pay_id, amount)``, operation is 'close', 'refund'
+                      or 'reverse', amount is None for full amount; consumed lazily
+        """
+        done = self.journal.load()
+        start = time.monotonic()
+        counts = {'completed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
+        reported = [start]
+
+        def pending():
+            for item in items:
+                item = BulkItem(*item)
+                if done.get(item_key(item)) in DONE:
+                    counts['skipped'] += 1
+                    continue
+                yield item
+
+        def report(force=False):
+            now = time.monotonic()
+            self.summary = BulkProgress(elapsed=now - start, **counts)
+            if self.progress is not None and (force or now - reported[0] >= self.progress_interval):
+                reported[0] = now
+                self.progress(self.summary)
+
+        for item, result, error in batch.run_batch(self._run_one, pending(), concurrency=self.concurrency,
+                                                   max_retries=self.max_retries):
+            if error is not None:
+                result = BulkResult(item.operation, item.pay_id, item.amount, FAILED, None, None, error)
+            self.journal.record(item_key(item), result)
+            counts['completed'] += 1
+            counts['succeeded' if result.outcome in DONE else 'failed'] += 1
+            report()
+            yield result
+        report(force=True)
+
+    def execute(self, items):
+        """
+        Run all operations, see ``run``
+
+        :return: ``BulkProgress`` of the run
+        """
+        for _ in self.run(items):
+            pass
+        return self.summary
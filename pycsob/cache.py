@@ -0,0 +1,187 @@
+# coding: utf-8
+"""
+Cache of verified gateway results
+
+Pass cache to the client to skip repeated work for the same payment::
+
+    c = CsobClient(..., cache=MemoryCache(maxsize=10000, ttl=60))
+
+* ``payment_status`` results with final status (cancelled, reversed, rejected, returned)
+  are cached without expiration, other statuses for ``ttl`` seconds. Cached status is dropped
+  when the client receives other response of the payment (close, reverse...) or its return.
+* Verified return data are keyed by payId and signature, repeated returns (double submit
+  of the form) are not verified again and ``ReturnVerifier`` can reject them as replays.
+
+``RedisCache`` shares the cache by worker processes, values are pickled
+so the Redis database must be trusted.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+from . import conf
+
+
+class Cache(object):
+    """
+    Base class of cache backends, subclasses implement ``get``, ``set``, ``add`` and ``delete``
+    """
+
+    def __init__(self, ttl=60):
+        """
+        :param ttl: seconds to keep results which can change, final results are kept without expiration
+        """
+        self.ttl = ttl
+
+    def get(self, key):
+        "Return cached value or None"
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: seconds to keep the value, None to keep it without expiration
+        """
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        "Set the value only if the key is not cached, return True if it was set"
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def status_ttl(self, payment_status):
+        "None for final payment status, ``ttl`` otherwise"
+        if payment_status in conf.PAYMENT_STATUSES_FINAL:
+            return None
+        return self.ttl
+
+    def result_ttl(self, payload):
+        return self.status_ttl(payload.get('paymentStatus'))
+
+    def get_status(self, pay_id):
+        "``PaymentResult`` of cached ``payment_status`` call or None"
+        return self.get('status:%s' % pay_id)
+
+    def set_status(self, pay_id, result):
+        if result.result_code == conf.RETURN_CODE_OK:
+            self.set('status:%s' % pay_id, result, self.status_ttl(result.payment_status))
+
+    def delete_status(self, pay_id):
+        "Drop cached status, the payment has changed"
+        self.delete('status:%s' % pay_id)
+
+    def _return_key(self, pay_id, signature):
+        return 'return:%s:%s' % (pay_id, sha1(signature.encode('ascii')).hexdigest())
+
+    def get_return(self, pay_id, signature):
+        "Verified return data or None"
+        return self.get(self._return_key(pay_id, signature))
+
+    def add_return(self, pay_id, signature, data):
+        "Cache verified return data, return False if they were cached already (replay)"
+        return self.add(self._return_key(pay_id, signature), data, self.result_ttl(data))
+
+
+class MemoryCache(Cache):
+    """
+    Thread safe in-process LRU cache, its pickled copy (e.g. in ``ReturnVerifier`` sent
+    to worker process) starts empty
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        """
+        :param maxsize: max number of cached values, least recently used ones are evicted
+        """
+        super(MemoryCache, self).__init__(ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_data'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl, now):
+        self._data[key] = value, None if ttl is None else now + ttl
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl, time.monotonic())
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            now = time.monotonic()
+            if self._get(key, now) is not None:
+                return False
+            self._set(key, value, ttl, now)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache(Cache):
+    """
+    Cache in Redis, ``client`` is ``redis.Redis`` or other object with compatible
+    ``get(name)``, ``set(name, value, px=None, nx=False)`` and ``delete(name)`` methods
+    """
+
+    def __init__(self, client, prefix='pycsob:', ttl=60):
+        """
+        :param prefix: prefix of Redis keys
+        """
+        super(RedisCache, self).__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        px=None if ttl is None else int(ttl * 1000))
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                                    px=None if ttl is None else int(ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
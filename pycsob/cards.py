@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+Card provider detection by BIN (first 6 digits of card number)
+
+BIN ranges of providers (``conf.CARD_PROVIDER_RANGES``) are merged into one sorted table
+of non-overlapping ranges, provider of a BIN is found by binary search in it. The table
+is replaced as a whole when a provider is registered, lookups running meanwhile use the old one.
+"""
+import threading
+from bisect import bisect_right
+
+from . import conf
+
+BIN_LENGTH = 6
+
+# (starts, providers) of build_table, read once per lookup
+_table = ([0], [None])
+_lock = threading.RLock()
+
+
+def _expand(first, last):
+    "BIN prefix range to range of 6 digit numbers"
+    return int(first.ljust(BIN_LENGTH, '0')), int(last.ljust(BIN_LENGTH, '9'))
+
+
+def build_table(ranges):
+    """
+    Build lookup table from ordered dict of provider -> ranges, later providers
+    take precedence on overlapping ranges
+
+    :return: ``(starts, providers)``, provider of BIN is ``providers[bisect_right(starts, bin) - 1]``
+    """
+    expanded = [(_expand(first, last), provider)
+                for provider, provider_ranges in ranges.items() for first, last in provider_ranges]
+    bounds = sorted({0, 10 ** BIN_LENGTH} | {b for (start, end), _ in expanded for b in (start, end + 1)})
+    starts, providers = [], []
+    for start in bounds[:-1]:
+        provider = None
+        for (first, last), one in expanded:
+            if first <= start <= last:
+                provider = one
+        if providers and providers[-1] == provider:
+            continue
+        starts.append(start)
+        providers.append(provider)
+    return starts, providers
+
+
+def rebuild():
+    "Rebuild lookup table from ``conf.CARD_PROVIDER_RANGES``"
+    global _table
+    with _lock:
+        _table = build_table(conf.CARD_PROVIDER_RANGES)
+
+
+def register_card_provider(provider_id, name, ranges):
+    """
+    Add provider or replace ranges of existing one, its ranges take precedence
+    over ranges of providers registered before
+
+    :param ranges: list of BIN prefix ranges ``(first, last)``, e.g. ``[('2221', '2720')]``
+    """
+    with _lock:
+        conf.CARD_PROVIDERS[provider_id] = name
+        conf.CARD_PROVIDER_RANGES.pop(provider_id, None)
+        conf.CARD_PROVIDER_RANGES[provider_id] = tuple(ranges)
+        rebuild()
+
+
+def _lookup(bin_, starts, providers, names):
+    if len(bin_) != BIN_LENGTH or not bin_.isdigit():
+        return None, None
+    provider = providers[bisect_right(starts, int(bin_)) - 1]
+    if provider is None:
+        return None, None
+    return provider, names[provider]
+
+
+def get_card_provider(long_masked_number):
+    """
+    :param long_masked_number: masked card number, e.g. '423451****1234'
+    :return: ``(provider_id, name)`` or ``(None, None)``
+    """
+    starts, providers = _table
+    return _lookup(long_masked_number[:BIN_LENGTH], starts, providers, conf.CARD_PROVIDERS)
+
+
+def get_card_providers(long_masked_numbers):
+    """
+    Card providers of many masked card numbers, e.g. column of an export
+
+    :param long_masked_numbers: iterable of masked card numbers
+    :return: list of ``(provider_id, name)``
+    """
+    (starts, providers), names = _table, conf.CARD_PROVIDERS
+    found = {}
+    result = []
+    for number in long_masked_numbers:
+        bin_ = number[:BIN_LENGTH]
+        one = found.get(bin_)
+        if one is None:
+            one = found[bin_] = _lookup(bin_, starts, providers, names)
+        result.append(one)
+    return result
+
+
+rebuild()
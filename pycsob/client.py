@@ -1,48 +1,234 @@
 # coding: utf-8
-from base64 import b64encode, b64decode
-import json
+from base64 import b64encode
+import functools
 import logging
-import requests
-import requests.adapters
-from collections import OrderedDict
-
-from . import conf, utils
+import sys
+import threading
+import time
+import types
+import warnings
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from . import batch, conf, metrics, utils
+from .keys import load_key
+from .returns import ReturnVerifier
+from .serializers import get_serializer
 
 log = logging.getLogger('pycsob')
 
 
-class HTTPAdapter(requests.adapters.HTTPAdapter):
+class PoolStats(namedtuple('PoolStats', ('requests', 'connections', 'idle', 'in_use', 'peak_in_use'))):
     """
-    HTTP adapter with default timeout
+    Connection pool statistics
+
+    ``requests`` sent, ``connections`` opened so far, ``idle`` connections kept in the pool,
+    requests (connections) ``in_use`` now and the peak of ``in_use``.
     """
+    __slots__ = ()
+
+    @property
+    def reuse_rate(self):
+        "Share of requests sent over reused keep-alive connection"
+        if not self.requests:
+            return 0.0
+        return max(0.0, 1.0 - float(self.connections) / self.requests)
+
+
+class _TransportErrors(object):
+    "Exceptions of requests, resolved on first access so requests is not imported with this module"
 
-    def send(self, request, **kwargs):
-        kwargs.setdefault('timeout', conf.HTTP_TIMEOUT)
-        return super(HTTPAdapter, self).send(request, **kwargs)
+    def __get__(self, obj, owner):
+        import requests
+        return requests.ConnectionError, requests.Timeout
 
 
 class CsobClient(object):
+    """
+    Client of the payment gateway
+
+    The client is thread safe, threads of one process should share it to share
+    its connection pool, parsed keys, cache and circuit breaker.
+    """
+    # exceptions of HTTP library meaning that the gateway is unreachable
+    transport_errors = _TransportErrors()
 
-    def __init__(self, merchant_id, base_url, private_key_file, csob_pub_key_file):
+    def __init__(self, merchant_id, base_url, private_key_file, csob_pub_key_file, crypto_backend=None,
+                 rsa_backend=None, retry=None, circuit_breaker=None, metrics_sink=None, cache=None,
+                 pool_connections=10, pool_maxsize=10, pool_block=False, rate_limiter=None, serializer=None,
+                 state_tracker=None, lazy_extensions=False):
         """
         Initialize Client
 
+        Keys are parsed once and kept in memory. Keys loaded from files are reloaded
+        when the file modification time changes.
+
         :param merchant_id: Your Merchant ID (you can find it in POSMerchant)
         :param base_url: Base API url development / production
-        :param private_key_file: Path to generated private key file
-        :param csob_pub_key_file: Path to CSOB public key
+        :param private_key_file: Path to generated private key file, PEM bytes or ``RsaKey``
+        :param csob_pub_key_file: Path to CSOB public key, PEM bytes or ``RsaKey``
+        :param crypto_backend: ``pycsob.crypto.CryptoBackend`` executing signing and verification,
+                               e.g. ``ProcessPoolBackend``; calling thread is used by default
+        :param rsa_backend: RSA implementation, 'openssl' or 'pycryptodome', best available by default
+        :param retry: ``pycsob.retry.RetryPolicy`` for idempotent calls (``payment_status``, ``echo``,
+                      ``customer_info``), calls are not retried by default
+        :param circuit_breaker: ``pycsob.retry.CircuitBreaker`` shared by all calls of the client
+        :param metrics_sink: ``pycsob.metrics.MetricsSink`` receiving timings of each call
+        :param cache: ``pycsob.cache.Cache`` of ``payment_status`` results and verified gateway returns
+        :param pool_connections: number of connection pools (hosts) kept
+        :param pool_maxsize: max number of keep-alive connections kept in the pool, it should be
+                             the number of threads sharing the client
+        :param pool_block: wait for free connection when ``pool_maxsize`` connections are in use,
+                           otherwise extra connection is opened and closed after the request
+        :param rate_limiter: ``pycsob.ratelimit.RateLimiter``, calls wait for its tokens
+        :param serializer: JSON implementation, 'orjson', 'ujson', 'json' or ``pycsob.serializers.Serializer``,
+                           best available by default
+        :param state_tracker: ``pycsob.states.PaymentStateTracker`` recording statuses of payments,
+                              close, reverse and refund which cannot succeed raise ``CsobStateError``
+        :param lazy_extensions: verify signatures of response extensions (masked card etc.) on first
+                                access of ``extensions`` of the result, calls which do not read them
+                                verify the response only
         """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
         self.merchant_id = merchant_id
         self.base_url = base_url
         self.f_key = private_key_file
         self.f_pubkey = csob_pub_key_file
+        self.key = load_key(private_key_file, crypto_backend, rsa_backend)
+        self.pubkey = load_key(csob_pub_key_file, crypto_backend, rsa_backend)
+        self.cache = cache
+        self.return_verifier = ReturnVerifier(self.pubkey, cache=cache)
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.metrics_sink = metrics_sink
+        self.rate_limiter = rate_limiter
+        if serializer is None or isinstance(serializer, str):
+            serializer = get_serializer(serializer)
+        self.serializer = serializer
+        self.state_tracker = state_tracker
+        self.lazy_extensions = lazy_extensions
+
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def _client(self):
+        "HTTP session, it is created on first call so the HTTP library is imported only when used"
+        session = self._session
+        if session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+                session = self._session
+        return session
+
+    @_client.setter
+    def _client(self, session):
+        self._session = session
+
+    def _create_session(self):
+        from .transport import create_session
+        return create_session(self.pool_connections, self.pool_maxsize, self.pool_block)
+
+    def pool_stats(self):
+        """
+        Statistics of the connection pool, use them to set ``pool_maxsize``
+
+        :return: ``PoolStats``
+        """
+        if self._session is None:
+            return PoolStats(0, 0, 0, 0, 0)
+        return self._session.get_adapter(self.base_url).pool_stats()
 
-        session = requests.Session()
-        session.headers = conf.HEADERS
-        session.mount('https://', HTTPAdapter())
-        session.mount('http://', HTTPAdapter())
+    def close(self):
+        "Close all pooled connections"
+        if self._session is not None:
+            self._session.close()
 
-        self._client = session
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, method, endpoint_url, payload, in_url=False, idempotent=False):
+        """
+        Send signed payload to the gateway and validate the response
+
+        :param method: HTTP method
+        :param endpoint_url: endpoint url relative to ``base_url``
+        :param payload: signed payload or function returning it, the function is called
+                        in the measured operation and again for each retry so the payload has fresh ``dttm``
+        :param in_url: send payload as part of the url instead of JSON body
+        :param idempotent: call can be retried according to retry policy
+        """
+        if self.metrics_sink is None:
+            return self._call_with_retry(method, endpoint_url, payload, in_url, idempotent)
+        with metrics.operation(self.metrics_sink, method, endpoint_url):
+            return self._call_with_retry(method, endpoint_url, payload, in_url, idempotent)
+
+    def _call_with_retry(self, method, endpoint_url, payload, in_url, idempotent):
+        op = metrics.current()
+        bucket = None if self.rate_limiter is None else self.rate_limiter.bucket(endpoint_url)
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                if bucket is not None:
+                    metrics.timed('throttle', bucket.acquire)
+                if callable(payload):
+                    signed = metrics.timed('build', payload)
+                else:
+                    signed = payload
+                r = metrics.timed('http', self._send, method, endpoint_url, signed, in_url)
+                if op is not None:
+                    op.status_code = r.status_code
+                if bucket is not None:
+                    self.rate_limiter.record(bucket, r)
+                r.raise_for_status()
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(e, self.transport_errors)
+                attempt += 1
+                if not (idempotent and self.retry is not None
+                        and self.retry.should_retry(e, attempt, self.transport_errors)):
+                    raise
+                delay = self.retry.delay(e, attempt)
+                log.info('Retrying %s %s in %.2fs (attempt %d): %s', method, endpoint_url, delay, attempt, e)
+                if op is not None:
+                    op.retries = attempt
+                time.sleep(delay)
+                continue
+            except BaseException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_abort()
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            response = utils.validate_response(r, self.pubkey, self.serializer, self.lazy_extensions)
+            if op is not None:
+                op.result_code = response.result_code
+            self._record(endpoint_url, response)
+            return response
+
+    def _record(self, endpoint_url, response):
+        "Record status of the payment from validated response"
+        if self.state_tracker is not None:
+            self.state_tracker.update(response.pay_id, response.payment_status)
+        if self.cache is not None and response.pay_id is not None and endpoint_url != 'payment/status/':
+            # the call may have changed the payment, next payment_status asks the gateway
+            self.cache.delete_status(response.pay_id)
+
+    def _send(self, method, endpoint_url, payload, in_url):
+        if in_url:
+            url = utils.mk_url(base_url=self.base_url, endpoint_url=endpoint_url, payload=payload)
+            return self._client.request(method, url)
+        url = utils.mk_url(base_url=self.base_url, endpoint_url=endpoint_url)
+        return self._client.request(method, url, data=self.serializer.dumps(payload))
 
     def payment_init(self, order_no, total_amount, return_url, description, cart=None,
                      customer_id=None, currency='CZK', language='CZ', close_payment=True,
@@ -82,7 +268,7 @@ class CsobClient(object):
         :param logo_version: Logo version number
         :param color_scheme_version: Color scheme version number
         :param merchant_data: bytearray of merchant data
-        :return: response from gateway as OrderedDict
+        :return: ``PaymentResult``
         """
 
         if len(description) > 255:
@@ -107,29 +293,28 @@ class CsobClient(object):
         lang_code = language.upper()[:2]
         language = {'CS': 'CZ'}.get(lang_code, lang_code)
 
-        payload = utils.mk_payload(self.f_key, pairs=(
-            ('merchantId', self.merchant_id),
-            ('orderNo', str(order_no)),
-            ('dttm', utils.dttm()),
-            ('payOperation', pay_operation),
-            ('payMethod', 'card'),
-            ('totalAmount', total_amount),
-            ('currency', currency),
-            ('closePayment', close_payment),
-            ('returnUrl', return_url),
-            ('returnMethod', return_method),
-            ('cart', cart),
-            ('description', description),
-            ('merchantData', merchant_data),
-            ('customerId', customer_id),
-            ('language', language),
-            ('ttlSec', ttl_sec),
-            ('logoVersion', logo_version),
-            ('colorSchemeVersion', color_scheme_version),
-        ))
-        url = utils.mk_url(base_url=self.base_url, endpoint_url='payment/init')
-        r = self._client.post(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
+                ('merchantId', self.merchant_id),
+                ('orderNo', str(order_no)),
+                ('dttm', utils.dttm()),
+                ('payOperation', pay_operation),
+                ('payMethod', 'card'),
+                ('totalAmount', total_amount),
+                ('currency', currency),
+                ('closePayment', close_payment),
+                ('returnUrl', return_url),
+                ('returnMethod', return_method),
+                ('cart', cart),
+                ('description', description),
+                ('merchantData', merchant_data),
+                ('customerId', customer_id),
+                ('language', language),
+                ('ttlSec', ttl_sec),
+                ('logoVersion', logo_version),
+                ('colorSchemeVersion', color_scheme_version),
+            ))
+        return self._call('POST', 'payment/init', payload)
 
     def get_payment_process_url(self, pay_id):
         """
@@ -142,6 +327,47 @@ class CsobClient(object):
             payload=self.req_payload(pay_id=pay_id)
         )
 
+    def get_payment_process_urls(self, pay_ids, chunk_size=256, workers=1):
+        """
+        Get urls to process many payments, e.g. for payment links sent by email or SMS.
+
+        Payloads are signed by chunks with ``sign_many`` of the key, its ``crypto_backend``
+        (e.g. ``ProcessPoolBackend``) can spread them over worker processes. Chunks are signed
+        by ``workers`` threads concurrently, OpenSSL backend releases the GIL while signing.
+        Urls are yielded in order of ``pay_ids``, the same as ``get_payment_process_url`` returns.
+
+        :param pay_ids: iterable of pay_ids, consumed lazily
+        :param chunk_size: number of payloads signed at once, all urls of a chunk have the same ``dttm``
+        :param workers: number of threads signing chunks
+        :return: iterator of ``(pay_id, url)``
+        """
+        pay_ids = iter(pay_ids)
+        chunks = iter(lambda: list(islice(pay_ids, chunk_size)), [])
+        if workers <= 1:
+            for chunk in chunks:
+                for one in self._process_urls(chunk):
+                    yield one
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(self._process_urls, chunk))
+                if len(pending) >= 2 * workers:
+                    for one in pending.popleft().result():
+                        yield one
+            while pending:
+                for one in pending.popleft().result():
+                    yield one
+
+    def _process_urls(self, pay_ids):
+        "Sign payloads of ``req_payload(pay_id)`` at once and build their urls"
+        dttm = utils.dttm()
+        payloads = utils.mk_payloads(self.key, [(('merchantId', self.merchant_id), ('payId', pay_id), ('dttm', dttm))
+                                                for pay_id in pay_ids])
+        return [(pay_id, utils.mk_url(self.base_url, 'payment/process/', payload))
+                for pay_id, payload in zip(pay_ids, payloads)]
+
     def gateway_return(self, datadict):
         """
         Return from gateway as OrderedDict
@@ -149,71 +375,72 @@ class CsobClient(object):
         :param datadict: data from request in dict
         :return: verified data or raise error
         """
-        o = OrderedDict()
-        for k in conf.RESPONSE_KEYS:
-            if k in datadict:
-                o[k] = int(datadict[k]) if k in ('resultCode', 'paymentStatus') else datadict[k]
-        if not utils.verify(o, datadict['signature'], self.f_pubkey):
-            raise utils.CsobVerifyError('Unverified gateway return data')
-        if "dttm" in o:
-            o["dttime"] = utils.dttm_decode(o["dttm"])
-        if 'merchantData' in o:
-            o['merchantData'] = b64decode(o['merchantData'])
-        return o
-
-    def payment_status(self, pay_id):
-        url = utils.mk_url(
-            base_url=self.base_url,
-            endpoint_url='payment/status/',
-            payload=self.req_payload(pay_id=pay_id)
-        )
-        r = self._client.get(url=url)
-        return utils.validate_response(r, self.f_pubkey)
+        data = self.return_verifier.verify(datadict)
+        if self.state_tracker is not None:
+            self.state_tracker.update(data.get('payId'), data.get('paymentStatus'))
+        if self.cache is not None and data.get('payId') is not None:
+            self.cache.delete_status(data['payId'])
+        return data
+
+    def payment_status(self, pay_id, use_cache=True):
+        """
+        :param use_cache: return cached result if there is one, the result is cached anyway
+        """
+        if self.cache is not None and use_cache:
+            cached = self.cache.get_status(pay_id)
+            if cached is not None:
+                return cached
+        response = self._call('GET', 'payment/status/', lambda: self.req_payload(pay_id=pay_id), in_url=True,
+                              idempotent=True)
+        if self.cache is not None:
+            self.cache.set_status(pay_id, response)
+        return response
+
+    def payment_status_many(self, pay_ids, concurrency=10, max_retries=5, use_cache=True):
+        """
+        Get statuses of many payments, calls are made in ``concurrency`` threads.
+
+        Results are yielded as they complete, errors are reported per item and do not stop
+        the batch. When the gateway answers 429 Too Many Requests, all workers pause
+        (``Retry-After`` is honored) and the call is retried.
+
+        :param pay_ids: iterable of pay_ids, consumed lazily
+        :param concurrency: number of concurrent calls
+        :param max_retries: max number of retries of one call after 429
+        :param use_cache: return cached statuses, see ``payment_status``
+        :return: iterator of ``BatchResult(pay_id, response, error)``
+        """
+        func = self.payment_status if use_cache else functools.partial(self.payment_status, use_cache=False)
+        return batch.run_batch(func, pay_ids, concurrency=concurrency, max_retries=max_retries)
+
+    def _check_state(self, operation, pay_id):
+        if self.state_tracker is not None:
+            self.state_tracker.check(operation, pay_id)
 
     def payment_reverse(self, pay_id):
-        url = utils.mk_url(
-            base_url=self.base_url,
-            endpoint_url='payment/reverse/'
-        )
-        payload = self.req_payload(pay_id)
-        r = self._client.put(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        self._check_state('reverse', pay_id)
+        return self._call('PUT', 'payment/reverse/', lambda: self.req_payload(pay_id))
 
     def payment_close(self, pay_id, total_amount=None):
-        url = utils.mk_url(
-            base_url=self.base_url,
-            endpoint_url='payment/close/'
-        )
-        payload = self.req_payload(pay_id, totalAmount=total_amount)
-        r = self._client.put(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        self._check_state('close', pay_id)
+        return self._call('PUT', 'payment/close/', lambda: self.req_payload(pay_id, totalAmount=total_amount))
 
     def payment_refund(self, pay_id, amount=None):
-        url = utils.mk_url(
-            base_url=self.base_url,
-            endpoint_url='payment/refund/'
-        )
-
-        payload = self.req_payload(pay_id, amount=amount)
-        r = self._client.put(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        self._check_state('refund', pay_id)
+        return self._call('PUT', 'payment/refund/', lambda: self.req_payload(pay_id, amount=amount))
 
     def customer_info(self, customer_id):
         """
         :param customer_id: e-shop customer ID
         :return: data from JSON response or raise error
         """
-        url = utils.mk_url(
-            base_url=self.base_url,
-            endpoint_url='customer/info/',
-            payload=utils.mk_payload(self.f_key, pairs=(
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
                 ('merchantId', self.merchant_id),
                 ('customerId', customer_id),
                 ('dttm', utils.dttm())
             ))
-        )
-        r = self._client.get(url)
-        return utils.validate_response(r, self.f_pubkey)
+        return self._call('GET', 'customer/info/', payload, in_url=True, idempotent=True)
 
     def oneclick_init(self, orig_pay_id, order_no, total_amount, currency='CZK', description=None):
         """
@@ -221,18 +448,17 @@ class CsobClient(object):
         It will create payment template for you. Use pay_id returned from payment_init as orig_pay_id in this method.
         """
 
-        payload = utils.mk_payload(self.f_key, pairs=(
-            ('merchantId', self.merchant_id),
-            ('origPayId', orig_pay_id),
-            ('orderNo', str(order_no)),
-            ('dttm', utils.dttm()),
-            ('totalAmount', total_amount),
-            ('currency', currency),
-            ('description', description),
-        ))
-        url = utils.mk_url(base_url=self.base_url, endpoint_url='payment/oneclick/init')
-        r = self._client.post(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
+                ('merchantId', self.merchant_id),
+                ('origPayId', orig_pay_id),
+                ('orderNo', str(order_no)),
+                ('dttm', utils.dttm()),
+                ('totalAmount', total_amount),
+                ('currency', currency),
+                ('description', description),
+            ))
+        return self._call('POST', 'payment/oneclick/init', payload)
 
     def oneclick_start(self, pay_id):
         """
@@ -241,14 +467,13 @@ class CsobClient(object):
         :param pay_id: use pay_id returned by oneclick_init()
         """
 
-        payload = utils.mk_payload(self.f_key, pairs=(
-            ('merchantId', self.merchant_id),
-            ('payId', pay_id),
-            ('dttm', utils.dttm()),
-        ))
-        url = utils.mk_url(base_url=self.base_url, endpoint_url='payment/oneclick/start')
-        r = self._client.post(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
+                ('merchantId', self.merchant_id),
+                ('payId', pay_id),
+                ('dttm', utils.dttm()),
+            ))
+        return self._call('POST', 'payment/oneclick/start', payload)
 
     def echo(self, method='POST'):
         """
@@ -257,25 +482,14 @@ class CsobClient(object):
         :param method: request method (GET/POST), default is POST
         :return: data from JSON response or raise error
         """
-        payload = utils.mk_payload(self.f_key, pairs=(
-            ('merchantId', self.merchant_id),
-            ('dttm', utils.dttm())
-        ))
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
+                ('merchantId', self.merchant_id),
+                ('dttm', utils.dttm())
+            ))
         if method.lower() == 'post':
-            url = utils.mk_url(
-                base_url=self.base_url,
-                endpoint_url='echo/'
-            )
-            r = self._client.post(url, data=json.dumps(payload))
-        else:
-            url = utils.mk_url(
-                base_url=self.base_url,
-                endpoint_url='echo/',
-                payload=payload
-            )
-            r = self._client.get(url)
-
-        return utils.validate_response(r, self.f_pubkey)
+            return self._call('POST', 'echo/', payload, idempotent=True)
+        return self._call('GET', 'echo/', payload, in_url=True, idempotent=True)
 
     def req_payload(self, pay_id, **kwargs):
         pairs = (
@@ -286,16 +500,33 @@ class CsobClient(object):
         for k, v in kwargs.items():
             if v not in conf.EMPTY_VALUES:
                 pairs += ((k, v),)
-        return utils.mk_payload(keyfile=self.f_key, pairs=pairs)
+        return utils.mk_payload(keyfile=self.key, pairs=pairs)
 
     def button(self, pay_id, brand):
         "Get url to the button."
-        payload = utils.mk_payload(self.f_key, pairs=(
-            ('merchantId', self.merchant_id),
-            ('payId', pay_id),
-            ('brand', brand),
-            ('dttm', utils.dttm()),
-        ))
-        url = utils.mk_url(base_url=self.base_url, endpoint_url='payment/button/')
-        r = self._client.post(url, data=json.dumps(payload))
-        return utils.validate_response(r, self.f_pubkey)
+        def payload():
+            return utils.mk_payload(self.key, pairs=(
+                ('merchantId', self.merchant_id),
+                ('payId', pay_id),
+                ('brand', brand),
+                ('dttm', utils.dttm()),
+            ))
+        return self._call('POST', 'payment/button/', payload)
+
+
+class _ClientModule(types.ModuleType):
+    """
+    This module, ``HTTPAdapter`` moved to ``pycsob.transport`` is imported from there on first access
+    so ``requests`` is not imported with the client
+    """
+
+    def __getattr__(self, name):
+        if name != 'HTTPAdapter':
+            raise AttributeError('module %r has no attribute %r' % (self.__name__, name))
+        warnings.warn('pycsob.client.HTTPAdapter moved to pycsob.transport.HTTPAdapter', DeprecationWarning,
+                      stacklevel=2)
+        from .transport import HTTPAdapter
+        return HTTPAdapter
+
+
+sys.modules[__name__].__class__ = _ClientModule
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from . import __versionstr__
 
 # app conf
@@ -25,6 +27,10 @@ PAYMENT_STATUS_RECOGNIZED = 8
 PAYMENT_STATUS_RETURN_WAITING = 9
 PAYMENT_STATUS_RETURNED = 10
 
+# statuses which do not change anymore
+PAYMENT_STATUSES_FINAL = frozenset((PAYMENT_STATUS_CANCELLED, PAYMENT_STATUS_REVERSED, PAYMENT_STATUS_REJECTED,
+                                    PAYMENT_STATUS_RETURNED))
+
 RETURN_CODE_OK = 0
 RETURN_CODE_PARAM_MISSING = 100
 RETURN_CODE_PARAM_INVALID = 110
@@ -92,3 +98,13 @@ CARD_PROVIDERS = {
     CARD_PROVIDER_AMEX: 'American Express',
     CARD_PROVIDER_JCB: 'JCB'
 }
+
+# BIN prefix ranges (first, last) of card providers, prefixes are expanded to 6 digits,
+# ranges of later providers take precedence
+CARD_PROVIDER_RANGES = OrderedDict([
+    (CARD_PROVIDER_VISA, (('4', '4'),)),
+    (CARD_PROVIDER_MC, (('51', '55'), ('2221', '2720'))),
+    (CARD_PROVIDER_DINERS, (('300', '305'), ('36', '36'), ('38', '38'))),
+    (CARD_PROVIDER_AMEX, (('34', '34'), ('37', '37'))),
+    (CARD_PROVIDER_JCB, (('2131', '2131'), ('1800', '1800'), ('35', '35'))),
+])
@@ -0,0 +1,94 @@
+# coding: utf-8
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from .keys import CsobKey
+
+
+class CryptoBackend(object):
+    """
+    Executes RSA operations of ``CsobKey``, this one in the calling thread
+
+    Subclasses can dispatch the work elsewhere, e.g. to other processes.
+    """
+
+    def sign(self, key, digest):
+        return key.sign_inline(digest)
+
+    def verify(self, key, digest, signature):
+        return key.verify_inline(digest, signature)
+
+    def sign_many(self, key, digests):
+        return [self.sign(key, digest) for digest in digests]
+
+    def verify_many(self, key, items):
+        return [self.verify(key, digest, signature) for digest, signature in items]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# keys parsed in worker process, (PEM, RSA backend name) -> CsobKey
+_worker_keys = {}
+
+
+def _worker_key(pem, rsa_backend):
+    key = _worker_keys.get((pem, rsa_backend))
+    if key is None:
+        key = _worker_keys[pem, rsa_backend] = CsobKey(pem, rsa_backend=rsa_backend)
+    return key
+
+
+def _worker_sign(key_id, digest):
+    return _worker_key(*key_id).sign_inline(digest)
+
+
+def _worker_verify(key_id, digest, signature):
+    return _worker_key(*key_id).verify_inline(digest, signature)
+
+
+def _key_id(key):
+    return key.pem, key.rsa_backend.name
+
+
+class ProcessPoolBackend(CryptoBackend):
+    """
+    Executes RSA operations in pool of worker processes
+
+    Keys are sent to workers as PEM and parsed once per worker, messages are sent
+    as 20 bytes SHA-1 digests. Use it for bulk
+    operations, when signing and verification in one process is the bottleneck;
+    single operation is slower than in-process one due to IPC overhead.
+    Methods block until workers finish, ``AsyncCsobClient`` calls them in executor of the loop.
+    """
+
+    def __init__(self, max_workers=None, chunksize=16):
+        """
+        :param max_workers: number of worker processes, number of CPUs by default
+        :param chunksize: number of messages sent to worker at once by ``*_many`` methods
+        """
+        self.chunksize = chunksize
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+
+    def sign(self, key, digest):
+        return self._pool.submit(_worker_sign, _key_id(key), digest).result()
+
+    def verify(self, key, digest, signature):
+        return self._pool.submit(_worker_verify, _key_id(key), digest, signature).result()
+
+    def sign_many(self, key, digests):
+        return list(self._pool.map(_worker_sign, repeat(_key_id(key)), digests, chunksize=self.chunksize))
+
+    def verify_many(self, key, items):
+        digests, signatures = zip(*items) if items else ((), ())
+        return list(self._pool.map(_worker_verify, repeat(_key_id(key)), digests, signatures,
+                                   chunksize=self.chunksize))
+
+    def close(self):
+        self._pool.shutdown()
@@ -0,0 +1,176 @@
+# coding: utf-8
+import os
+import threading
+from base64 import b64encode, b64decode
+from hashlib import sha1
+
+from . import metrics
+from .backends import BACKENDS, get_backend
+
+
+class CsobKey(object):
+    """
+    Parsed RSA key kept in memory
+
+    The key is parsed on first use and only once, signer/verifier object is created only once too.
+    The RSA backend (and its library) is loaded on first use as well.
+    When the key is loaded from file, the file modification time is checked
+    on each use and the key is reloaded when the file was changed (key rotation).
+    The key can be used by many threads, it is reloaded by one of them.
+    """
+
+    def __init__(self, source, crypto_backend=None, rsa_backend=None):
+        """
+        :param source: path to PEM file, PEM content (bytes) or key object of RSA backend
+                       (``RsaKey`` or ``cryptography`` RSA key)
+        :param crypto_backend: ``pycsob.crypto.CryptoBackend`` executing RSA operations,
+                               operations are executed in calling thread by default
+        :param rsa_backend: ``pycsob.backends.RSABackend`` instance or name,
+                            best available one by default
+        """
+        if isinstance(rsa_backend, str) and rsa_backend not in [cls.name for cls in BACKENDS]:
+            raise ValueError('Unknown RSA backend %r' % rsa_backend)
+        self.crypto_backend = crypto_backend
+        self._rsa_backend = rsa_backend
+        self.path = None
+        self._source = None
+        self._mtime = None
+        self._native = None
+        self._pem = None
+        self._lock = threading.Lock()
+
+        if isinstance(source, str) and source.lstrip().startswith('-----BEGIN'):
+            self._source = source.encode('ascii')
+        elif isinstance(source, str) or hasattr(source, '__fspath__'):
+            self.path = source
+            os.stat(source)  # missing file is reported now, not on first use
+        else:
+            self._source = source
+
+    def __repr__(self):
+        backend = self._rsa_backend
+        name = getattr(backend, 'name', backend or 'default')
+        return '<%s %s %s>' % (self.__class__.__name__, name, self.path or 'in-memory')
+
+    @property
+    def rsa_backend(self):
+        "``RSABackend`` of the key"
+        backend = self._rsa_backend
+        if backend is None or isinstance(backend, str):
+            backend = self._rsa_backend = get_backend(backend)
+        return backend
+
+    def _set_key(self, source):
+        self._native = self.rsa_backend.load_key(source)
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, 'rb') as fp:
+            metrics.timed('key_load', self._set_key, fp.read())
+        self._mtime = mtime
+
+    def _check(self):
+        if self.path is None:
+            if self._native is None:
+                with self._lock:
+                    if self._native is None:
+                        self._set_key(self._source)
+                        self._source = None
+        elif os.stat(self.path).st_mtime != self._mtime:
+            with self._lock:
+                if os.stat(self.path).st_mtime != self._mtime:
+                    self._load()
+
+    @property
+    def key(self):
+        "Parsed key object of RSA backend"
+        self._check()
+        return self._native.key
+
+    @property
+    def pem(self):
+        "Key in PEM format, used to pass the key to other processes"
+        self._check()
+        native = self._native
+        cached = self._pem
+        if cached is None or cached[0] is not native:
+            # PEM of the current key, the key can be reloaded by another thread
+            cached = self._pem = (native, native.pem)
+        return cached[1]
+
+    @property
+    def public_pem(self):
+        "Public key in PEM format, e.g. to give the public key of a private one to the other party"
+        self._check()
+        return self._native.public_pem
+
+    def sign(self, msg):
+        """
+        :param msg: message for sign as bytes
+        :return: BASE64 encoded signature
+        """
+        return self.sign_digest(sha1(msg).digest())
+
+    def verify(self, msg, signature):
+        """
+        :param msg: signed message as bytes
+        :param signature: BASE64 encoded signature
+        :return: True if signature is valid
+        """
+        return self.verify_digest(sha1(msg).digest(), signature)
+
+    def sign_digest(self, digest):
+        """
+        :param digest: SHA-1 digest of the message
+        :return: BASE64 encoded signature
+        """
+        if self.crypto_backend is not None:
+            return self.crypto_backend.sign(self, digest)
+        return self.sign_inline(digest)
+
+    def verify_digest(self, digest, signature):
+        """
+        :param digest: SHA-1 digest of the message
+        :param signature: BASE64 encoded signature
+        :return: True if signature is valid
+        """
+        if self.crypto_backend is not None:
+            return self.crypto_backend.verify(self, digest, signature)
+        return self.verify_inline(digest, signature)
+
+    def sign_many(self, digests):
+        """
+        :param digests: list of SHA-1 digests
+        :return: list of BASE64 encoded signatures
+        """
+        if self.crypto_backend is not None:
+            return self.crypto_backend.sign_many(self, digests)
+        return [self.sign_inline(digest) for digest in digests]
+
+    def verify_many(self, items):
+        """
+        :param items: list of ``(digest, signature)`` tuples
+        :return: list of booleans
+        """
+        if self.crypto_backend is not None:
+            return self.crypto_backend.verify_many(self, items)
+        return [self.verify_inline(digest, signature) for digest, signature in items]
+
+    def sign_inline(self, digest):
+        "Sign digest in calling thread"
+        self._check()
+        return b64encode(self._native.sign(digest)).decode()
+
+    def verify_inline(self, digest, signature):
+        "Verify signature in calling thread"
+        self._check()
+        return self._native.verify(digest, b64decode(signature))
+
+
+def load_key(source, crypto_backend=None, rsa_backend=None):
+    """
+    Return ``CsobKey`` for given source, ``CsobKey`` instances are returned as they are.
+    """
+    if isinstance(source, CsobKey):
+        return source
+    return CsobKey(source, crypto_backend=crypto_backend, rsa_backend=rsa_backend)
@@ -0,0 +1,122 @@
+# coding: utf-8
+"""
+Timing of gateway calls
+
+Pass ``MetricsSink`` to the client to receive ``OperationMetrics`` of each call::
+
+    class StatsdSink(MetricsSink):
+        def record(self, op):
+            for phase, seconds in op.timings.items():
+                statsd.timing('csob.%s.%s' % (op.endpoint, phase), seconds * 1000)
+
+Phases: ``build`` (payload building including ``sign``), ``sign`` (RSA signing),
+``http`` (request round-trip), ``decode`` (JSON decoding), ``verify`` (RSA verification),
+``key_load`` (key file (re)loading) and ``throttle`` (waiting for rate limiter). Phases are summed over retries.
+Nothing is measured when no sink is set.
+"""
+import time
+from contextlib import contextmanager
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7, not safe for asyncio tasks
+    import threading
+
+    class ContextVar(threading.local):
+        def __init__(self, name, default=None):
+            self.value = default
+
+        def get(self):
+            return self.value
+
+        def set(self, value):
+            token, self.value = self.value, value
+            return token
+
+        def reset(self, token):
+            self.value = token
+
+    _current = ContextVar('pycsob_operation')
+else:
+    _current = ContextVar('pycsob_operation', default=None)
+
+
+class OperationMetrics(object):
+    """
+    Metrics of one gateway call
+    """
+    __slots__ = ('method', 'endpoint', 'status_code', 'result_code', 'retries', 'error', 'duration', 'timings')
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.status_code = None
+        self.result_code = None
+        self.retries = 0
+        self.error = None
+        self.duration = None
+        self.timings = {}
+
+    def __repr__(self):
+        return '<%s %s %s status=%s resultCode=%s retries=%d %.4fs>' % (
+            self.__class__.__name__, self.method, self.endpoint, self.status_code, self.result_code,
+            self.retries, self.duration or 0)
+
+    def add(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+
+class MetricsSink(object):
+    """
+    Receives metrics of finished gateway calls, it is called in the thread
+    (or event loop) of the call so it should not block
+    """
+
+    def record(self, op):
+        raise NotImplementedError
+
+
+class CallbackSink(MetricsSink):
+    "Calls function with ``OperationMetrics`` of each call"
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, op):
+        self.callback(op)
+
+
+def current():
+    "``OperationMetrics`` of the call in progress or None"
+    return _current.get()
+
+
+def timed(phase, func, *args):
+    "Call function, its duration is added to the phase of the call in progress"
+    op = _current.get()
+    if op is None:
+        return func(*args)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        op.add(phase, time.perf_counter() - start)
+
+
+@contextmanager
+def operation(sink, method, endpoint):
+    "Measure gateway call, metrics are passed to the sink when it ends"
+    op = OperationMetrics(method, endpoint)
+    token = _current.set(op)
+    start = time.perf_counter()
+    try:
+        yield op
+    except Exception as e:
+        op.error = e
+        if op.status_code is None:
+            op.status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+        raise
+    finally:
+        op.duration = time.perf_counter() - start
+        _current.reset(token)
+        sink.record(op)
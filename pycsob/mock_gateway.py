@@ -0,0 +1,434 @@
+# coding: utf-8
+"""
+Mock of the CSOB payment gateway for load tests and offline integration tests
+
+In-process usage::
+
+    with MockGateway(key='/path/to/gateway.key') as gw:
+        c = CsobClient('MERCHANT', gw.base_url, '/path/to/merchant.key', '/path/to/gateway.key')
+        pay_id = c.payment_init(...).pay_id
+        requests.get(c.get_payment_process_url(pay_id), allow_redirects=False)  # customer pays
+        c.payment_status(pay_id).payment_status  # PAYMENT_STATUS_WAITING
+
+Standalone::
+
+    python -m pycsob.mock_gateway --port 8000 --key gateway.key --latency 0.05 --error-rate 0.01
+
+Responses are signed by the gateway key. Payments go through ``conf.PAYMENT_STATUS_*`` states,
+operations not allowed in the current state are answered with
+``RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE``. Latency, internal errors and 429 responses
+can be injected.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote_plus, urlencode, urlparse
+
+from . import conf, utils
+from .keys import load_key
+
+
+class Payment(object):
+    __slots__ = ('pay_id', 'status', 'total_amount', 'close_payment', 'return_url', 'return_method',
+                 'merchant_data', 'customer_id', 'oneclick', 'auth_code', 'started_at')
+
+    def __init__(self, pay_id, total_amount, close_payment=True, return_url=None, return_method='POST',
+                 merchant_data=None, customer_id=None, oneclick=False):
+        self.pay_id = pay_id
+        self.status = conf.PAYMENT_STATUS_INIT
+        self.total_amount = total_amount
+        self.close_payment = close_payment
+        self.return_url = return_url
+        self.return_method = return_method
+        self.merchant_data = merchant_data
+        self.customer_id = customer_id
+        self.oneclick = oneclick
+        self.auth_code = None
+        self.started_at = None
+
+    def authorize(self):
+        self.auth_code = '%06d' % random.randint(0, 999999)
+        self.status = conf.PAYMENT_STATUS_WAITING if self.close_payment else conf.PAYMENT_STATUS_CONFIRMED
+
+
+class GatewayError(Exception):
+    def __init__(self, result_code, message=None):
+        self.result_code = result_code
+        self.message = message or conf.RESULT_STATUSES[result_code]
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockGateway(object):
+    """
+    Mock gateway, HTTP server running in background thread
+
+    Injection settings can be changed while the server runs.
+    """
+    # (method, endpoint) -> handler method name
+    ROUTES = {
+        ('POST', 'payment/init'): 'payment_init',
+        ('GET', 'payment/process'): 'payment_process',
+        ('GET', 'payment/status'): 'payment_status',
+        ('PUT', 'payment/reverse'): 'payment_reverse',
+        ('PUT', 'payment/close'): 'payment_close',
+        ('PUT', 'payment/refund'): 'payment_refund',
+        ('POST', 'payment/oneclick/init'): 'oneclick_init',
+        ('POST', 'payment/oneclick/start'): 'oneclick_start',
+        ('GET', 'customer/info'): 'customer_info',
+        ('GET', 'echo'): 'echo',
+        ('POST', 'echo'): 'echo',
+        ('POST', 'payment/button'): 'button',
+    }
+    # payload keys of GET requests sent in url
+    URL_KEYS = {
+        'payment/process': ('merchantId', 'payId', 'dttm', 'signature'),
+        'payment/status': ('merchantId', 'payId', 'dttm', 'signature'),
+        'customer/info': ('merchantId', 'customerId', 'dttm', 'signature'),
+        'echo': ('merchantId', 'dttm', 'signature'),
+    }
+
+    def __init__(self, key=None, merchant_key=None, host='127.0.0.1', port=0, prefix='/api/v1.7/',
+                 latency=0.0, error_rate=0.0, too_many_requests_rate=0.0, rate_limit=None,
+                 oneclick_delay=0.0):
+        """
+        :param key: gateway private key (path, PEM or ``CsobKey``), RSA-2048 key is generated by default
+        :param merchant_key: merchant public key, request signatures are verified when set
+        :param host: listen address
+        :param port: listen port, random free port by default
+        :param prefix: url prefix of API endpoints
+        :param latency: response delay in seconds or ``(min, max)`` range
+        :param error_rate: probability of 500 Internal Server Error response
+        :param too_many_requests_rate: probability of 429 Too Many Requests response
+        :param rate_limit: max requests per second, over the limit 429 is answered
+        :param oneclick_delay: seconds after ``oneclick/start`` before the payment is authorized
+        """
+        if key is None:
+            from Crypto.PublicKey import RSA
+            key = RSA.generate(2048).export_key()
+        self.key = load_key(key)
+        self.merchant_key = load_key(merchant_key) if merchant_key is not None else None
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.latency = latency
+        self.error_rate = error_rate
+        self.too_many_requests_rate = too_many_requests_rate
+        self.rate_limit = rate_limit
+        self.oneclick_delay = oneclick_delay
+        self.payments = {}
+        self.requests_count = 0
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, requests in the second)
+        self._server = None
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d%s' % (self.host, self.port, self.prefix)
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.port = self._server.server_address[1]
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, headers, content = gateway.handle(self.command, self.path, body)
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # request processing
+
+    def handle(self, method, path, body):
+        """
+        Process one request
+
+        :return: tuple ``(status, headers, content)``
+        """
+        path = urlparse(path).path
+        if not path.startswith(self.prefix):
+            return self._error(404)
+        path = path[len(self.prefix):]
+
+        injected = self._inject()
+        if injected is not None:
+            return injected
+
+        for (route_method, endpoint), name in self.ROUTES.items():
+            if method == route_method and (path == endpoint or path.startswith(endpoint + '/')):
+                break
+        else:
+            return self._error(404)
+
+        if method == 'GET':
+            values = [unquote_plus(one) for one in path[len(endpoint) + 1:].split('/')]
+            data = OrderedDict(zip(self.URL_KEYS[endpoint], values))
+        else:
+            try:
+                data = json.loads(body.decode('utf-8'), object_pairs_hook=OrderedDict)
+            except ValueError:
+                return self._error(400)
+
+        try:
+            self._verify_request(data)
+            with self._lock:
+                result = getattr(self, name)(data)
+        except GatewayError as e:
+            result = OrderedDict([
+                ('payId', data.get('payId')),
+                ('resultCode', e.result_code),
+                ('resultMessage', e.message),
+            ])
+        # responses are signed outside of the lock
+        return result if isinstance(result, tuple) else self._response(result)
+
+    def _inject(self):
+        with self._lock:
+            self.requests_count += 1
+            if self.rate_limit is not None:
+                second = int(time.time())
+                count = self._window[1] + 1 if self._window[0] == second else 1
+                self._window = (second, count)
+                if count > self.rate_limit:
+                    return self._error(429, [('Retry-After', '1')])
+
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+        if self.too_many_requests_rate and random.random() < self.too_many_requests_rate:
+            return self._error(429, [('Retry-After', '1')])
+        if self.error_rate and random.random() < self.error_rate:
+            return self._error(500)
+
+    def _verify_request(self, data):
+        if 'merchantId' not in data or 'signature' not in data:
+            raise GatewayError(conf.RETURN_CODE_PARAM_MISSING)
+        if self.merchant_key is not None:
+            payload = OrderedDict((k, v) for k, v in data.items() if k != 'signature')
+            if not utils.verify(payload, data['signature'], self.merchant_key):
+                raise GatewayError(conf.RETURN_CODE_PARAM_INVALID, 'Invalid signature')
+
+    def _error(self, status, headers=()):
+        return status, list(headers), b''
+
+    def _signed(self, values):
+        "Signed payload, signed keys are ordered as in gateway responses"
+        values['dttm'] = utils.dttm()
+        payload = OrderedDict((k, values[k]) for k in conf.RESPONSE_KEYS
+                              if values.get(k) not in conf.EMPTY_VALUES)
+        payload['signature'] = utils.sign(payload, self.key)
+        for k, v in values.items():
+            if k not in payload and v not in conf.EMPTY_VALUES:
+                payload[k] = v
+        return payload
+
+    def _response(self, values):
+        content = json.dumps(self._signed(values)).encode('utf-8')
+        return 200, [('Content-Type', 'application/json')], content
+
+    def _payment(self, pay_id):
+        try:
+            return self.payments[pay_id]
+        except KeyError:
+            raise GatewayError(conf.RETURN_CODE_PAYMENT_NOT_FOUND)
+
+    def _status(self, payment):
+        return OrderedDict([
+            ('payId', payment.pay_id),
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', conf.RESULT_STATUSES[conf.RETURN_CODE_OK]),
+            ('paymentStatus', payment.status),
+            ('authCode', payment.auth_code),
+        ])
+
+    def _transition(self, data, allowed, status):
+        payment = self._payment(data.get('payId'))
+        if payment.status not in allowed:
+            raise GatewayError(conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE)
+        payment.status = status
+        return self._status(payment)
+
+    def _new_pay_id(self):
+        return uuid.uuid4().hex[:13] + 'BF'
+
+    # endpoints
+
+    def payment_init(self, data):
+        for key in ('orderNo', 'totalAmount', 'returnUrl', 'cart', 'description'):
+            if key not in data:
+                raise GatewayError(conf.RETURN_CODE_PARAM_MISSING, 'Missing parameter %s' % key)
+        if sum(int(item['amount']) for item in data['cart']) != int(data['totalAmount']):
+            raise GatewayError(conf.RETURN_CODE_PARAM_INVALID, "Invalid 'cart' amounts, does not sum to totalAmount")
+        payment = Payment(
+            self._new_pay_id(), int(data['totalAmount']), close_payment=data.get('closePayment', True),
+            return_url=data['returnUrl'], return_method=data.get('returnMethod', 'POST'),
+            merchant_data=data.get('merchantData'), customer_id=data.get('customerId'),
+            oneclick=data.get('payOperation') == 'oneclickPayment',
+        )
+        self.payments[payment.pay_id] = payment
+        return self._status(payment)
+
+    def payment_process(self, data):
+        "Customer is redirected here, payment is authorized and customer redirected back to the shop"
+        payment = self._payment(data.get('payId'))
+        if payment.status != conf.PAYMENT_STATUS_INIT:
+            raise GatewayError(conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE)
+        payment.authorize()
+        params = self._signed(OrderedDict([
+            ('payId', payment.pay_id),
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', conf.RESULT_STATUSES[conf.RETURN_CODE_OK]),
+            ('paymentStatus', payment.status),
+            ('authCode', payment.auth_code),
+            ('merchantData', payment.merchant_data),
+        ]))
+        if payment.return_method == 'GET':
+            return 303, [('Location', payment.return_url + '?' + urlencode(params))], b''
+        inputs = ''.join('<input type="hidden" name="%s" value="%s">' % (k, v) for k, v in params.items())
+        html = ('<html><body onload="document.forms[0].submit()"><form method="POST" action="%s">%s'
+                '</form></body></html>' % (payment.return_url, inputs))
+        return 200, [('Content-Type', 'text/html')], html.encode('utf-8')
+
+    def payment_status(self, data):
+        payment = self._payment(data.get('payId'))
+        if (payment.status == conf.PAYMENT_STATUS_PROCESS and payment.started_at is not None
+                and time.time() - payment.started_at >= self.oneclick_delay):
+            payment.authorize()
+        return self._status(payment)
+
+    def payment_reverse(self, data):
+        return self._transition(data, (conf.PAYMENT_STATUS_CONFIRMED, conf.PAYMENT_STATUS_WAITING),
+                                conf.PAYMENT_STATUS_REVERSED)
+
+    def payment_close(self, data):
+        return self._transition(data, (conf.PAYMENT_STATUS_CONFIRMED,), conf.PAYMENT_STATUS_WAITING)
+
+    def payment_refund(self, data):
+        return self._transition(data, (conf.PAYMENT_STATUS_WAITING, conf.PAYMENT_STATUS_RECOGNIZED),
+                                conf.PAYMENT_STATUS_RETURNED)
+
+    def oneclick_init(self, data):
+        template = self._payment(data.get('origPayId'))
+        if not template.oneclick or template.status not in (conf.PAYMENT_STATUS_CONFIRMED,
+                                                            conf.PAYMENT_STATUS_WAITING,
+                                                            conf.PAYMENT_STATUS_RECOGNIZED):
+            raise GatewayError(conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE)
+        payment = Payment(self._new_pay_id(), int(data['totalAmount']), customer_id=template.customer_id)
+        self.payments[payment.pay_id] = payment
+        return self._status(payment)
+
+    def oneclick_start(self, data):
+        payment = self._payment(data.get('payId'))
+        if payment.status != conf.PAYMENT_STATUS_INIT:
+            raise GatewayError(conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE)
+        payment.status = conf.PAYMENT_STATUS_PROCESS
+        payment.started_at = time.time()
+        return self._status(payment)
+
+    def customer_info(self, data):
+        customer_id = data['customerId']
+        payments = [p for p in self.payments.values() if p.customer_id == customer_id]
+        if not payments:
+            code = conf.RETURN_CODE_CUSTOMER_NOT_FOUND
+        elif any(p.oneclick for p in payments):
+            code = conf.RETURN_CODE_FOUND_SAVED_CARDS
+        else:
+            code = conf.RETURN_CODE_NO_SAVED_CARDS
+        return OrderedDict([
+            ('customerId', customer_id),
+            ('resultCode', code),
+            ('resultMessage', conf.RESULT_STATUSES[code]),
+        ])
+
+    def echo(self, data):
+        return OrderedDict([
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', conf.RESULT_STATUSES[conf.RETURN_CODE_OK]),
+        ])
+
+    def button(self, data):
+        payment = self._payment(data.get('payId'))
+        return OrderedDict([
+            ('payId', payment.pay_id),
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', conf.RESULT_STATUSES[conf.RETURN_CODE_OK]),
+            ('redirect', OrderedDict([
+                ('method', 'GET'),
+                ('url', self.base_url + 'payment/process/%s' % payment.pay_id),
+            ])),
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock of the CSOB payment gateway')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--prefix', default='/api/v1.7/')
+    parser.add_argument('--key', help='gateway private key, generated when not set')
+    parser.add_argument('--merchant-key', help='merchant public key to verify requests')
+    parser.add_argument('--latency', type=float, default=0.0, help='response delay in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of 500 response')
+    parser.add_argument('--too-many-requests-rate', type=float, default=0.0, help='probability of 429 response')
+    parser.add_argument('--rate-limit', type=int, help='max requests per second')
+    args = parser.parse_args()
+
+    gateway = MockGateway(key=args.key, merchant_key=args.merchant_key, host=args.host, port=args.port,
+                          prefix=args.prefix, latency=args.latency, error_rate=args.error_rate,
+                          too_many_requests_rate=args.too_many_requests_rate, rate_limit=args.rate_limit)
+    if args.key is None:
+        print('Gateway public key:\n%s' % gateway.key.public_pem.decode())
+    print('Serving mock gateway on %s' % gateway.base_url)
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
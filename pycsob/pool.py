@@ -0,0 +1,146 @@
+# coding: utf-8
+"""
+Clients of many merchants sharing one connection pool
+
+``CsobClientPool`` keeps one client per merchant ID, all of them send requests through one
+HTTP session so connections (and TLS sessions) to the gateway are reused by all merchants.
+The gateway public key is parsed once for all merchants::
+
+    pool = CsobClientPool('https://iapi.iplatebnibrana.csob.cz/api/v1.7/', '/path/to/gateway.pub',
+                          pool_maxsize=20, retry=RetryPolicy())
+    pool.add('M1E3CB2577', '/path/to/shop1.key')
+    pool.add('M1F0E42013', '/path/to/shop2.key', rate_limiter=limiter)
+    pool['M1E3CB2577'].payment_status(pay_id)
+
+Merchants can be added, replaced and removed while other threads use the pool.
+Private keys are reloaded when their files change, see ``CsobKey``.
+"""
+import threading
+
+from .client import CsobClient, PoolStats
+from .keys import CsobKey, load_key
+
+
+class PooledClient(CsobClient):
+    """
+    Client of one merchant of ``CsobClientPool``, it uses the session of the pool
+    """
+
+    def __init__(self, pool, merchant_id, private_key_file, **options):
+        self.pool = pool
+        super(PooledClient, self).__init__(merchant_id, pool.base_url, private_key_file, pool.pubkey,
+                                           pool_connections=pool.pool_connections, pool_maxsize=pool.pool_maxsize,
+                                           pool_block=pool.pool_block, **options)
+
+    def _create_session(self):
+        return self.pool._client
+
+    def close(self):
+        "Connections are shared with other merchants, they are closed by ``CsobClientPool.close()``"
+
+
+class CsobClientPool(object):
+
+    def __init__(self, base_url, csob_pub_key_file, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 **client_options):
+        """
+        :param base_url: Base API url development / production
+        :param csob_pub_key_file: Path to CSOB public key, PEM bytes or ``RsaKey``
+        :param pool_maxsize: max number of keep-alive connections kept in the pool, it should be
+                             the number of threads sharing the pool
+        :param client_options: default options of clients (``retry``, ``cache``, ``rate_limiter``...),
+                               see ``CsobClient``; instances are shared by all merchants
+        """
+        self.base_url = base_url
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.client_options = client_options
+        self.pubkey = load_key(csob_pub_key_file, client_options.get('crypto_backend'),
+                               client_options.get('rsa_backend'))
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._session = None
+
+    @property
+    def _client(self):
+        "HTTP session shared by clients of all merchants, created on first call"
+        session = self._session
+        if session is None:
+            with self._lock:
+                if self._session is None:
+                    from .transport import create_session
+                    self._session = create_session(self.pool_connections, self.pool_maxsize, self.pool_block)
+                session = self._session
+        return session
+
+    def add(self, merchant_id, private_key_file, **options):
+        """
+        Add merchant or replace its client, key already parsed for the merchant is reused
+        when it is loaded from the same file
+
+        :param private_key_file: Path to private key of the merchant, PEM bytes, ``RsaKey`` or ``CsobKey``
+        :param options: options of the client overriding those of the pool
+        :return: ``PooledClient`` of the merchant
+        """
+        options = dict(self.client_options, **options)
+        with self._lock:
+            current = self._clients.get(merchant_id)
+            if (current is not None and not isinstance(private_key_file, CsobKey)
+                    and current.key.path is not None and current.key.path == private_key_file):
+                private_key_file = current.key
+            client = PooledClient(self, merchant_id, private_key_file, **options)
+            # copy on write, readers do not take the lock
+            clients = dict(self._clients)
+            clients[merchant_id] = client
+            self._clients = clients
+        return client
+
+    def remove(self, merchant_id):
+        """
+        Remove merchant, calls of its client in progress are finished
+
+        :return: removed ``PooledClient``
+        """
+        with self._lock:
+            clients = dict(self._clients)
+            client = clients.pop(merchant_id)
+            self._clients = clients
+        return client
+
+    def __getitem__(self, merchant_id):
+        "Client of the merchant, ``KeyError`` for unknown merchant"
+        return self._clients[merchant_id]
+
+    def get(self, merchant_id, default=None):
+        return self._clients.get(merchant_id, default)
+
+    def __contains__(self, merchant_id):
+        return merchant_id in self._clients
+
+    def __iter__(self):
+        return iter(list(self._clients))
+
+    def __len__(self):
+        return len(self._clients)
+
+    def pool_stats(self):
+        """
+        Statistics of the connection pool shared by all merchants
+
+        :return: ``PoolStats``
+        """
+        if self._session is None:
+            return PoolStats(0, 0, 0, 0, 0)
+        return self._session.get_adapter(self.base_url).pool_stats()
+
+    def close(self):
+        "Close all pooled connections"
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
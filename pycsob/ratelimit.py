@@ -0,0 +1,171 @@
+# coding: utf-8
+"""
+Client side rate limiting of gateway calls
+
+``RateLimiter`` keeps token bucket for each endpoint group, calls wait for a token
+before the request is sent::
+
+    limiter = RateLimiter({'init': TokenBucket(10), 'status': TokenBucket(50), 'close': TokenBucket(20)})
+    c = CsobClient(..., rate_limiter=limiter)
+
+When the gateway answers 429, rate of the bucket is halved (``Retry-After`` is honored)
+and it grows back by ``increase`` after each successful call (AIMD).
+``FileTokenBucket`` shares the bucket by processes of one host through a locked file.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from . import batch
+
+# endpoint url -> group
+ENDPOINT_GROUPS = {
+    'payment/init': 'init',
+    'payment/oneclick/init': 'init',
+    'payment/button/': 'init',
+    'payment/status/': 'status',
+    'customer/info/': 'status',
+    'echo/': 'status',
+    'payment/close/': 'close',
+    'payment/reverse/': 'close',
+    'payment/refund/': 'close',
+    'payment/oneclick/start': 'close',
+}
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket with adaptive rate
+    """
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, rate, burst=None, min_rate=None, decrease=0.5, increase=None):
+        """
+        :param rate: max number of calls per second
+        :param burst: max number of calls at once, ``rate`` by default
+        :param min_rate: rate is not decreased below it, ``rate / 20`` by default
+        :param decrease: rate is multiplied by it after 429 response
+        :param increase: rate is increased by it after successful call, ``rate / 100`` by default
+        """
+        self.max_rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.min_rate = float(min_rate if min_rate is not None else rate / 20.0)
+        self.decrease = decrease
+        self.increase = float(increase if increase is not None else rate / 100.0)
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+
+    def _initial_state(self):
+        return {'tokens': self.burst, 'updated': self.clock(), 'rate': self.max_rate}
+
+    @contextmanager
+    def _locked(self):
+        "Yield state dict, changes are saved"
+        with self._lock:
+            yield self._state
+
+    @property
+    def rate(self):
+        "Current rate"
+        with self._locked() as state:
+            return state['rate']
+
+    def reserve(self):
+        "Take a token, return seconds to wait before the call"
+        with self._locked() as state:
+            now = self.clock()
+            tokens = min(self.burst, state['tokens'] + (now - state['updated']) * state['rate']) - 1
+            state['tokens'] = tokens
+            state['updated'] = now
+            rate = state['rate']
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def acquire(self):
+        "Wait for a token, return seconds waited"
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def throttled(self, pause=0.0):
+        "Gateway answered 429, decrease rate and pause calls for ``pause`` seconds"
+        with self._locked() as state:
+            state['rate'] = max(self.min_rate, state['rate'] * self.decrease)
+            state['tokens'] = min(state['tokens'], -pause * state['rate'])
+
+    def succeeded(self):
+        with self._locked() as state:
+            state['rate'] = min(self.max_rate, state['rate'] + self.increase)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared by processes, its state is kept in file locked by ``fcntl.flock`` (POSIX only)
+
+    All processes must use the same parameters.
+    """
+    clock = staticmethod(time.time)
+
+    def __init__(self, path, rate, **kwargs):
+        """
+        :param path: state file, it is created when it does not exist
+        """
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        super(FileTokenBucket, self).__init__(rate, **kwargs)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+            try:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                try:
+                    state = json.loads(os.read(self._fd, 4096).decode())
+                except ValueError:  # new file
+                    state = self._initial_state()
+                yield state
+                data = json.dumps(state).encode()
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.ftruncate(self._fd, 0)
+                os.write(self._fd, data)
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RateLimiter(object):
+
+    def __init__(self, buckets, groups=None):
+        """
+        :param buckets: dict of endpoint group ('init', 'status', 'close') -> ``TokenBucket``,
+                        bucket 'default' is used for endpoints without bucket of their group
+        :param groups: dict of endpoint url -> group, updates ``ENDPOINT_GROUPS``
+        """
+        self.buckets = buckets
+        self.groups = dict(ENDPOINT_GROUPS)
+        self.groups.update(groups or {})
+
+    def bucket(self, endpoint_url):
+        "Bucket of the endpoint or None when calls are not limited"
+        bucket = self.buckets.get(self.groups.get(endpoint_url))
+        if bucket is None:
+            bucket = self.buckets.get('default')
+        return bucket
+
+    def record(self, bucket, response):
+        "Adapt rate of the bucket to the response"
+        if response.status_code == batch.TOO_MANY_REQUESTS:
+            try:
+                pause = max(0.0, float(response.headers.get('Retry-After')))
+            except (TypeError, ValueError):
+                pause = 0.0
+            bucket.throttled(pause)
+        else:
+            bucket.succeeded()
@@ -0,0 +1,282 @@
+# coding: utf-8
+"""
+Reconciliation of local orders with payment statuses of the gateway
+
+``Reconciler`` fetches ``payment_status`` of each expected payment concurrently and writes
+mismatches to CSV file in the order of the input. Progress is saved to a checkpoint, interrupted
+run is resumed by running it again with the same input, output and checkpoint::
+
+    reconciler = Reconciler(client, 'mismatches.csv', Checkpoint('reconcile.json'), concurrency=10, rate=50)
+    summary = reconciler.execute(read_csv('orders.csv'))
+
+Input is consumed lazily and at most ``2 * concurrency`` payments are in memory at once.
+Response of ``payment/status`` does not carry amount of the payment, amounts are compared
+only when ``gateway_amount`` returns it for the result.
+"""
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import batch, conf, utils
+from .ratelimit import TokenBucket
+
+ReconcileItem = namedtuple('ReconcileItem', ('pay_id', 'status', 'amount'))
+ReconcileItem.__doc__ = """
+Expected state of the payment, ``status`` is set of allowed payment statuses, status or amount
+which is None is not compared
+"""
+
+Mismatch = namedtuple('Mismatch', ('pay_id', 'expected_status', 'payment_status', 'expected_amount', 'amount',
+                                   'reason', 'error'))
+Mismatch.__doc__ = """
+Payment which does not match its expected state, ``reason`` is ``STATUS``, ``AMOUNT`` or ``ERROR``
+(status could not be fetched or the gateway did not return it)
+"""
+
+STATUS = 'status'
+AMOUNT = 'amount'
+ERROR = 'error'
+
+OUTPUT_HEADER = ('payId', 'expectedStatus', 'paymentStatus', 'expectedAmount', 'amount', 'reason', 'error')
+
+
+class ReconcileProgress(namedtuple('ReconcileProgress', ('checked', 'mismatched', 'errors', 'resumed', 'elapsed'))):
+    """
+    Counts include payments checked by previous runs, ``resumed`` of them
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        "Payments checked by this run per second"
+        return (self.checked - self.resumed) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return '%d checked (%d mismatched, %d errors, %d resumed) in %.1fs, %.1f/s' % (
+            self.checked, self.mismatched, self.errors, self.resumed, self.elapsed, self.throughput)
+
+
+def parse_statuses(value):
+    "Expected statuses from text '4|7|8', empty text is None"
+    value = value.strip()
+    if not value:
+        return None
+    return frozenset(int(one) for one in value.split('|'))
+
+
+def format_statuses(statuses):
+    return '' if statuses is None else '|'.join(str(one) for one in sorted(statuses))
+
+
+def read_csv(path, pay_id='payId', status='paymentStatus', amount='amount', **fmtparams):
+    """
+    Yield ``ReconcileItem`` of rows of CSV file with header
+
+    :param pay_id: column of payId
+    :param status: column of expected statuses ('7' or '7|8'), missing column or empty value is not compared
+    :param amount: column of expected amount in hundredths, missing column or empty value is not compared
+    :param fmtparams: passed to ``csv.DictReader``
+    """
+    with open(path, newline='') as fp:
+        for row in csv.DictReader(fp, **fmtparams):
+            expected_amount = (row.get(amount) or '').strip()
+            yield ReconcileItem(row[pay_id].strip(), parse_statuses(row.get(status) or ''),
+                                int(expected_amount) if expected_amount else None)
+
+
+def item_from(item):
+    "``ReconcileItem`` of tuple ``(pay_id, status, amount)``, single status is turned into set"
+    item = ReconcileItem(*item)
+    if isinstance(item.status, int):
+        item = item._replace(status=frozenset((item.status,)))
+    return item
+
+
+class Checkpoint(object):
+    """
+    Position of reconciliation in JSON file, the file is replaced atomically on each save
+    """
+
+    def __init__(self, path, fsync=False):
+        """
+        :param fsync: sync the file to disk on each save
+        """
+        self.path = path
+        self.fsync = fsync
+
+    def load(self):
+        "Return saved state or None"
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as fp:
+            return json.load(fp)
+
+    def save(self, state):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(dict(state, dttm=utils.dttm()), fp)
+            fp.flush()
+            if self.fsync:
+                os.fsync(fp.fileno())
+        os.replace(tmp, self.path)
+
+
+class Reconciler(object):
+
+    def __init__(self, client, output=None, checkpoint=None, concurrency=10, rate=None, progress=None,
+                 progress_interval=1.0, checkpoint_interval=1000, max_retries=5, gateway_amount=None):
+        """
+        :param client: ``CsobClient``
+        :param output: path of CSV file of mismatches
+        :param checkpoint: ``Checkpoint``, run is not resumable without it
+        :param concurrency: number of concurrent calls
+        :param rate: max number of status calls per second
+        :param progress: function called with ``ReconcileProgress`` every ``progress_interval`` seconds
+                         and when the run ends
+        :param checkpoint_interval: save checkpoint after this number of checked payments
+        :param max_retries: max number of retries of one call after 429
+        :param gateway_amount: function returning amount of ``PaymentResult`` or None
+        """
+        self.client = client
+        self.output = output
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.rate_limit = TokenBucket(rate, burst=1) if rate else None
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.max_retries = max_retries
+        self.gateway_amount = gateway_amount
+        self.summary = None
+
+    def _fetch(self, item):
+        if self.rate_limit is not None:
+            self.rate_limit.acquire()
+        return self.client.payment_status(item.pay_id, use_cache=False)
+
+    def compare(self, item, response, error=None):
+        "Return ``Mismatch`` or None when the payment matches expected state"
+        if error is None and response.result_code != conf.RETURN_CODE_OK:
+            error = '%s: %s' % (response.result_code, response.result_message)
+        if error is not None:
+            return Mismatch(item.pay_id, item.status, None, item.amount, None, ERROR,
+                            error if isinstance(error, str) else repr(error))
+        status = response.payment_status
+        amount = self.gateway_amount(response) if self.gateway_amount is not None else None
+        if item.status is not None and status not in item.status:
+            return Mismatch(item.pay_id, item.status, status, item.amount, amount, STATUS, None)
+        if item.amount is not None and amount is not None and amount != item.amount:
+            return Mismatch(item.pay_id, item.status, status, item.amount, amount, AMOUNT, None)
+        return None
+
+    def _open_output(self, offset):
+        if self.output is None:
+            return None, None
+        if os.path.exists(self.output):
+            # drop rows written after the checkpoint
+            os.truncate(self.output, offset)
+        fp = open(self.output, 'a', newline='')
+        writer = csv.writer(fp)
+        if not offset:
+            writer.writerow(OUTPUT_HEADER)
+        return fp, writer
+
+    def _results(self, items):
+        "Yield ``(index, item, response, error)`` in the order of items, at most ``2 * concurrency`` are pending"
+        throttle = batch.Throttle()
+        window = 2 * self.concurrency
+        finished = {}
+        futures = {}
+        next_index = [None]
+
+        def complete():
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[futures.pop(future)] = future.result()
+            while next_index[0] in finished:
+                yield (next_index[0],) + tuple(finished.pop(next_index[0]))
+                next_index[0] += 1
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for index, item in items:
+                if next_index[0] is None:
+                    next_index[0] = index
+                while len(futures) + len(finished) >= window:
+                    yield from complete()
+                futures[pool.submit(batch.call_throttled, self._fetch, item, throttle, self.max_retries)] = index
+            while futures:
+                yield from complete()
+
+    def run(self, items):
+        """
+        Check payments and yield ``Mismatch`` in the order of items, payments checked according
+        to the checkpoint are skipped
+
+        :param items: iterable of ``ReconcileItem`` or ``(pay_id, status, amount)`` in the same order
+                      on each run, e.g. ``read_csv(path)``; consumed lazily
+        """
+        state = self.checkpoint.load() if self.checkpoint is not None else None
+        if state is None:
+            state = {'position': 0, 'offset': 0, 'checked': 0, 'mismatched': 0, 'errors': 0}
+        position = resume_at = state['position']
+        counts = {'checked': state['checked'], 'mismatched': state['mismatched'], 'errors': state['errors'],
+                  'resumed': state['checked']}
+        start = time.monotonic()
+        reported = [start]
+        fp, writer = self._open_output(state['offset'])
+
+        def pending():
+            for index, item in enumerate(items):
+                if index >= resume_at:
+                    yield index, item_from(item)
+
+        def report(force=False):
+            now = time.monotonic()
+            self.summary = ReconcileProgress(elapsed=now - start, **counts)
+            if self.progress is not None and (force or now - reported[0] >= self.progress_interval):
+                reported[0] = now
+                self.progress(self.summary)
+
+        def save():
+            offset = 0
+            if fp is not None:
+                fp.flush()
+                offset = os.fstat(fp.fileno()).st_size
+            if self.checkpoint is not None:
+                self.checkpoint.save(dict(position=position, offset=offset, checked=counts['checked'],
+                                          mismatched=counts['mismatched'], errors=counts['errors']))
+
+        try:
+            for index, item, response, error in self._results(pending()):
+                mismatch = self.compare(item, response, error)
+                counts['checked'] += 1
+                if mismatch is not None:
+                    counts['errors' if mismatch.reason == ERROR else 'mismatched'] += 1
+                    if writer is not None:
+                        writer.writerow((mismatch.pay_id, format_statuses(mismatch.expected_status),
+                                         mismatch.payment_status, mismatch.expected_amount, mismatch.amount,
+                                         mismatch.reason, mismatch.error))
+                position = index + 1
+                if (counts['checked'] - counts['resumed']) % self.checkpoint_interval == 0:
+                    save()
+                report()
+                if mismatch is not None:
+                    yield mismatch
+        finally:
+            save()
+            if fp is not None:
+                fp.close()
+        report(force=True)
+
+    def execute(self, items):
+        """
+        Check all payments, see ``run``
+
+        :return: ``ReconcileProgress`` of the run
+        """
+        for _ in self.run(items):
+            pass
+        return self.summary
@@ -0,0 +1,308 @@
+# coding: utf-8
+"""
+Verified gateway responses
+
+``validate_response`` turns the HTTP response into ``PaymentResult`` with typed fields,
+the HTTP response (body, headers, connection) is not referenced by it::
+
+    r = c.payment_status(pay_id)
+    r.payment_status, r.dttime, r.extensions[0].long_masked_cln
+
+``payload`` of results and extensions rebuilds the response data as ``OrderedDict``
+like previous versions returned.
+
+Extensions are turned into objects by classes registered for their type (``register_extension``),
+extensions of other types are kept as ``UnknownExtension`` without verification of their signature.
+"""
+import binascii
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from . import cards, conf
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _decode_merchant_data(value):
+    "Merchant data are sent base64 encoded, value which is not valid base64 is kept as is"
+    if value is None:
+        return None
+    try:
+        return b64decode(value.encode('ascii'), validate=True)
+    except (binascii.Error, ValueError):
+        return value
+
+
+class _Result(object):
+    __slots__ = ()
+    # attributes compared and shown by repr
+    fields = ()
+
+    @property
+    def payload(self):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        return self.payload[key]
+
+    def get(self, key, default=None):
+        return self.payload.get(key, default)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.fields)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.fields))
+
+
+class Extension(_Result):
+    """
+    Signed extension of the response, subclasses define its type ``extension``, signed ``keys``
+    in order of the message for sign and ``from_payload``
+    """
+    __slots__ = ()
+
+    extension = None
+    keys = ()
+
+
+EXTENSIONS = {}
+
+
+def register_extension(cls):
+    "Register ``Extension`` subclass as handler of its type, can be used as class decorator"
+    EXTENSIONS[cls.extension] = cls
+    return cls
+
+
+def get_extension_class(name):
+    "Handler of the extension type or None"
+    return EXTENSIONS.get(name)
+
+
+@register_extension
+class MaskedCardExtension(Extension):
+    """
+    Extension ``maskClnRP``, masked card number of the payment
+    """
+    __slots__ = ('dttime', 'masked_cln', 'expiration', 'long_masked_cln')
+    fields = __slots__
+
+    extension = 'maskClnRP'
+    keys = ('extension', 'dttm', 'maskedCln', 'expiration', 'longMaskedCln')
+
+    def __init__(self, dttime=None, masked_cln=None, expiration=None, long_masked_cln=None):
+        self.dttime = dttime
+        self.masked_cln = masked_cln
+        self.expiration = expiration
+        self.long_masked_cln = long_masked_cln
+
+    @classmethod
+    def from_payload(cls, payload):
+        from .utils import dttm_decode
+        dttm = payload.get('dttm')
+        return cls(dttime=None if dttm is None else dttm_decode(dttm), masked_cln=payload.get('maskedCln'),
+                   expiration=payload.get('expiration'), long_masked_cln=payload.get('longMaskedCln'))
+
+    @property
+    def card_provider(self):
+        "``(provider_id, name)`` of the card, see ``cards.get_card_provider``"
+        return cards.get_card_provider(self.long_masked_cln or '')
+
+    @property
+    def payload(self):
+        "Extension data as ``OrderedDict``"
+        values = (self.extension, None if self.dttime is None else self.dttime.strftime('%Y%m%d%H%M%S'),
+                  self.masked_cln, self.expiration, self.long_masked_cln)
+        return OrderedDict((k, v) for k, v in zip(self.keys, values) if v is not None)
+
+
+@register_extension
+class MaskedClnExtension(MaskedCardExtension):
+    """
+    Extension ``maskCln``, masked card number of the payment
+    """
+    __slots__ = ()
+
+    extension = 'maskCln'
+
+
+@register_extension
+class TrxDatesExtension(Extension):
+    """
+    Extension ``trxDates``, dates of creation, authorization and settlement of the payment as sent
+    """
+    __slots__ = ('dttime', 'created_date', 'auth_date', 'settlement_date')
+    fields = __slots__
+
+    extension = 'trxDates'
+    keys = ('extension', 'dttm', 'createdDate', 'authDate', 'settlementDate')
+
+    def __init__(self, dttime=None, created_date=None, auth_date=None, settlement_date=None):
+        self.dttime = dttime
+        self.created_date = created_date
+        self.auth_date = auth_date
+        self.settlement_date = settlement_date
+
+    @classmethod
+    def from_payload(cls, payload):
+        from .utils import dttm_decode
+        dttm = payload.get('dttm')
+        return cls(dttime=None if dttm is None else dttm_decode(dttm), created_date=payload.get('createdDate'),
+                   auth_date=payload.get('authDate'), settlement_date=payload.get('settlementDate'))
+
+    @property
+    def payload(self):
+        "Extension data as ``OrderedDict``"
+        values = (self.extension, None if self.dttime is None else self.dttime.strftime('%Y%m%d%H%M%S'),
+                  self.created_date, self.auth_date, self.settlement_date)
+        return OrderedDict((k, v) for k, v in zip(self.keys, values) if v is not None)
+
+
+class UnknownExtension(_Result):
+    """
+    Extension without registered handler, its signature is not verified
+    """
+    __slots__ = ('extension', 'data')
+    fields = __slots__
+
+    def __init__(self, extension, data):
+        self.extension = extension
+        self.data = data
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(payload.get('extension'), OrderedDict((k, v) for k, v in payload.items() if k != 'signature'))
+
+    @property
+    def payload(self):
+        return OrderedDict(self.data)
+
+
+# keys of response data which are not kept in ``PaymentResult.extra``
+_NOT_EXTRA = frozenset(conf.RESPONSE_KEYS + ('signature', 'extensions'))
+
+
+class PaymentResult(_Result):
+    """
+    Verified response of the gateway
+
+    Fields missing in the response are None, ``merchant_data`` are decoded bytes. Extensions of result
+    with pending extensions are verified on first access of ``extensions``. Other top-level data
+    of the response (``redirect`` of ``button``) are kept as they are in ``extra``, they are not signed.
+    """
+    __slots__ = ('pay_id', 'customer_id', 'dttime', 'result_code', 'result_message', 'payment_status',
+                 'auth_code', 'merchant_data', 'extra', '_extensions', '_pending')
+    fields = ('pay_id', 'customer_id', 'dttime', 'result_code', 'result_message', 'payment_status',
+              'auth_code', 'merchant_data', 'extensions')
+
+    def __init__(self, pay_id=None, customer_id=None, dttime=None, result_code=None, result_message=None,
+                 payment_status=None, auth_code=None, merchant_data=None, extensions=(), pending_extensions=None,
+                 extra=None):
+        self.pay_id = pay_id
+        self.customer_id = customer_id
+        self.dttime = dttime
+        self.result_code = result_code
+        self.result_message = result_message
+        self.payment_status = payment_status
+        self.auth_code = auth_code
+        self.merchant_data = merchant_data
+        self.extra = OrderedDict(extra or ())
+        self._extensions = list(extensions)
+        self._pending = pending_extensions
+
+    @classmethod
+    def from_payload(cls, payload, extensions=(), pending_extensions=None):
+        """
+        :param payload: verified response data
+        :param extensions: list of extension objects
+        :param pending_extensions: ``(key, extensions data)`` verified on first access of ``extensions``
+        """
+        from .utils import dttm_decode
+        dttm = payload.get('dttm')
+        extra = [(k, v) for k, v in payload.items() if k not in _NOT_EXTRA]
+        return cls(pay_id=payload.get('payId'), customer_id=payload.get('customerId'),
+                   dttime=None if dttm is None else dttm_decode(dttm),
+                   result_code=_int(payload.get('resultCode')), result_message=payload.get('resultMessage'),
+                   payment_status=_int(payload.get('paymentStatus')), auth_code=payload.get('authCode'),
+                   merchant_data=_decode_merchant_data(payload.get('merchantData')), extensions=extensions,
+                   pending_extensions=pending_extensions, extra=extra)
+
+    @property
+    def extensions(self):
+        "List of extension objects, raises ``CsobVerifyError`` when pending extensions cannot be verified"
+        if self._pending is not None:
+            from .utils import verify_extensions
+            key, data = self._pending
+            self._extensions = verify_extensions(data, key)
+            self._pending = None
+        return self._extensions
+
+    @property
+    def redirect(self):
+        "``redirect`` of ``button`` response (``method``, ``url``...) or None"
+        return self.extra.get('redirect')
+
+    def get_extension(self, name):
+        "First extension of the type or None"
+        for one in self.extensions:
+            if one.extension == name:
+                return one
+        return None
+
+    def _state(self):
+        "Fields with extensions as they are, pending extensions are not verified"
+        values = [getattr(self, name) for name in self.fields[:-1]]
+        return values, self.extra, self._extensions, None if self._pending is None else self._pending[1]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._state() == other._state()
+
+    def __repr__(self):
+        values, extra, extensions, pending = self._state()
+        return '%s(%s, extensions=%s%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % (name, value) for name, value in zip(self.fields, values)),
+            '<%d pending>' % len(pending) if pending is not None else repr(extensions),
+            ', extra=%r' % dict(extra) if extra else '')
+
+    def __reduce__(self):
+        # pending extensions are verified, the key is not pickled
+        return (PaymentResult, tuple(getattr(self, name) for name in self.fields), (None, {'extra': self.extra}))
+
+    @property
+    def ok(self):
+        "Gateway accepted the request"
+        return self.result_code == conf.RETURN_CODE_OK
+
+    @property
+    def payload(self):
+        """
+        Response data as ``OrderedDict`` with ``dttime``, built on each access
+        """
+        merchant_data = self.merchant_data
+        if isinstance(merchant_data, bytes):
+            merchant_data = b64encode(merchant_data).decode('ascii')
+        values = {
+            'payId': self.pay_id,
+            'customerId': self.customer_id,
+            'dttm': None if self.dttime is None else self.dttime.strftime('%Y%m%d%H%M%S'),
+            'resultCode': self.result_code,
+            'resultMessage': self.result_message,
+            'paymentStatus': self.payment_status,
+            'authCode': self.auth_code,
+            'merchantData': merchant_data,
+        }
+        payload = OrderedDict((k, values[k]) for k in conf.RESPONSE_KEYS if values.get(k) is not None)
+        payload.update(self.extra)
+        if self.dttime is not None:
+            payload['dttime'] = self.dttime
+        return payload
@@ -0,0 +1,143 @@
+# coding: utf-8
+import random
+import threading
+import time
+
+from .batch import retry_after, status_code
+
+
+class CsobCircuitOpenError(Exception):
+    "Gateway is considered down, request was not sent"
+
+
+def is_gateway_failure(exc, transport_errors=()):
+    """
+    True if exception means the gateway is unavailable or overloaded
+    (connection error, timeout, 429 or 5xx response)
+    """
+    if isinstance(exc, transport_errors):
+        return True
+    code = status_code(exc)
+    return code is not None and (code == 429 or code >= 500)
+
+
+class RetryPolicy(object):
+    """
+    Retry of idempotent gateway calls with jittered exponential backoff
+
+    Payload is signed again with fresh ``dttm`` for each attempt.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=10.0, statuses=(429, 503),
+                 retry_transport_errors=True, jitter=True):
+        """
+        :param max_attempts: max number of attempts including the first one
+        :param backoff: base delay in seconds, doubled after each attempt
+        :param max_backoff: max delay in seconds, ``Retry-After`` header included
+        :param statuses: HTTP statuses to retry
+        :param retry_transport_errors: retry connection errors and timeouts
+        :param jitter: randomize delay between 0 and computed backoff ("full jitter")
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.retry_transport_errors = retry_transport_errors
+        self.jitter = jitter
+
+    def should_retry(self, exc, attempt, transport_errors=()):
+        """
+        :param attempt: number of failed attempts so far
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if status_code(exc) in self.statuses:
+            return True
+        return self.retry_transport_errors and isinstance(exc, transport_errors)
+
+    def delay(self, exc, attempt):
+        """
+        Seconds to wait before next attempt, ``Retry-After`` header takes precedence
+
+        :param attempt: number of failed attempts so far
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return min(self.max_backoff, retry_after(exc, delay))
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast while the gateway is down
+
+    After ``failure_threshold`` consecutive gateway failures the circuit opens and calls
+    raise ``CsobCircuitOpenError`` without sending a request. After ``reset_timeout``
+    seconds one trial call is let through; success closes the circuit, failure opens it again.
+    Trial call which ends without result (cancelled, interrupted) opens it again as well and
+    a new trial is let through when the trial does not end within ``reset_timeout``.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        "Raise ``CsobCircuitOpenError`` when the call is not allowed"
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                # _opened_at is start of the trial in half-open state
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return
+            raise CsobCircuitOpenError('Gateway circuit is %s' % self.state)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def record_abort(self):
+        "Call ended without result (``CancelledError``, ``KeyboardInterrupt``...), failed trial call opens the circuit"
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        "Call ended before a request was sent, next call may be the trial when this one was"
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record(self, exc, transport_errors=()):
+        """
+        Record result of the call, ``exc`` is None for success. Error which is not a gateway failure
+        is success only when the gateway responded (error has ``response``), other errors
+        (e.g. signing failed) are not recorded.
+        """
+        if exc is None:
+            self.record_success()
+        elif is_gateway_failure(exc, transport_errors):
+            self.record_failure()
+        elif getattr(exc, 'response', None) is not None:
+            self.record_success()
+        else:
+            self.release()
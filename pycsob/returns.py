@@ -0,0 +1,123 @@
+# coding: utf-8
+"""
+Verification of data sent by the gateway to ``returnUrl``
+
+``ReturnVerifier`` needs only the CSOB public key, it can be used in web workers
+without ``CsobClient``::
+
+    verifier = ReturnVerifier('csob.pub')
+
+    def return_view(request):
+        data = verifier.verify(request.POST)
+
+The verifier is thread safe and can be pickled (the key is passed as its path or PEM)
+when its cache can be pickled, ``MemoryCache`` is copied empty.
+With ``pycsob.cache`` cache repeated returns (double submit of the form) are not verified
+again, ``reject_replays=True`` rejects them.
+"""
+from base64 import b64decode
+from collections import OrderedDict, namedtuple
+
+from . import conf, utils
+from .keys import load_key
+
+ReturnResult = namedtuple('ReturnResult', 'data error')
+
+_INT_KEYS = frozenset(('resultCode', 'paymentStatus'))
+
+
+class CsobReplayError(utils.CsobVerifyError):
+    "Gateway return data were already verified"
+
+
+class ReturnVerifier(object):
+
+    def __init__(self, pubkey, crypto_backend=None, rsa_backend=None, cache=None, reject_replays=False):
+        """
+        :param pubkey: path to CSOB public key, PEM bytes, key object or ``CsobKey``
+        :param crypto_backend: ``pycsob.crypto.CryptoBackend`` executing verification
+        :param rsa_backend: RSA implementation, 'openssl' or 'pycryptodome', best available by default
+        :param cache: ``pycsob.cache.Cache`` of verified data keyed by payId and signature,
+                      repeated data are returned from the cache without verification
+        :param reject_replays: raise ``CsobReplayError`` for data found in the cache
+        """
+        self.pubkey = load_key(pubkey, crypto_backend, rsa_backend)
+        self.cache = cache
+        self.reject_replays = reject_replays
+
+    def __reduce__(self):
+        key = self.pubkey
+        return self.__class__, (key.path or key.pem, None, key.rsa_backend.name, self.cache, self.reject_replays)
+
+    def _prepare(self, datadict):
+        o = OrderedDict()
+        for k in conf.RESPONSE_KEYS:
+            if k in datadict:
+                o[k] = int(datadict[k]) if k in _INT_KEYS else datadict[k]
+        return o, utils.msg_digest(o)
+
+    def _finish(self, o, signature):
+        if 'dttm' in o:
+            o['dttime'] = utils.dttm_decode(o['dttm'])
+        if 'merchantData' in o:
+            o['merchantData'] = b64decode(o['merchantData'])
+        if self.cache is not None:
+            if not self.cache.add_return(o.get('payId'), signature, o) and self.reject_replays:
+                raise CsobReplayError('Replayed gateway return data')
+            o = OrderedDict(o)
+        return o
+
+    def _cached(self, datadict, signature):
+        # cached data were verified with the same signature, data of the request are not used
+        data = self.cache.get_return(datadict.get('payId'), signature)
+        if data is None:
+            return None
+        if self.reject_replays:
+            raise CsobReplayError('Replayed gateway return data')
+        return OrderedDict(data)
+
+    def verify(self, datadict):
+        """
+        :param datadict: data from request in dict
+        :return: verified data as OrderedDict or raise error
+        """
+        signature = datadict['signature']
+        if self.cache is not None:
+            data = self._cached(datadict, signature)
+            if data is not None:
+                return data
+        o, digest = self._prepare(datadict)
+        if not self.pubkey.verify_digest(digest, signature):
+            raise utils.CsobVerifyError('Unverified gateway return data')
+        return self._finish(o, signature)
+
+    def verify_many(self, datadicts):
+        """
+        Verify many queued returns in one batch, errors are reported per item
+
+        :param datadicts: iterable of dicts with data from requests
+        :return: list of ``ReturnResult(data, error)`` in order of input
+        """
+        results = []
+        prepared = []
+        for datadict in datadicts:
+            try:
+                signature = datadict['signature']
+                data = self._cached(datadict, signature) if self.cache is not None else None
+                if data is None:
+                    prepared.append((len(results), signature) + self._prepare(datadict))
+            except (KeyError, ValueError, utils.CsobVerifyError) as e:
+                results.append(ReturnResult(None, e))
+            else:
+                results.append(None if data is None else ReturnResult(data, None))
+
+        verified = self.pubkey.verify_many([(digest, signature) for _, signature, _, digest in prepared])
+        for (index, signature, o, _), ok in zip(prepared, verified):
+            if not ok:
+                results[index] = ReturnResult(None, utils.CsobVerifyError('Unverified gateway return data'))
+                continue
+            try:
+                results[index] = ReturnResult(self._finish(o, signature), None)
+            except (ValueError, TypeError, utils.CsobVerifyError) as e:
+                results[index] = ReturnResult(None, e)
+        return results
@@ -0,0 +1,86 @@
+# coding: utf-8
+"""
+JSON serializers of request bodies and responses
+
+``OrjsonSerializer`` (``pip install pycsob[orjson]``) is selected automatically when
+``orjson`` is installed, ``ujson`` is used next and stdlib ``json`` otherwise.
+Serializers encode to bytes and decode bytes, the body is not decoded to text first.
+"""
+
+
+class Serializer(object):
+    """
+    JSON implementation with methods ``dumps(obj) -> bytes`` and ``loads(bytes) -> obj``
+    """
+    name = None
+
+    def dumps(self, obj):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class StdlibSerializer(Serializer):
+    name = 'json'
+
+    def __init__(self):
+        import json
+        self._encoder = json.JSONEncoder(separators=(',', ':'))
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj):
+        # ASCII only, non-ASCII characters are escaped
+        return self._encoder.encode(obj).encode('ascii')
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return self._decoder.decode(data)
+
+
+class UjsonSerializer(Serializer):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj):
+        return self._ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+
+class OrjsonSerializer(Serializer):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+SERIALIZERS = (OrjsonSerializer, UjsonSerializer, StdlibSerializer)
+_default = None
+
+
+def get_serializer(name=None):
+    """
+    Return serializer by name ('orjson', 'ujson' or 'json'), best available one by default
+    """
+    global _default
+    if name is not None:
+        for cls in SERIALIZERS:
+            if cls.name == name:
+                return cls()
+        raise ValueError('Unknown serializer %r' % name)
+    if _default is None:
+        for cls in SERIALIZERS:
+            try:
+                _default = cls()
+            except ImportError:
+                continue
+            break
+    return _default
@@ -0,0 +1,156 @@
+# coding: utf-8
+"""
+Local tracking of payment statuses
+
+``PaymentStateTracker`` keeps the last status of each payment reported by the gateway
+(responses of the client and verified gateway returns). Client operations which cannot
+succeed in the known status are rejected before the payload is signed and sent::
+
+    tracker = PaymentStateTracker(SQLiteStateStore('payments.sqlite'))
+    c = CsobClient(..., state_tracker=tracker)
+    c.payment_reverse(pay_id)
+    c.payment_close(pay_id)  # raises CsobStateError, reversed payment cannot be closed
+
+Local status can be behind the gateway, statuses which change without operation of the merchant
+(payment by customer, automatic close, settlement) are taken into account: operation is rejected
+only when no such change leads to status in which the operation is allowed.
+"""
+import sqlite3
+import threading
+
+from . import conf, utils
+
+# operation -> statuses in which the gateway allows it
+OPERATION_STATUSES = {
+    'close': frozenset((conf.PAYMENT_STATUS_CONFIRMED,)),
+    'reverse': frozenset((conf.PAYMENT_STATUS_CONFIRMED, conf.PAYMENT_STATUS_WAITING)),
+    'refund': frozenset((conf.PAYMENT_STATUS_WAITING, conf.PAYMENT_STATUS_RECOGNIZED)),
+}
+
+# status -> statuses it can change to without operation of the merchant
+EXTERNAL_TRANSITIONS = {
+    conf.PAYMENT_STATUS_INIT: frozenset((conf.PAYMENT_STATUS_PROCESS, conf.PAYMENT_STATUS_CANCELLED,
+                                         conf.PAYMENT_STATUS_CONFIRMED, conf.PAYMENT_STATUS_REJECTED)),
+    conf.PAYMENT_STATUS_PROCESS: frozenset((conf.PAYMENT_STATUS_CANCELLED, conf.PAYMENT_STATUS_CONFIRMED,
+                                            conf.PAYMENT_STATUS_REJECTED)),
+    # closed automatically when the payment was initialized with close_payment
+    conf.PAYMENT_STATUS_CONFIRMED: frozenset((conf.PAYMENT_STATUS_WAITING,)),
+    conf.PAYMENT_STATUS_WAITING: frozenset((conf.PAYMENT_STATUS_RECOGNIZED,)),
+    conf.PAYMENT_STATUS_RETURN_WAITING: frozenset((conf.PAYMENT_STATUS_RETURNED,)),
+}
+
+
+class CsobStateError(ValueError):
+    "Operation is not allowed in the known status of the payment, request was not sent"
+
+    def __init__(self, operation, pay_id, status):
+        super(CsobStateError, self).__init__('Cannot %s payment %s in status %s (%s)' % (
+            operation, pay_id, status, conf.PAYMENT_STATUSES.get(status, 'unknown')))
+        self.operation = operation
+        self.pay_id = pay_id
+        self.status = status
+
+
+def reachable(status):
+    "Status and statuses it can change to without operation of the merchant"
+    seen = {status}
+    todo = [status]
+    while todo:
+        for one in EXTERNAL_TRANSITIONS.get(todo.pop(), ()):
+            if one not in seen:
+                seen.add(one)
+                todo.append(one)
+    return frozenset(seen)
+
+
+def is_allowed(operation, status):
+    """
+    False if the operation cannot succeed in the status, unknown status (None) allows all operations
+    """
+    if status is None:
+        return True
+    return not reachable(status).isdisjoint(OPERATION_STATUSES[operation])
+
+
+class StateStore(object):
+    """
+    Storage of payment statuses, subclasses implement ``get`` and ``set``
+    """
+
+    def get(self, pay_id):
+        "Return known status of the payment or None"
+        raise NotImplementedError
+
+    def set(self, pay_id, status):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+
+    def __init__(self):
+        self.statuses = {}
+
+    def get(self, pay_id):
+        return self.statuses.get(pay_id)
+
+    def set(self, pay_id, status):
+        self.statuses[pay_id] = status
+
+
+class SQLiteStateStore(StateStore):
+    "Statuses in SQLite database, each change is committed"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS pycsob_payment_state (pay_id TEXT PRIMARY KEY, '
+                         'status INTEGER, dttm TEXT)')
+        self._db.commit()
+
+    def get(self, pay_id):
+        with self._lock:
+            row = self._db.execute('SELECT status FROM pycsob_payment_state WHERE pay_id = ?', (pay_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, pay_id, status):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO pycsob_payment_state VALUES (?, ?, ?)',
+                             (pay_id, status, utils.dttm()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class PaymentStateTracker(object):
+
+    def __init__(self, store=None):
+        """
+        :param store: ``StateStore``, ``MemoryStateStore`` by default
+        """
+        self.store = store if store is not None else MemoryStateStore()
+
+    def status(self, pay_id):
+        "Last status of the payment reported by the gateway or None"
+        return self.store.get(pay_id)
+
+    def update(self, pay_id, status):
+        "Record status reported by the gateway"
+        if pay_id is not None and status is not None and self.store.get(pay_id) != status:
+            self.store.set(pay_id, status)
+
+    def allowed_operations(self, pay_id):
+        "Operations which can succeed in the known status of the payment"
+        status = self.status(pay_id)
+        return sorted(operation for operation in OPERATION_STATUSES if is_allowed(operation, status))
+
+    def check(self, operation, pay_id):
+        "Raise ``CsobStateError`` if the operation cannot succeed in the known status of the payment"
+        status = self.status(pay_id)
+        if not is_allowed(operation, status):
+            raise CsobStateError(operation, pay_id, status)
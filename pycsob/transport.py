@@ -0,0 +1,58 @@
+# coding: utf-8
+"""
+HTTP stack of ``CsobClient``, it is imported when the client sends its first request
+"""
+import threading
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+from . import conf
+from .client import PoolStats
+
+
+class HTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTP adapter with default timeout, it counts requests in progress
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(HTTPAdapter, self).__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def send(self, request, **kwargs):
+        kwargs.setdefault('timeout', conf.HTTP_TIMEOUT)
+        with self._stats_lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            return super(HTTPAdapter, self).send(request, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+
+    def pool_stats(self):
+        pools = self.poolmanager.pools
+        sent = connections = idle = 0
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:  # pool was evicted meanwhile
+                continue
+            sent += pool.num_requests
+            connections += pool.num_connections
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return PoolStats(sent, connections, idle, self.in_use, self.peak_in_use)
+
+
+def create_session(pool_connections=10, pool_maxsize=10, pool_block=False):
+    "``requests.Session`` with own copy of ``conf.HEADERS`` and one ``HTTPAdapter`` for both schemes"
+    session = requests.Session()
+    session.headers = CaseInsensitiveDict(conf.HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -1,13 +1,13 @@
 import sys
 import datetime
-import re
-from base64 import b64encode, b64decode
 from collections import OrderedDict
-from Crypto.Hash import SHA
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
+from hashlib import sha1
 
-from . import conf
+from . import conf, metrics
+from .cards import get_card_provider, get_card_providers  # noqa: F401
+from .keys import load_key
+from .results import PaymentResult, UnknownExtension, get_extension_class
+from .serializers import get_serializer
 
 from urllib.parse import urljoin, quote_plus
 
@@ -17,19 +17,17 @@ class CsobVerifyError(Exception):
 
 
 def sign(payload, keyfile):
-    msg = mk_msg_for_sign(payload)
-    key = RSA.importKey(open(keyfile).read())
-    h = SHA.new(msg)
-    signer = PKCS1_v1_5.new(key)
-    return b64encode(signer.sign(h)).decode()
+    """
+    :param keyfile: path to private key file or ``CsobKey``
+    """
+    return metrics.timed('sign', load_key(keyfile).sign_digest, msg_digest(payload))
 
 
 def verify(payload, signature, pubkeyfile):
-    msg = mk_msg_for_sign(payload)
-    key = RSA.importKey(open(pubkeyfile).read())
-    h = SHA.new(msg)
-    verifier = PKCS1_v1_5.new(key)
-    return verifier.verify(h, b64decode(signature))
+    """
+    :param pubkeyfile: path to public key file or ``CsobKey``
+    """
+    return metrics.timed('verify', load_key(pubkeyfile).verify_digest, msg_digest(payload), signature)
 
 
 def mk_msg_for_sign(payload):
@@ -43,12 +41,64 @@ def mk_msg_for_sign(payload):
     return msg.encode('utf-8')
 
 
+def msg_digest(payload, keys=None):
+    """
+    SHA-1 digest of the message for sign, same as ``sha1(mk_msg_for_sign(payload)).digest()``
+
+    Values are fed to the hash one by one, the payload is not copied and
+    the message is not built.
+
+    :param keys: keys of signed values in order of the message, e.g. ``conf.RESPONSE_KEYS``
+                 for decoded response; all values of the payload by default
+    """
+    h = sha1()
+    update = h.update
+    separator = b''
+    items = payload.items() if keys is None else ((k, payload[k]) for k in keys if k in payload)
+    for key, value in items:
+        update(separator)
+        separator = b'|'
+        if type(value) is str:
+            update(value.encode('utf-8'))
+        elif key == 'cart' and value not in conf.EMPTY_VALUES:
+            item_separator = b''
+            for one in value:
+                for item_value in one.values():
+                    update(item_separator)
+                    item_separator = b'|'
+                    update(_encode(item_value))
+        else:
+            update(_encode(value))
+    return h.digest()
+
+
+def _encode(value):
+    if type(value) is str:
+        return value.encode('utf-8')
+    if type(value) is bool:
+        return b'true' if value else b'false'
+    return str(value).encode('utf-8')
+
+
 def mk_payload(keyfile, pairs):
     payload = OrderedDict([(k, v) for k, v in pairs if v not in conf.EMPTY_VALUES])
     payload['signature'] = sign(payload, keyfile)
     return payload
 
 
+def mk_payloads(keyfile, pairs_list):
+    """
+    Payloads like ``mk_payload`` signed at once by ``sign_many`` of the key
+
+    :param pairs_list: list of pairs of each payload
+    """
+    payloads = [OrderedDict([(k, v) for k, v in pairs if v not in conf.EMPTY_VALUES]) for pairs in pairs_list]
+    signatures = metrics.timed('sign', load_key(keyfile).sign_many, [msg_digest(one) for one in payloads])
+    for payload, signature in zip(payloads, signatures):
+        payload['signature'] = signature
+    return payloads
+
+
 def mk_url(base_url, endpoint_url, payload=None):
     url = urljoin(base_url, endpoint_url)
     if payload is None:
@@ -68,57 +118,70 @@ def dttm(format_='%Y%m%d%H%M%S'):
 
 def dttm_decode(value):
     """Decode dttm value '20190404091926' to the datetime object."""
-    return datetime.datetime.strptime(value, "%Y%m%d%H%M%S")
+    if len(value) != 14 or not value.isdigit():
+        raise ValueError('Invalid dttm value %r' % value)
+    return datetime.datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                             int(value[8:10]), int(value[10:12]), int(value[12:14]))
 
 
-def validate_response(response, key):
-    response.raise_for_status()
+def _signed_extensions(extensions):
+    "Handlers of extensions (None for unknown ones) and ``(digest, signature)`` of the known ones"
+    handlers, signed = [], []
+    for one in extensions:
+        cls = get_extension_class(one.get('extension'))
+        if cls is not None:
+            signed.append((msg_digest(one, cls.keys), one['signature']))
+        handlers.append(cls)
+    return handlers, signed
 
-    data = response.json()
-    signature = data.pop('signature')
-    payload = OrderedDict()
 
-    for k in conf.RESPONSE_KEYS:
-        if k in data:
-            payload[k] = data[k]
+def _build_extensions(extensions, handlers, verified):
+    for cls, ok in zip((cls for cls in handlers if cls is not None), verified):
+        if not ok:
+            raise CsobVerifyError('Cannot verify %s extension response' % cls.extension)
+    return [UnknownExtension.from_payload(one) if cls is None else cls.from_payload(one)
+            for one, cls in zip(extensions, handlers)]
 
-    if not verify(payload, signature, key):
-        raise CsobVerifyError('Cannot verify response')
 
-    if "dttm" in payload:
-        payload["dttime"] = dttm_decode(payload["dttm"])
-
-    response.extensions = []
-    response.payload = payload
-
-    # extensions
-    if 'extensions' in data:
-        maskclnrp_keys = 'extension', 'dttm', 'maskedCln', 'expiration', 'longMaskedCln'
-        for one in data['extensions']:
-            if one['extension'] == 'maskClnRP':
-                o = OrderedDict()
-                for k in maskclnrp_keys:
-                    if k in one:
-                        o[k] = one[k]
-                if verify(o, one['signature'], key):
-                    response.extensions.append(o)
-                else:
-                    raise CsobVerifyError('Cannot verify masked card extension response')
-
-    return response
-
-
-PROVIDERS = (
-    (conf.CARD_PROVIDER_VISA, re.compile(r'^4\d{5}$')),
-    (conf.CARD_PROVIDER_AMEX, re.compile(r'^3[47]\d{4}$')),
-    (conf.CARD_PROVIDER_DINERS, re.compile(r'^3(?:0[0-5]|[68][0-9])[0-9]{4}$')),
-    (conf.CARD_PROVIDER_JCB, re.compile(r'^(?:2131|1800|35[0-9]{2})[0-9]{2}$')),
-    (conf.CARD_PROVIDER_MC, re.compile(r'^5[1-5][0-9]{4}|222[1-9][0-9]{2}|22[3-9][0-9]{4}|2[3-6][0-9]{5}|27[01][0-9]{4}|2720[0-9]{2}$')),
-)
-
-
-def get_card_provider(long_masked_number):
-    for provider_id, rx in PROVIDERS:
-        if rx.match(long_masked_number[:6]):
-            return provider_id, conf.CARD_PROVIDERS[provider_id]
-    return None, None
+def verify_extensions(extensions, key):
+    """
+    Verify signatures of extensions of verified response
+
+    :param extensions: list of extensions data
+    :return: list of extension objects, unknown extensions are ``UnknownExtension``
+    """
+    handlers, signed = _signed_extensions(extensions)
+    verified = metrics.timed('verify', key.verify_many, signed) if signed else []
+    return _build_extensions(extensions, handlers, verified)
+
+
+def validate_response(response, key, serializer=None, lazy_extensions=False):
+    """
+    Verify signatures of the response and its extensions
+
+    Signed values are read from the decoded response, it is not copied.
+
+    :param serializer: ``pycsob.serializers.Serializer`` decoding the body, best available by default
+    :param lazy_extensions: verify extensions on first access of ``extensions`` of the result
+    :return: ``PaymentResult``, it does not keep reference to ``response``
+    """
+    response.raise_for_status()
+    key = load_key(key)
+    if serializer is None:
+        serializer = get_serializer()
+
+    data = metrics.timed('decode', serializer.loads, response.content)
+    extensions = data.get('extensions') or []
+    signed = [(msg_digest(data, conf.RESPONSE_KEYS), data['signature'])]
+
+    if lazy_extensions and extensions:
+        if not metrics.timed('verify', key.verify_many, signed)[0]:
+            raise CsobVerifyError('Cannot verify response')
+        return PaymentResult.from_payload(data, pending_extensions=(key, extensions))
+
+    # response and all extensions are verified at once, crypto backend may run it in parallel
+    handlers, extension_signed = _signed_extensions(extensions)
+    verified = metrics.timed('verify', key.verify_many, signed + extension_signed)
+    if not verified[0]:
+        raise CsobVerifyError('Cannot verify response')
+    return PaymentResult.from_payload(data, _build_extensions(extensions, handlers, verified[1:]))
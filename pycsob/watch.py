@@ -0,0 +1,319 @@
+# coding: utf-8
+"""
+Polling of payment statuses
+
+``StatusWatcher`` tracks many payments with one thread, due payments are polled
+in batches by ``payment_status_many``::
+
+    watcher = StatusWatcher(client)
+    watcher.watch(pay_id, callback, delay=2, until={conf.PAYMENT_STATUS_WAITING})
+    watcher.start()
+
+Each payment is polled in interval given by its status, the interval grows while the status
+does not change. Watching stops on final status (``conf.PAYMENT_STATUSES_FINAL``) or status
+given in ``until``. Watchers of the same payId share one polling.
+
+``AsyncStatusWatcher`` polls with ``AsyncCsobClient`` and is an async iterator of changes::
+
+    async for change in AsyncStatusWatcher(client, pay_ids):
+        ...
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from . import conf
+
+log = logging.getLogger('pycsob')
+
+StatusChange = namedtuple('StatusChange', ('pay_id', 'old_status', 'status', 'response', 'error'))
+StatusChange.__doc__ = """
+Change of payment status, ``old_status`` is None for the first known status.
+When polling fails ``max_errors`` times in a row, watching ends with ``error`` set.
+"""
+
+# seconds between polls of payment in status, customer is paying in INIT and PROCESS
+INTERVALS = {
+    conf.PAYMENT_STATUS_INIT: 5.0,
+    conf.PAYMENT_STATUS_PROCESS: 2.0,
+    conf.PAYMENT_STATUS_CONFIRMED: 30.0,
+    conf.PAYMENT_STATUS_WAITING: 300.0,
+    conf.PAYMENT_STATUS_RECOGNIZED: 300.0,
+    conf.PAYMENT_STATUS_RETURN_WAITING: 300.0,
+}
+
+
+class _Watch(object):
+    __slots__ = ('pay_id', 'status', 'response', 'interval', 'due', 'errors', 'subscribers')
+
+    def __init__(self, pay_id, interval, due):
+        self.pay_id = pay_id
+        self.status = None
+        self.response = None
+        self.interval = interval
+        self.due = due
+        self.errors = 0
+        self.subscribers = []
+
+
+class StatusWatcher(object):
+
+    def __init__(self, client, intervals=None, backoff=1.5, max_interval=3600.0, max_errors=10,
+                 concurrency=10):
+        """
+        :param client: ``CsobClient``
+        :param intervals: dict of status -> seconds between polls, updates ``INTERVALS``
+        :param backoff: interval is multiplied by backoff after each poll without change
+        :param max_interval: max seconds between polls
+        :param max_errors: number of failed polls in a row after which watching ends
+        :param concurrency: number of concurrent ``payment_status`` calls
+        """
+        self.client = client
+        self.intervals = dict(INTERVALS)
+        self.intervals.update(intervals or {})
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.max_errors = max_errors
+        self.concurrency = concurrency
+        self._watches = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._watches)
+
+    def __contains__(self, pay_id):
+        return pay_id in self._watches
+
+    def watch(self, pay_id, callback=None, until=(), delay=0.0):
+        """
+        Start watching payment, it is polled by already running watch if there is one
+
+        :param callback: function called with ``StatusChange``, the first call reports current status
+        :param until: statuses ending the watch besides final ones
+        :param delay: seconds before the first poll
+        """
+        until = frozenset(until)
+        current = None
+        with self._lock:
+            w = self._watches.get(pay_id)
+            if w is None:
+                # interval of retries until the first status is known
+                w = self._watches[pay_id] = _Watch(pay_id, 1.0, 0.0)
+                self._schedule(w, delay)
+            elif w.status is not None:
+                # payment is watched already, current status is reported at once
+                current = StatusChange(pay_id, None, w.status, w.response, None)
+            if current is None or current.status not in until:
+                w.subscribers.append((callback, until))
+            self._wakeup.notify()
+        if current is not None and callback is not None:
+            callback(current)
+
+    def unwatch(self, pay_id):
+        with self._lock:
+            self._watches.pop(pay_id, None)
+
+    def _schedule(self, w, delay):
+        w.due = time.monotonic() + delay
+        heapq.heappush(self._queue, (w.due, next(self._seq), w.pay_id))
+
+    def _next_due(self):
+        "Monotonic time of the next poll or None, lock must be held"
+        while self._queue:
+            due, _, pay_id = self._queue[0]
+            w = self._watches.get(pay_id)
+            if w is not None and w.due == due:
+                return due
+            heapq.heappop(self._queue)
+        return None
+
+    def _pop_due(self):
+        "Pay_ids due to poll"
+        due_ids = []
+        now = time.monotonic()
+        with self._lock:
+            while True:
+                due = self._next_due()
+                if due is None or due > now:
+                    return due_ids
+                _, _, pay_id = heapq.heappop(self._queue)
+                due_ids.append(pay_id)
+
+    def _update(self, result):
+        "Process ``BatchResult`` of poll, return ``StatusChange`` and callbacks to call"
+        pay_id, response, error = result
+        if error is None and response.result_code != conf.RETURN_CODE_OK:
+            error = ValueError('Payment %s status: resultCode %s %s' % (
+                pay_id, response.result_code, response.result_message))
+        with self._lock:
+            w = self._watches.get(pay_id)
+            if w is None:
+                return None, ()
+            if error is not None:
+                w.errors += 1
+                log.warning('Polling of payment %s failed (%d): %s', pay_id, w.errors, error)
+                if w.errors >= self.max_errors:
+                    del self._watches[pay_id]
+                    return StatusChange(pay_id, w.status, w.status, w.response, error), w.subscribers
+                w.interval = min(self.max_interval, w.interval * self.backoff)
+                self._schedule(w, w.interval)
+                return None, ()
+
+            w.errors = 0
+            w.response = response
+            status = response.payment_status
+            if status == w.status:
+                w.interval = min(self.max_interval, w.interval * self.backoff)
+                self._schedule(w, w.interval)
+                return None, ()
+
+            change = StatusChange(pay_id, w.status, status, response, None)
+            w.status = status
+            subscribers = w.subscribers
+            if status in conf.PAYMENT_STATUSES_FINAL:
+                del self._watches[pay_id]
+            else:
+                w.subscribers = [one for one in subscribers if status not in one[1]]
+                if w.subscribers:
+                    w.interval = min(self.max_interval, self.intervals.get(status, self.max_interval))
+                    self._schedule(w, w.interval)
+                else:
+                    del self._watches[pay_id]
+            return change, subscribers
+
+    def _deliver(self, result, changes):
+        change, subscribers = self._update(result)
+        if change is None:
+            return
+        changes.append(change)
+        for callback, _ in subscribers:
+            if callback is None:
+                continue
+            try:
+                callback(change)
+            except Exception:
+                log.exception('Status callback of payment %s failed', change.pay_id)
+
+    def poll(self):
+        """
+        Poll due payments once
+
+        :return: list of ``StatusChange``
+        """
+        changes = []
+        due_ids = self._pop_due()
+        if due_ids:
+            for result in self.client.payment_status_many(due_ids, concurrency=self.concurrency,
+                                                          use_cache=False):
+                self._deliver(result, changes)
+        return changes
+
+    def run(self, wait=False):
+        """
+        Poll until all watches end or ``stop`` is called
+
+        :param wait: wait for new watches instead of returning when nothing is watched
+        """
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    due = self._next_due()
+                    if due is None:
+                        if not wait:
+                            return
+                        self._wakeup.wait()
+                        continue
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._wakeup.wait(delay)
+                else:
+                    return
+            self.poll()
+
+    def start(self):
+        "Run in daemon thread until ``stop`` is called"
+        self._stopped = False
+        self._thread = threading.Thread(target=self.run, args=(True,), name='pycsob-status-watcher',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class AsyncStatusWatcher(StatusWatcher):
+    """
+    Async iterator of ``StatusChange`` of watched payments, it ends when all watches end.
+    ``await run()`` polls without iterating, like ``StatusWatcher.run``.
+    """
+    # max seconds of sleep in ``run``, new watches and ``stop`` are noticed after it
+    WAKEUP = 1.0
+
+    def __init__(self, client, pay_ids=(), until=(), **kwargs):
+        """
+        :param client: ``AsyncCsobClient``
+        :param pay_ids: payments to watch
+        :param until: statuses ending the watch of ``pay_ids`` besides final ones
+        """
+        super(AsyncStatusWatcher, self).__init__(client, **kwargs)
+        self._changes = deque()
+        for pay_id in pay_ids:
+            self.watch(pay_id, until=until)
+
+    async def poll(self):
+        changes = []
+        due_ids = self._pop_due()
+        if due_ids:
+            async for result in self.client.payment_status_many(due_ids, concurrency=self.concurrency,
+                                                                use_cache=False):
+                self._deliver(result, changes)
+        return changes
+
+    async def run(self, wait=False):
+        """
+        Poll until all watches end or ``stop`` is called, changes are passed to callbacks only
+
+        :param wait: wait for new watches instead of returning when nothing is watched,
+                     they are noticed within ``WAKEUP`` seconds
+        """
+        while not self._stopped:
+            with self._lock:
+                due = self._next_due()
+            if due is None:
+                if not wait:
+                    return
+                await asyncio.sleep(self.WAKEUP)
+                continue
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(min(delay, self.WAKEUP))
+                continue
+            await self.poll()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._changes:
+            with self._lock:
+                due = self._next_due()
+            if due is None:
+                raise StopAsyncIteration
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            self._changes.extend(await self.poll())
+        return self._changes.popleft()
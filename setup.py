@@ -19,6 +19,12 @@ def parse_reqs(f='requirements.pip'):
 
 setup_requires = ['setuptools']
 install_requires, tests_require = parse_reqs(), parse_reqs('requirements-test.pip')
+extras_require = {
+    'async': ['httpx>=0.21'],
+    'http2': ['httpx[http2]>=0.21'],
+    'openssl': ['cryptography>=3.1'],
+    'orjson': ['orjson>=3'],
+}
 
 
 with open('README.rst') as readmefile:
@@ -64,6 +70,7 @@ setup(
     zip_safe=False,
     setup_requires=setup_requires,
     install_requires=install_requires,
+    extras_require=extras_require,
     tests_require=tests_require,
     cmdclass={'test': PyTest}
 )
@@ -0,0 +1,72 @@
+# coding: utf-8
+"""
+Test helpers, ``MockGateway`` test case and fake gateway responses
+"""
+import json
+import os
+from unittest import TestCase
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from pycsob import conf, utils
+from pycsob.client import CsobClient
+from pycsob.mock_gateway import MockGateway
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+PAY_ID = '34ae55eb69e2cBF'
+
+
+def mk_response(status=200, headers=None, payload=None, result_code=conf.RETURN_CODE_OK):
+    """
+    ``requests.Response`` of the gateway
+
+    :param payload: response data, signed status of payment ``PAY_ID`` by default
+    """
+    if payload is None:
+        payload = utils.mk_payload(KEY_PATH, pairs=(
+            ('payId', PAY_ID),
+            ('dttm', utils.dttm()),
+            ('resultCode', result_code),
+            ('resultMessage', conf.RESULT_STATUSES.get(result_code, 'OK')),
+            ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+        ))
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = json.dumps(payload).encode()
+    return response
+
+
+class GatewayTestCase(TestCase):
+    """
+    Tests against ``MockGateway`` started once for the class, ``self.c`` is a client of it
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(GatewayTestCase, cls).setUpClass()
+        cls.gateway = MockGateway(key=KEY_PATH, merchant_key=KEY_PATH).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.stop()
+        super(GatewayTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        self.c = self.client()
+
+    def client(self, **options):
+        return CsobClient('MERCHANT', self.gateway.base_url, KEY_PATH, KEY_PATH, **options)
+
+    def payment(self, client=None, **kwargs):
+        "Initialize payment, return its payId"
+        kwargs.setdefault('return_method', 'GET')
+        return (client or self.c).payment_init(42, 10000, 'http://shop.example.com/return', 'Order 42',
+                                               **kwargs).pay_id
+
+    def process(self, pay_id, client=None):
+        "Customer pays on the gateway and is redirected back, return data of the return"
+        r = requests.get((client or self.c).get_payment_process_url(pay_id), allow_redirects=False)
+        assert r.status_code == 303
+        return dict(parse_qsl(urlparse(r.headers['Location']).query))
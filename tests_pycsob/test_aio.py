@@ -0,0 +1,226 @@
+# coding: utf-8
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from unittest import TestCase
+from unittest.mock import patch
+
+import pytest
+
+from pycsob import conf, utils
+from pycsob.retry import CircuitBreaker
+
+from .gateway import GatewayTestCase
+
+httpx = pytest.importorskip('httpx')
+from pycsob.aio import AsyncCsobClient  # noqa: E402
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+PAY_ID = '34ae55eb69e2cBF'
+
+
+def gateway(request):
+    resp_payload = utils.mk_payload(KEY_PATH, pairs=(
+        ('payId', PAY_ID),
+        ('dttm', utils.dttm()),
+        ('resultCode', conf.RETURN_CODE_OK),
+        ('resultMessage', request.method),
+        ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+    ))
+    status = 503 if request.url.path.startswith('/error') else 200
+    return httpx.Response(status, content=json.dumps(resp_payload))
+
+
+class AsyncCsobClientTests(TestCase):
+
+    def setUp(self):
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            return gateway(request)
+
+        self.c = AsyncCsobClient(merchant_id='MERCHANT',
+                                 base_url='https://gw.cz/api/v1.7/',
+                                 private_key_file=KEY_PATH,
+                                 csob_pub_key_file=KEY_PATH,
+                                 transport=httpx.MockTransport(handler))
+
+    def run_async(self, coro):
+        # asyncio.run is not in Python 3.6
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_payment_status(self):
+        async def main():
+            async with self.c:
+                return await self.c.payment_status(PAY_ID)
+
+        out = self.run_async(main())
+        assert out.payload['paymentStatus'] == conf.PAYMENT_STATUS_WAITING
+        assert out.payload['resultMessage'] == 'GET'
+        request, = self.requests
+        assert request.url.path.startswith('/api/v1.7/payment/status/MERCHANT/%s/' % PAY_ID)
+
+    def test_cancelled_trial_call(self):
+        async def slow(request):
+            await asyncio.sleep(1)
+            return gateway(request)
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        c = AsyncCsobClient('MERCHANT', 'https://gw.cz/api/v1.7/', KEY_PATH, KEY_PATH,
+                            transport=httpx.MockTransport(slow), circuit_breaker=breaker)
+
+        async def main():
+            async with c:
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(c.echo(), 0.1)
+                assert breaker.state == breaker.OPEN
+                c.transport = None
+                c._client = httpx.AsyncClient(transport=httpx.MockTransport(gateway))
+                return await c.echo()
+
+        assert self.run_async(main()).ok
+        assert breaker.state == breaker.CLOSED
+
+    def test_payment_close_body(self):
+        out = self.run_async(self.c.payment_close(PAY_ID, total_amount=100))
+        assert out.payload['resultMessage'] == 'PUT'
+        body = json.loads(self.requests[0].content.decode())
+        assert body['payId'] == PAY_ID
+        assert body['totalAmount'] == 100
+        assert utils.verify(OrderedDict((k, body[k]) for k in body if k != 'signature'),
+                            body['signature'], KEY_PATH)
+
+    def test_concurrent_calls(self):
+        async def main():
+            return await asyncio.gather(*[self.c.payment_status(PAY_ID) for _ in range(20)])
+
+        out = self.run_async(main())
+        assert len(out) == 20
+        assert len(self.requests) == 20
+
+    def test_http_status_raised(self):
+        self.c.base_url = 'https://gw.cz/error/'
+        with pytest.raises(httpx.HTTPStatusError):
+            self.run_async(self.c.echo())
+
+    def test_pool_stats_close(self):
+        async def main():
+            await asyncio.gather(*[self.c.echo() for _ in range(3)])
+            stats = self.c.pool_stats()
+            await self.c.close()
+            return stats
+
+        stats = self.run_async(main())
+        assert (stats.requests, stats.connections, stats.idle, stats.in_use) == (3, 0, 0, 0)
+        assert self.c._session.is_closed
+        with patch.object(self.c._session, '_transport', object()):  # pool of other httpx version
+            assert self.c.pool_stats().idle == 0
+        self.c.close()  # without running loop
+
+    def test_get_payment_process_url_is_sync(self):
+        url = self.c.get_payment_process_url(PAY_ID)
+        assert url.startswith('https://gw.cz/api/v1.7/payment/process/MERCHANT/%s/' % PAY_ID)
+
+    def test_payment_status_many(self):
+        statuses = iter([429, 200, 200, 200])
+
+        def handler(request):
+            status = next(statuses)
+            if status == 429:
+                return httpx.Response(429, headers={'Retry-After': '0'})
+            return gateway(request)
+
+        self.c._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async def main():
+            results = []
+            async for r in self.c.payment_status_many(['a', 'b', 'c'], concurrency=2):
+                results.append(r)
+            return results
+
+        out = self.run_async(main())
+        assert len(out) == 3
+        assert all(r.error is None for r in out)
+        assert sorted(r.pay_id for r in out) == ['a', 'b', 'c']
+
+    def test_metrics(self):
+        from pycsob.metrics import CallbackSink
+        ops = []
+        self.c.metrics_sink = CallbackSink(ops.append)
+
+        async def main():
+            return await asyncio.gather(*[self.c.payment_status(PAY_ID) for _ in range(5)])
+
+        self.run_async(main())
+        assert len(ops) == 5
+        # mock transport signs responses in the call, its key loading is measured too
+        assert all({'build', 'sign', 'http', 'decode', 'verify'} <= set(op.timings) for op in ops)
+        assert all(op.status_code == 200 and op.result_code == conf.RETURN_CODE_OK for op in ops)
+
+    def test_crypto_backend_off_loop(self):
+        import threading
+        from pycsob.crypto import CryptoBackend
+        from pycsob.metrics import CallbackSink
+        threads = set()
+
+        class Backend(CryptoBackend):
+            def sign(self, key, digest):
+                threads.add(threading.get_ident())
+                return super(Backend, self).sign(key, digest)
+
+            def verify_many(self, key, items):
+                threads.add(threading.get_ident())
+                return super(Backend, self).verify_many(key, items)
+
+        ops = []
+        c = AsyncCsobClient('MERCHANT', 'https://gw.cz/api/v1.7/', KEY_PATH, KEY_PATH, crypto_backend=Backend(),
+                            transport=httpx.MockTransport(gateway), metrics_sink=CallbackSink(ops.append))
+
+        async def main():
+            async with c:
+                return await c.payment_close(PAY_ID)
+
+        assert self.run_async(main()).ok
+        assert threads and threading.get_ident() not in threads
+        op, = ops
+        assert {'build', 'sign', 'verify'} <= set(op.timings)
+
+    def test_payment_status_cache(self):
+        from pycsob.cache import MemoryCache
+        self.c.cache = MemoryCache()
+
+        async def main():
+            return [await self.c.payment_status(PAY_ID) for _ in range(3)]
+
+        out = self.run_async(main())
+        assert len(self.requests) == 1
+        assert all(r.payload == out[0].payload for r in out)
+        assert out[2].pay_id == PAY_ID
+
+
+class AsyncPoolTests(GatewayTestCase):
+
+    def test_pool_stats(self):
+        c = AsyncCsobClient('MERCHANT', self.gateway.base_url, KEY_PATH, KEY_PATH)
+
+        async def main():
+            for _ in range(3):
+                await c.echo()
+            await asyncio.gather(*[c.echo() for _ in range(3)])
+            return c.pool_stats()
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        stats = loop.run_until_complete(main())
+        assert (stats.requests, stats.connections, stats.idle, stats.in_use, stats.peak_in_use) == (6, 3, 3, 0, 3)
+        assert stats.reuse_rate == 0.5
+        with c:  # closes connections in the loop of the client
+            pass
+        assert c.pool_stats().idle == 0
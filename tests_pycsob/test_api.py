@@ -1,6 +1,7 @@
 # coding: utf-8
 import os
 import datetime
+import hashlib
 import json
 import pytest
 from collections import OrderedDict
@@ -162,6 +163,13 @@ class CsobClientTests(TestCase):
             self.c.echo(method='POST')
         assert '500 Server Error' in str(excinfo.value)
 
+    def test_headers_not_shared(self):
+        other = CsobClient('MERCHANT', 'https://gw.cz', KEY_PATH, KEY_PATH)
+        self.c._client.headers['X-Test'] = '1'
+        assert 'X-Test' not in other._client.headers
+        assert 'X-Test' not in conf.HEADERS
+        assert other._client.headers['User-Agent'] == conf.HEADERS['user-agent']
+
     def test_gateway_return_retype(self):
         resp_payload = utils.mk_payload(KEY_PATH, pairs=(
             ('resultCode', str(conf.RETURN_CODE_PARAM_INVALID)),
@@ -185,6 +193,23 @@ class CsobClientTests(TestCase):
             ('merchantData', b'Foo')
         ]))
 
+    def test_msg_digest(self):
+        payloads = [
+            OrderedDict(),
+            OrderedDict([('merchantId', 'M'), ('closePayment', True), ('ttlSec', 600), ('x', False)]),
+            OrderedDict([('description', 'Příliš žluťoučký kůň'), ('cart', []), ('amount', 1.5)]),
+            OrderedDict([('orderNo', '1'), ('cart', [
+                OrderedDict([('name', 'Nákup'), ('quantity', 1), ('amount', 100)]),
+                OrderedDict([('name', 'Poštovné'), ('quantity', 1), ('amount', 0)]),
+            ]), ('description', 'X')]),
+        ]
+        for payload in payloads:
+            assert utils.msg_digest(payload) == hashlib.sha1(utils.mk_msg_for_sign(payload)).digest()
+
+        decoded = {'signature': 'x', 'resultCode': 0, 'dttm': '20190502161426', 'payId': PAY_ID}
+        assert utils.msg_digest(decoded, conf.RESPONSE_KEYS) == utils.msg_digest(OrderedDict([
+            ('payId', PAY_ID), ('dttm', '20190502161426'), ('resultCode', 0)]))
+
     def test_get_card_provider(self):
         fn = utils.get_card_provider
 
@@ -260,6 +285,13 @@ class CsobClientTests(TestCase):
             ('dttime', self.dttime),
         ]))
 
+    def test_get_payment_process_urls(self):
+        pay_ids = ['%015x' % i for i in range(7)] + ['a b/c']
+        expected = [(pay_id, self.c.get_payment_process_url(pay_id)) for pay_id in pay_ids]
+        assert list(self.c.get_payment_process_urls(pay_ids)) == expected
+        assert list(self.c.get_payment_process_urls(iter(pay_ids), chunk_size=2, workers=3)) == expected
+        assert list(self.c.get_payment_process_urls([])) == []
+
     def test_dttm_decode(self):
         self.assertEqual(utils.dttm_decode("20190502161426"), self.dttime)
 
@@ -279,7 +311,7 @@ class CsobClientTests(TestCase):
             self.c.payment_init(42, '100', 'http://example.com', 'Konference Internet a Technologie 19')
 
         self.assertEqual(mock_mk_payload.mock_calls, [
-            call(KEY_PATH, pairs=(
+            call(self.c.key, pairs=(
                 ('merchantId', 'MERCHANT'),
                 ('orderNo', '42'),
                 ('dttm', '20190502161426'),
@@ -0,0 +1,60 @@
+# coding: utf-8
+import os
+from collections import OrderedDict
+from unittest import TestCase
+
+import pytest
+
+from pycsob import backends, utils
+from pycsob.keys import CsobKey
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+PAYLOAD = OrderedDict([
+    ('merchantId', 'MERCHANT'),
+    ('orderNo', '42'),
+    ('dttm', '20190502161426'),
+    ('closePayment', True),
+    ('cart', [OrderedDict([('name', 'Příliš žluťoučký'), ('quantity', 1), ('amount', 100)])]),
+    ('description', 'Příliš žluťoučký kůň úpěl ďábelské ódy.'),
+])
+
+
+class RSABackendTests(TestCase):
+
+    def setUp(self):
+        pytest.importorskip('cryptography')
+
+    def test_identical_signatures(self):
+        openssl = CsobKey(KEY_PATH, rsa_backend='openssl')
+        pycryptodome = CsobKey(KEY_PATH, rsa_backend='pycryptodome')
+        signature = utils.sign(PAYLOAD, openssl)
+        assert signature == utils.sign(PAYLOAD, pycryptodome)
+        assert utils.verify(PAYLOAD, signature, pycryptodome)
+        assert utils.verify(PAYLOAD, signature, openssl)
+        other = utils.sign(OrderedDict([('merchantId', 'OTHER')]), openssl)
+        assert not utils.verify(PAYLOAD, other, openssl)
+        assert not utils.verify(PAYLOAD, other, pycryptodome)
+
+    def test_public_key(self):
+        private = CsobKey(KEY_PATH, rsa_backend='pycryptodome')
+        public_pem = private.key.publickey().export_key()
+        signature = utils.sign(PAYLOAD, private)
+        for name in ('openssl', 'pycryptodome'):
+            public = CsobKey(public_pem, rsa_backend=name)
+            assert utils.verify(PAYLOAD, signature, public)
+            assert b'PUBLIC KEY' in public.pem
+            own = CsobKey(CsobKey(KEY_PATH, rsa_backend=name).public_pem, rsa_backend=name)
+            assert b'PRIVATE' not in own.pem and utils.verify(PAYLOAD, signature, own)
+            assert own.public_pem == own.pem
+
+    def test_key_objects(self):
+        openssl = CsobKey(KEY_PATH, rsa_backend='openssl')
+        pycryptodome = CsobKey(KEY_PATH, rsa_backend='pycryptodome')
+        assert CsobKey(pycryptodome.key, rsa_backend='openssl').sign(b'x') == openssl.sign(b'x')
+        assert CsobKey(openssl.key, rsa_backend='openssl').sign(b'x') == openssl.sign(b'x')
+
+    def test_get_backend(self):
+        assert backends.get_backend().name == 'openssl'
+        assert backends.get_backend('pycryptodome').name == 'pycryptodome'
+        with pytest.raises(ValueError):
+            backends.get_backend('foo')
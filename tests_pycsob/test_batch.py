@@ -0,0 +1,87 @@
+# coding: utf-8
+import os
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from requests import HTTPError, Response
+
+from pycsob import batch
+from pycsob.client import CsobClient
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+
+
+def http_error(status, retry_after=None):
+    response = Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return HTTPError(response=response)
+
+
+class RunBatchTests(TestCase):
+
+    def test_results_and_errors(self):
+        def func(item):
+            if item % 3 == 0:
+                raise ValueError(item)
+            return item * 2
+
+        results = {r.pay_id: r for r in batch.run_batch(func, range(10), concurrency=3)}
+        assert sorted(results) == list(range(10))
+        assert results[4].response == 8
+        assert results[4].error is None
+        assert isinstance(results[6].error, ValueError)
+        assert results[6].response is None
+
+    def test_input_consumed_lazily(self):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        it = batch.run_batch(lambda x: x, items(), concurrency=2)
+        next(it)
+        assert len(consumed) <= 5
+        assert len(list(it)) == 99
+
+    def test_retry_on_429(self):
+        lock = threading.Lock()
+        calls = []
+
+        def func(item):
+            with lock:
+                calls.append(item)
+                if len(calls) == 1:
+                    raise http_error(429, retry_after='0')
+            return item
+
+        out = list(batch.run_batch(func, ['a'], max_retries=2))
+        assert out == [batch.BatchResult('a', 'a', None)]
+        assert calls == ['a', 'a']
+
+    def test_retry_limit(self):
+        def func(item):
+            raise http_error(429)
+
+        with patch('pycsob.batch.time.sleep') as sleep:
+            result, = batch.run_batch(func, ['a'], max_retries=2, backoff=0.5)
+        assert batch.status_code(result.error) == 429
+        assert sleep.call_count == 2
+
+    def test_retry_after(self):
+        assert batch.retry_after(http_error(429, retry_after='7'), 1) == 7
+        assert batch.retry_after(http_error(429, retry_after='later'), 1) == 1
+        assert batch.retry_after(ValueError(), 3) == 3
+
+
+class PaymentStatusManyTests(TestCase):
+
+    def test_payment_status_many(self):
+        c = CsobClient('MERCHANT', 'https://gw.cz', KEY_PATH, KEY_PATH)
+        with patch.object(c, 'payment_status', side_effect=lambda pay_id: pay_id.upper()):
+            out = sorted(r.response for r in c.payment_status_many(['a', 'b', 'c'], concurrency=2))
+        assert out == ['A', 'B', 'C']
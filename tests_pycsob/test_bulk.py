@@ -0,0 +1,77 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import requests
+
+from pycsob import bulk, conf
+from pycsob.bulk import BulkExecutor, FileJournal, SQLiteJournal
+
+from .gateway import GatewayTestCase
+
+
+class BulkExecutorTests(GatewayTestCase):
+
+    def setUp(self):
+        super(BulkExecutorTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def confirmed_payment(self):
+        pay_id = self.payment(close_payment=False)
+        self.process(pay_id)
+        return pay_id
+
+    def test_execute(self):
+        pay_ids = [self.confirmed_payment() for _ in range(4)]
+        items = [('close', pay_id, None) for pay_id in pay_ids[:3]] + [
+            ('reverse', pay_ids[3], None), ('refund', pay_ids[3], 100), ('cancel', pay_ids[0], None)]
+        progress = []
+        executor = BulkExecutor(self.c, concurrency=3, rate=1000, progress=progress.append)
+        results = {(r.operation, r.pay_id): r for r in executor.run(items)}
+
+        assert [results['close', pay_id].outcome for pay_id in pay_ids[:3]] == [bulk.OK] * 3
+        assert results['reverse', pay_ids[3]].payment_status == conf.PAYMENT_STATUS_REVERSED
+        refund = results['refund', pay_ids[3]]
+        assert (refund.outcome, refund.result_code) == (bulk.FAILED, conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE)
+        assert isinstance(results['cancel', pay_ids[0]].error, ValueError)
+        assert progress[-1][:4] == (6, 4, 2, 0)
+        assert '6 done (4 ok, 2 failed, 0 skipped)' in str(progress[-1])
+
+    def test_resume(self):
+        for journal in (FileJournal(os.path.join(self.tmpdir, 'journal')),
+                        SQLiteJournal(os.path.join(self.tmpdir, 'journal.sqlite'))):
+            pay_ids = [self.confirmed_payment() for _ in range(3)]
+            items = [('close', pay_id, None) for pay_id in pay_ids]
+            close = self.c.payment_close
+            with patch.object(self.c, 'payment_close', side_effect=[close(pay_ids[0]), ValueError('crash')]):
+                summary = BulkExecutor(self.c, journal, concurrency=1).execute(items[:2])
+            assert summary[:4] == (2, 1, 1, 0)
+
+            summary = BulkExecutor(self.c, journal).execute(items)
+            assert summary[:4] == (2, 2, 0, 1)
+            assert set(journal.load().values()) == {bulk.OK}
+            journal.close()
+
+    def test_ambiguous_failure_verified(self):
+        pay_id = self.confirmed_payment()
+        close = self.c.payment_close
+
+        def timeout(*args, **kwargs):
+            close(*args, **kwargs)
+            raise requests.Timeout('read timeout')
+
+        with patch.object(self.c, 'payment_close', side_effect=timeout):
+            result, = BulkExecutor(self.c).run([('close', pay_id, None)])
+        assert (result.outcome, result.payment_status) == (bulk.VERIFIED, conf.PAYMENT_STATUS_WAITING)
+        assert isinstance(result.error, requests.Timeout)
+
+        # already closed by the previous run
+        result, = BulkExecutor(self.c).run([('close', pay_id, None)])
+        assert result.outcome == bulk.VERIFIED
+
+        with patch.object(self.c, 'payment_reverse', side_effect=requests.ConnectionError):
+            result, = BulkExecutor(self.c).run([('reverse', pay_id, None)])
+        assert (result.outcome, result.payment_status) == (bulk.FAILED, conf.PAYMENT_STATUS_WAITING)
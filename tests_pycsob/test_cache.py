@@ -0,0 +1,163 @@
+# coding: utf-8
+from unittest import TestCase
+from unittest.mock import patch
+
+from pycsob import conf, utils
+from pycsob.cache import MemoryCache, RedisCache
+from pycsob.results import MaskedCardExtension, PaymentResult
+from pycsob.returns import CsobReplayError, ReturnVerifier
+
+from .gateway import GatewayTestCase, KEY_PATH
+
+
+class FakeRedis(object):
+    "Subset of ``redis.Redis`` used by ``RedisCache``, expiration in ``now`` milliseconds"
+
+    def __init__(self):
+        self.data = {}
+        self.now = 0
+
+    def get(self, name):
+        value, expires = self.data.get(name, (None, None))
+        if expires is not None and expires <= self.now:
+            del self.data[name]
+            return None
+        return value
+
+    def set(self, name, value, px=None, nx=False):
+        if nx and self.get(name) is not None:
+            return None
+        self.data[name] = value, None if px is None else self.now + px
+        return True
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+
+def return_data(status=conf.PAYMENT_STATUS_WAITING):
+    return dict(utils.mk_payload(KEY_PATH, pairs=(
+        ('payId', 'a'),
+        ('dttm', '20190502161426'),
+        ('resultCode', '0'),
+        ('resultMessage', 'OK'),
+        ('paymentStatus', str(status)),
+    )))
+
+
+class MemoryCacheTests(TestCase):
+
+    def test_lru(self):
+        cache = MemoryCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+    @patch('pycsob.cache.time.monotonic')
+    def test_ttl(self, monotonic):
+        monotonic.return_value = 100.0
+        cache = MemoryCache()
+        cache.set('a', 1, ttl=10)
+        cache.set('b', 2)
+        assert not cache.add('a', 3)
+        monotonic.return_value = 110.0
+        assert (cache.get('a'), cache.get('b')) == (None, 2)
+        assert cache.add('a', 3)
+        assert cache.get('a') == 3
+
+    def test_result_ttl(self):
+        cache = MemoryCache(ttl=30)
+        assert cache.result_ttl({'paymentStatus': conf.PAYMENT_STATUS_WAITING}) == 30
+        assert cache.result_ttl({'paymentStatus': conf.PAYMENT_STATUS_REVERSED}) is None
+
+
+class RedisCacheTests(TestCase):
+
+    def test_get_set_add(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl=5)
+        cache.set('a', {'x': b'1'}, ttl=1.5)
+        assert redis.data['pycsob:a'][1] == 1500
+        assert cache.get('a') == {'x': b'1'}
+        assert not cache.add('a', 2)
+        redis.now = 1500
+        assert cache.get('a') is None
+        assert cache.add('a', 2)
+        assert cache.get('a') == 2
+        cache.delete('a')
+        assert cache.get('a') is None
+
+    def test_final_status_kept(self):
+        redis = FakeRedis()
+        cache = RedisCache(redis, ttl=5)
+        returned = PaymentResult('a', result_code=0, payment_status=conf.PAYMENT_STATUS_RETURNED,
+                                 extensions=[MaskedCardExtension(masked_cln='****1234')])
+        cache.set_status('a', returned)
+        cache.set_status('b', PaymentResult('b', result_code=0, payment_status=conf.PAYMENT_STATUS_WAITING))
+        cache.set_status('c', PaymentResult('c', result_code=conf.RETURN_CODE_PAYMENT_NOT_FOUND))
+        assert redis.data['pycsob:status:a'][1] is None
+        assert redis.data['pycsob:status:b'][1] == 5000
+        assert cache.get_status('a') == returned
+        assert cache.get_status('c') is None
+
+
+class ReturnCacheTests(TestCase):
+
+    def test_repeated_return_not_verified(self):
+        verifier = ReturnVerifier(KEY_PATH, cache=MemoryCache())
+        data = return_data()
+        first = verifier.verify(data)
+        with patch.object(verifier.pubkey, 'verify_digest') as verify_digest:
+            assert verifier.verify(data) == first
+            results = verifier.verify_many([data])
+        assert not verify_digest.called
+        assert results[0].data == first
+
+    def test_reject_replays(self):
+        verifier = ReturnVerifier(KEY_PATH, cache=RedisCache(FakeRedis()), reject_replays=True)
+        data = return_data(conf.PAYMENT_STATUS_CANCELLED)
+        verifier.verify(data)
+        with self.assertRaises(CsobReplayError):
+            verifier.verify(data)
+        result, = verifier.verify_many([data])
+        assert isinstance(result.error, CsobReplayError)
+
+
+class ClientCacheTests(GatewayTestCase):
+
+    def test_payment_status(self):
+        c = self.client(cache=MemoryCache(ttl=0))
+        pay_id = self.payment(c, close_payment=False)
+        data = self.process(pay_id, c)
+        assert c.gateway_return(data) == c.gateway_return(data)
+
+        count = self.gateway.requests_count
+        assert c.payment_status(pay_id).payload['paymentStatus'] == conf.PAYMENT_STATUS_CONFIRMED
+        assert c.payment_status(pay_id).payload['paymentStatus'] == conf.PAYMENT_STATUS_CONFIRMED
+        assert self.gateway.requests_count == count + 2
+
+        c.payment_reverse(pay_id)
+        count = self.gateway.requests_count
+        first = c.payment_status(pay_id)
+        cached = c.payment_status(pay_id)
+        assert self.gateway.requests_count == count + 1
+        assert cached.payload == first.payload
+        assert cached == first
+        assert cached.payload['paymentStatus'] == conf.PAYMENT_STATUS_REVERSED
+
+    def test_operation_drops_cached_status(self):
+        c = self.client(cache=MemoryCache(ttl=60))
+        pay_id = self.payment(c, close_payment=False)
+        assert c.payment_status(pay_id).payment_status == conf.PAYMENT_STATUS_INIT
+        c.gateway_return(self.process(pay_id, c))
+        assert c.payment_status(pay_id).payment_status == conf.PAYMENT_STATUS_CONFIRMED
+
+        assert c.payment_close(pay_id).payment_status == conf.PAYMENT_STATUS_WAITING
+        assert c.payment_status(pay_id).payment_status == conf.PAYMENT_STATUS_WAITING
+
+        count = self.gateway.requests_count
+        c.payment_status(pay_id)
+        c.payment_status(pay_id, use_cache=False)
+        assert self.gateway.requests_count == count + 1
@@ -0,0 +1,90 @@
+# coding: utf-8
+import re
+import threading
+from collections import OrderedDict
+from unittest import TestCase
+
+from pycsob import cards, conf, utils
+
+# regular expressions used before the lookup table, fixed Diners and MasterCard 2-series
+REGEXES = (
+    (conf.CARD_PROVIDER_VISA, re.compile(r'^4\d{5}$')),
+    (conf.CARD_PROVIDER_AMEX, re.compile(r'^3[47]\d{4}$')),
+    (conf.CARD_PROVIDER_DINERS, re.compile(r'^3(?:0[0-5]|[68][0-9])[0-9]{3}$')),
+    (conf.CARD_PROVIDER_JCB, re.compile(r'^(?:2131|1800|35[0-9]{2})[0-9]{2}$')),
+    (conf.CARD_PROVIDER_MC, re.compile(
+        r'^(?:5[1-5][0-9]{4}|222[1-9][0-9]{2}|22[3-9][0-9]{3}|2[3-6][0-9]{4}|27[01][0-9]{3}|2720[0-9]{2})$')),
+)
+
+
+def regex_provider(number):
+    for provider_id, rx in REGEXES:
+        if rx.match(number[:6]):
+            return provider_id
+    return None
+
+
+class CardProviderTests(TestCase):
+
+    def test_same_as_regexes(self):
+        for prefix in range(10000):
+            for suffix in ('00', '99'):
+                number = '%04d%s****1234' % (prefix, suffix)
+                assert cards.get_card_provider(number)[0] == regex_provider(number), number
+
+    def test_get_card_provider(self):
+        assert utils.get_card_provider('423451****1234') == (conf.CARD_PROVIDER_VISA, 'Visa')
+        assert utils.get_card_provider('272099****1234') == (conf.CARD_PROVIDER_MC, 'MasterCard')
+        assert utils.get_card_provider('272100****1234') == (None, None)
+        assert utils.get_card_provider('4234**') == (None, None)
+        assert utils.get_card_provider('') == (None, None)
+
+    def test_get_card_providers(self):
+        numbers = ['423451****1234', '550000****0000', '423451****9999', 'x', '601100****0000']
+        assert utils.get_card_providers(numbers) == [
+            (conf.CARD_PROVIDER_VISA, 'Visa'), (conf.CARD_PROVIDER_MC, 'MasterCard'),
+            (conf.CARD_PROVIDER_VISA, 'Visa'), (None, None), (None, None)]
+
+    def test_register(self):
+        names, ranges = dict(conf.CARD_PROVIDERS), OrderedDict(conf.CARD_PROVIDER_RANGES)
+        self.addCleanup(cards.rebuild)
+        self.addCleanup(conf.CARD_PROVIDER_RANGES.update, ranges)
+        self.addCleanup(conf.CARD_PROVIDER_RANGES.clear)
+        self.addCleanup(conf.CARD_PROVIDERS.update, names)
+        self.addCleanup(conf.CARD_PROVIDERS.clear)
+
+        cards.register_card_provider(60, 'Discover', [('6011', '6011'), ('644', '659')])
+        cards.register_card_provider(62, 'UnionPay', [('62', '62')])
+        cards.register_card_provider(99, 'Electron', [('4175', '4175')])
+        assert utils.get_card_providers(['601100****0000', '622126****0000', '417500****0000', '417600****0000']) == [
+            (60, 'Discover'), (62, 'UnionPay'), (99, 'Electron'), (conf.CARD_PROVIDER_VISA, 'Visa')]
+
+    def test_register_concurrent_lookup(self):
+        names, ranges = dict(conf.CARD_PROVIDERS), OrderedDict(conf.CARD_PROVIDER_RANGES)
+        self.addCleanup(cards.rebuild)
+        self.addCleanup(conf.CARD_PROVIDER_RANGES.update, ranges)
+        self.addCleanup(conf.CARD_PROVIDER_RANGES.clear)
+        self.addCleanup(conf.CARD_PROVIDERS.update, names)
+        self.addCleanup(conf.CARD_PROVIDERS.clear)
+        numbers = ['417500****0000', '510000****0000', '423451****0000']
+        allowed = [{conf.CARD_PROVIDER_VISA, 99}, {conf.CARD_PROVIDER_MC, 99}, {conf.CARD_PROVIDER_VISA}]
+        done = threading.Event()
+        errors = []
+
+        def lookup():
+            while not done.is_set():
+                found = [cards.get_card_provider(number)[0] for number in numbers]
+                if not all(one in expected for one, expected in zip(found, allowed)):
+                    errors.append(found)
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(200):
+                cards.register_card_provider(99, 'Electron', [('5100', '5100')] if i % 2 else [('4175', '4175')])
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        assert errors == []
@@ -0,0 +1,35 @@
+# coding: utf-8
+import os
+from hashlib import sha1
+from unittest import TestCase
+
+from pycsob import utils
+from pycsob.crypto import CryptoBackend, ProcessPoolBackend
+from pycsob.keys import CsobKey
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+DIGESTS = [sha1(('MERCHANT|%d|20190502161426' % i).encode()).digest() for i in range(20)]
+
+
+class CryptoBackendTests(TestCase):
+
+    def test_inline_backend(self):
+        key = CsobKey(KEY_PATH, crypto_backend=CryptoBackend())
+        signatures = key.sign_many(DIGESTS)
+        assert signatures == [CsobKey(KEY_PATH).sign_digest(digest) for digest in DIGESTS]
+        assert all(key.verify_many(list(zip(DIGESTS, signatures))))
+
+    def test_process_pool_backend(self):
+        with ProcessPoolBackend(max_workers=2, chunksize=4) as backend:
+            key = CsobKey(KEY_PATH, crypto_backend=backend)
+            inline = CsobKey(KEY_PATH)
+
+            signatures = key.sign_many(DIGESTS)
+            assert signatures == [inline.sign_digest(digest) for digest in DIGESTS]
+            assert key.sign_digest(DIGESTS[0]) == signatures[0]
+            assert key.verify_digest(DIGESTS[0], signatures[0])
+            assert key.verify_many(list(zip(DIGESTS, signatures[1:] + signatures[:1]))) == [False] * len(DIGESTS)
+            assert key.verify_many([]) == []
+
+            payload = utils.mk_payload(key, pairs=(('merchantId', 'MERCHANT'), ('dttm', '20190502161426')))
+            assert utils.verify(payload, payload.pop('signature'), inline)
@@ -0,0 +1,59 @@
+# coding: utf-8
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEY_PATH = os.path.join(ROOT, 'tests_pycsob', 'fixtures', 'test.key')
+HEAVY = {'requests', 'urllib3', 'Crypto', 'cryptography', 'httpx'}
+
+
+def run(code):
+    "Run code in new interpreter, return ``{module: cumulative import time in us}`` and stdout"
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, env=env, cwd=ROOT, check=True, universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times, proc.stdout
+
+
+class ImportTimeTests(TestCase):
+
+    def test_light_modules(self):
+        times, _ = run('import pycsob.client, pycsob.utils, pycsob.cards, pycsob.returns, pycsob.pool')
+        assert not HEAVY & {name.split('.')[0] for name in times}
+        # the client module must stay cheaper than the HTTP stack it loads lazily
+        assert times['pycsob.client'] < run('import requests')[0]['requests']
+
+    def test_client_loads_stack_on_use(self):
+        code = '\n'.join((
+            'import sys',
+            'from pycsob.client import CsobClient',
+            'c = CsobClient("MERCHANT", "https://gw.cz/", %r, %r)' % (KEY_PATH, KEY_PATH),
+            'print(sorted({m.split(".")[0] for m in sys.modules} & %r))' % HEAVY,
+            'c.get_payment_process_url("34ae55eb69e2cBF")',
+            'c._client',
+            'print(sorted({m.split(".")[0] for m in sys.modules} & {"requests"}))',
+        ))
+        _, out = run(code)
+        assert out.splitlines() == ['[]', "['requests']"]
+
+    def test_http_adapter_alias(self):
+        from pycsob import client, transport
+        with self.assertWarns(DeprecationWarning):
+            from pycsob.client import HTTPAdapter
+
+        class Adapter(HTTPAdapter):
+            pass
+
+        adapter = Adapter(pool_maxsize=3)
+        assert HTTPAdapter is transport.HTTPAdapter
+        assert isinstance(adapter, HTTPAdapter) and adapter._pool_maxsize == 3
+        with self.assertRaises(AttributeError):
+            client.NoSuchName
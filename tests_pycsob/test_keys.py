@@ -0,0 +1,80 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from Crypto.PublicKey import RSA
+
+from pycsob import utils
+from pycsob.keys import CsobKey, load_key
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+PAIRS = (
+    ('merchantId', 'MERCHANT'),
+    ('dttm', '20190502161426'),
+)
+
+
+class CsobKeyTests(TestCase):
+
+    def test_key_sources(self):
+        with open(KEY_PATH, 'rb') as fp:
+            pem = fp.read()
+        for source in (KEY_PATH, pem, pem.decode(), RSA.importKey(pem)):
+            payload = utils.mk_payload(CsobKey(source), pairs=PAIRS)
+            assert utils.verify(payload, payload.pop('signature'), KEY_PATH)
+
+    def test_key_parsed_once(self):
+        key = CsobKey(KEY_PATH)
+        key.sign(b'message')
+        with patch.object(key.rsa_backend, 'load_key') as import_key:
+            for _ in range(3):
+                payload = utils.mk_payload(key, pairs=PAIRS)
+                assert utils.verify(payload, payload.pop('signature'), key)
+        import_key.assert_not_called()
+
+    def test_load_key(self):
+        key = CsobKey(KEY_PATH)
+        assert load_key(key) is key
+        assert load_key(KEY_PATH).path == KEY_PATH
+
+    def test_reload_on_mtime_change(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'rotated.key')
+        shutil.copy(KEY_PATH, path)
+
+        key = CsobKey(path)
+        old = key.key
+        with open(path, 'wb') as fp:
+            fp.write(RSA.generate(1024).export_key())
+        os.utime(path, (0, 0))
+        assert key.key != old
+        assert key.key == key.key
+
+    def test_reload_once_by_threads(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'rotated.key')
+        shutil.copy(KEY_PATH, path)
+        key = CsobKey(path)
+        pem = key.pem
+        os.utime(path, (0, 0))
+
+        barrier = threading.Barrier(8)
+
+        def use():
+            barrier.wait()
+            key.sign(b'message')
+
+        with patch.object(key.rsa_backend, 'load_key', wraps=key.rsa_backend.load_key) as load:
+            threads = [threading.Thread(target=use) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert load.call_count == 1
+        assert key.pem == pem
@@ -0,0 +1,69 @@
+# coding: utf-8
+from unittest import TestCase
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from pycsob import conf, metrics
+from pycsob.client import CsobClient
+from pycsob.retry import RetryPolicy
+
+from .gateway import KEY_PATH, PAY_ID, mk_response
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.ops = []
+        self.c = CsobClient('MERCHANT', 'https://gw.cz', KEY_PATH, KEY_PATH,
+                            retry=RetryPolicy(backoff=0), metrics_sink=metrics.CallbackSink(self.ops.append))
+
+    def test_phases(self):
+        self.c.key.key, self.c.pubkey.key  # keys are parsed on first use
+        with patch.object(self.c, '_send', return_value=mk_response(result_code=conf.RETURN_CODE_PAYMENT_NOT_FOUND)):
+            self.c.payment_status(PAY_ID)
+        op, = self.ops
+        assert (op.method, op.endpoint) == ('GET', 'payment/status/')
+        assert op.status_code == 200
+        assert op.result_code == conf.RETURN_CODE_PAYMENT_NOT_FOUND
+        assert op.retries == 0
+        assert op.error is None
+        assert set(op.timings) == {'build', 'sign', 'http', 'decode', 'verify'}
+        assert op.timings['build'] >= op.timings['sign']
+        assert op.duration >= sum(op.timings.values()) - op.timings['sign']
+        assert metrics.current() is None
+
+    def test_phases_not_idempotent(self):
+        self.c.key.key, self.c.pubkey.key
+        with patch.object(self.c, '_send', return_value=mk_response()):
+            self.c.payment_init(42, 10000, 'http://shop.example.com/return', 'Order 42')
+            self.c.payment_close(PAY_ID)
+        for op in self.ops:
+            assert set(op.timings) == {'build', 'sign', 'http', 'decode', 'verify'}
+        assert [op.endpoint for op in self.ops] == ['payment/init', 'payment/close/']
+
+    def test_retries_and_error(self):
+        with patch.object(self.c, '_send', return_value=mk_response(503)):
+            with pytest.raises(requests.HTTPError):
+                self.c.echo()
+        op, = self.ops
+        assert op.status_code == 503
+        assert op.retries == 2
+        assert isinstance(op.error, requests.HTTPError)
+        assert op.result_code is None
+
+    def test_disabled(self):
+        self.c.metrics_sink = None
+        with patch.object(self.c, '_send', return_value=mk_response()), \
+                patch('pycsob.metrics.OperationMetrics') as operation_metrics:
+            self.c.payment_status(PAY_ID)
+        operation_metrics.assert_not_called()
+
+    def test_timed(self):
+        assert metrics.timed('x', lambda a: a * 2, 2) == 4
+        with metrics.operation(metrics.CallbackSink(self.ops.append), 'GET', 'echo/') as op:
+            metrics.timed('x', lambda: None)
+            assert metrics.current() is op
+        assert self.ops == [op]
+        assert list(op.timings) == ['x']
@@ -0,0 +1,113 @@
+# coding: utf-8
+import pickle
+from collections import OrderedDict
+from urllib.parse import unquote_plus
+
+import pytest
+import requests
+
+from pycsob import conf, utils
+from pycsob.client import CsobClient
+from pycsob.mock_gateway import MockGateway
+
+from .gateway import GatewayTestCase, KEY_PATH
+
+
+class MockGatewayTests(GatewayTestCase):
+
+    def setUp(self):
+        super(MockGatewayTests, self).setUp()
+        self.gateway.error_rate = self.gateway.too_many_requests_rate = 0
+        self.gateway.rate_limit = None
+
+    def init(self, **kwargs):
+        r = self.c.payment_init(42, 10000, 'http://shop.example.com/return', 'Order 42', **kwargs)
+        assert r.payload['resultCode'] == conf.RETURN_CODE_OK
+        assert r.payload['paymentStatus'] == conf.PAYMENT_STATUS_INIT
+        return r.payload['payId']
+
+    def status(self, pay_id):
+        return self.c.payment_status(pay_id).payload['paymentStatus']
+
+    def test_pool_stats(self):
+        c = self.client(pool_maxsize=2)
+        with c:
+            for _ in range(5):
+                c.echo()
+            stats = c.pool_stats()
+        assert (stats.requests, stats.connections, stats.idle, stats.in_use, stats.peak_in_use) == (5, 1, 1, 0, 1)
+        assert stats.reuse_rate == 0.8
+        assert c._client.get_adapter(c.base_url)._pool_maxsize == 2
+
+    def test_payment_lifecycle(self):
+        pay_id = self.init(return_method='GET', merchant_data=b'Foo')
+        data = self.c.gateway_return(self.process(pay_id))
+        assert data['paymentStatus'] == conf.PAYMENT_STATUS_WAITING
+        assert data['merchantData'] == b'Foo'
+        assert self.status(pay_id) == conf.PAYMENT_STATUS_WAITING
+
+        r = self.c.payment_close(pay_id)
+        assert r.payload['resultCode'] == conf.RETURN_CODE_PAYMENT_NOT_IN_VALID_STATE
+        r = self.c.payment_refund(pay_id)
+        assert r.payload['paymentStatus'] == conf.PAYMENT_STATUS_RETURNED
+        assert self.status(pay_id) == conf.PAYMENT_STATUS_RETURNED
+
+    def test_close_and_reverse(self):
+        pay_id = self.init(return_method='GET', close_payment=False)
+        self.process(pay_id)
+        assert self.status(pay_id) == conf.PAYMENT_STATUS_CONFIRMED
+        assert self.c.payment_close(pay_id).payload['paymentStatus'] == conf.PAYMENT_STATUS_WAITING
+        assert self.c.payment_reverse(pay_id).payload['paymentStatus'] == conf.PAYMENT_STATUS_REVERSED
+
+    def test_oneclick(self):
+        orig_pay_id = self.init(return_method='GET', pay_operation='oneclickPayment', customer_id='a@a.aa')
+        self.process(orig_pay_id)
+        pay_id = self.c.oneclick_init(orig_pay_id, 43, 500).payload['payId']
+        assert self.c.oneclick_start(pay_id).payload['paymentStatus'] == conf.PAYMENT_STATUS_PROCESS
+        assert self.status(pay_id) == conf.PAYMENT_STATUS_WAITING
+        assert self.c.customer_info('a@a.aa').payload['resultCode'] == conf.RETURN_CODE_FOUND_SAVED_CARDS
+        assert self.c.customer_info('b@b.bb').payload['resultCode'] == conf.RETURN_CODE_CUSTOMER_NOT_FOUND
+
+    def test_payment_process_urls(self):
+        pay_ids = [self.init(return_method='GET') for _ in range(3)]
+        for pay_id, url in self.c.get_payment_process_urls(pay_ids, chunk_size=2):
+            # signed like payload of payment/process call
+            merchant_id, url_pay_id, dttm, signature = [unquote_plus(one) for one in url.split('/')[-4:]]
+            payload = OrderedDict([('merchantId', merchant_id), ('payId', url_pay_id), ('dttm', dttm)])
+            assert payload == OrderedDict(list(self.c.req_payload(pay_id).items())[:2] + [('dttm', dttm)])
+            assert utils.verify(payload, signature, KEY_PATH)
+            assert requests.get(url, allow_redirects=False).status_code == 303
+            assert self.status(pay_id) == conf.PAYMENT_STATUS_WAITING
+
+    def test_echo_button_and_errors(self):
+        assert self.c.echo().payload['resultCode'] == conf.RETURN_CODE_OK
+        assert self.c.echo(method='GET').payload['resultCode'] == conf.RETURN_CODE_OK
+        pay_id = self.init()
+        r = self.c.button(pay_id, 'csob')
+        assert r.result_code == conf.RETURN_CODE_OK
+        assert r.redirect == {'method': 'GET', 'url': self.c.base_url + 'payment/process/%s' % pay_id}
+        assert r.payload['redirect'] == r.redirect and "extra={'redirect'" in repr(r)
+        assert pickle.loads(pickle.dumps(r)) == r
+        assert self.c.payment_status('unknown').payload['resultCode'] == conf.RETURN_CODE_PAYMENT_NOT_FOUND
+
+    def test_invalid_signature(self):
+        c = CsobClient('MERCHANT', self.gateway.base_url, MockGateway().key, KEY_PATH)
+        assert c.echo().payload['resultCode'] == conf.RETURN_CODE_PARAM_INVALID
+
+    def test_injection(self):
+        self.gateway.too_many_requests_rate = 1
+        with pytest.raises(requests.HTTPError) as excinfo:
+            self.c.echo()
+        assert excinfo.value.response.status_code == 429
+        assert excinfo.value.response.headers['Retry-After'] == '1'
+
+        self.gateway.too_many_requests_rate = 0
+        self.gateway.error_rate = 1
+        with pytest.raises(requests.HTTPError) as excinfo:
+            self.c.echo()
+        assert excinfo.value.response.status_code == 500
+
+        self.gateway.error_rate = 0
+        self.gateway.rate_limit = 0
+        with pytest.raises(requests.HTTPError):
+            self.c.echo()
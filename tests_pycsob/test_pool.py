@@ -0,0 +1,47 @@
+# coding: utf-8
+import pytest
+
+from pycsob import conf
+from pycsob.pool import CsobClientPool, PooledClient
+from pycsob.retry import RetryPolicy
+
+from .gateway import GatewayTestCase, KEY_PATH
+
+
+class CsobClientPoolTests(GatewayTestCase):
+
+    def setUp(self):
+        self.retry = RetryPolicy()
+        self.pool = CsobClientPool(self.gateway.base_url, KEY_PATH, pool_maxsize=2, retry=self.retry)
+        self.addCleanup(self.pool.close)
+
+    def test_shared_session(self):
+        first = self.pool.add('MERCHANT1', KEY_PATH)
+        second = self.pool.add('MERCHANT2', KEY_PATH, retry=None)
+        assert isinstance(first, PooledClient) and self.pool['MERCHANT1'] is first
+        assert (first.retry, second.retry) == (self.retry, None)
+        assert first.pubkey is second.pubkey is self.pool.pubkey
+        assert self.pool.pool_stats() == (0, 0, 0, 0, 0)
+
+        for merchant_id in ('MERCHANT1', 'MERCHANT2', 'MERCHANT1'):
+            assert self.pool[merchant_id].echo().result_code == conf.RETURN_CODE_OK
+        assert first._client is second._client is self.pool._client
+        stats = self.pool.pool_stats()
+        assert (stats.requests, stats.connections) == (3, 1)
+        assert first.pool_stats() == stats
+
+        first.close()  # connections of other merchants are kept
+        second.echo()
+        assert self.pool.pool_stats().connections == 1
+
+    def test_add_remove(self):
+        first = self.pool.add('MERCHANT1', KEY_PATH)
+        first.echo()
+        replaced = self.pool.add('MERCHANT1', KEY_PATH, lazy_extensions=True)
+        assert replaced is not first and replaced.key is first.key and replaced.lazy_extensions
+        assert list(self.pool) == ['MERCHANT1'] and len(self.pool) == 1
+
+        assert self.pool.remove('MERCHANT1') is replaced
+        assert 'MERCHANT1' not in self.pool and self.pool.get('MERCHANT1') is None
+        with pytest.raises(KeyError):
+            self.pool['MERCHANT1']
@@ -0,0 +1,100 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from pycsob.client import CsobClient
+from pycsob.metrics import CallbackSink
+from pycsob.mock_gateway import MockGateway
+from pycsob.ratelimit import FileTokenBucket, RateLimiter, TokenBucket
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(TestCase):
+
+    def bucket(self, *args, **kwargs):
+        clock = Clock()
+        with patch.object(TokenBucket, 'clock', clock):
+            bucket = TokenBucket(*args, **kwargs)
+        bucket.clock = clock
+        return bucket, clock
+
+    def test_reserve(self):
+        bucket, clock = self.bucket(10, burst=2)
+        assert [bucket.reserve() for _ in range(4)] == [0, 0, pytest.approx(0.1), pytest.approx(0.2)]
+        clock.now += 0.5  # the bucket is refilled up to burst
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, pytest.approx(0.1)]
+
+    def test_adaptive_rate(self):
+        bucket, clock = self.bucket(10, burst=1, increase=1)
+        bucket.reserve()
+        bucket.throttled(pause=2)
+        assert bucket.rate == 5
+        assert bucket.reserve() == pytest.approx(2.2)
+        for _ in range(4):
+            bucket.throttled()
+        assert bucket.rate == 0.5  # min_rate
+        for _ in range(20):
+            bucket.succeeded()
+        assert bucket.rate == 10
+
+    def test_file_bucket_shared(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'bucket')
+        clock = Clock()
+        with patch.object(FileTokenBucket, 'clock', clock):
+            first = FileTokenBucket(path, 10, burst=1)
+            second = FileTokenBucket(path, 10, burst=1)
+            assert first.reserve() == 0
+            assert second.reserve() == pytest.approx(0.1)
+            second.throttled()
+            assert first.rate == 5
+        first.close()
+        second.close()
+
+    def test_groups(self):
+        status, default = TokenBucket(10), TokenBucket(1)
+        limiter = RateLimiter({'status': status, 'default': default}, groups={'payment/close/': 'status'})
+        assert limiter.bucket('payment/status/') is status
+        assert limiter.bucket('payment/close/') is status
+        assert limiter.bucket('payment/init') is default
+        assert RateLimiter({'init': status}).bucket('payment/status/') is None
+
+
+class ClientRateLimitTests(TestCase):
+
+    def test_429_decreases_rate(self):
+        ops = []
+        bucket = TokenBucket(1000, increase=100)
+        with MockGateway(key=KEY_PATH, merchant_key=KEY_PATH) as gateway:
+            c = CsobClient('MERCHANT', gateway.base_url, KEY_PATH, KEY_PATH, metrics_sink=CallbackSink(ops.append),
+                           rate_limiter=RateLimiter({'status': bucket}))
+            c.echo()
+            assert 'throttle' in ops[-1].timings
+            gateway.too_many_requests_rate = 1
+            with pytest.raises(requests.HTTPError):
+                c.echo()
+            assert bucket.rate == 500
+            gateway.too_many_requests_rate = 0
+            with patch('pycsob.ratelimit.time.sleep') as sleep:
+                c.echo()
+            # Retry-After: 1
+            assert sleep.call_args[0][0] == pytest.approx(1.0, abs=0.1)
+            assert bucket.rate == 600
+            c.payment_status('unknown')
+            assert 'throttle' in ops[-1].timings
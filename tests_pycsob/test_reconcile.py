@@ -0,0 +1,78 @@
+# coding: utf-8
+import csv
+import os
+import shutil
+import tempfile
+
+from pycsob import conf, reconcile
+from pycsob.reconcile import Checkpoint, Reconciler, read_csv
+
+from .gateway import GatewayTestCase
+
+
+class ReconcilerTests(GatewayTestCase):
+
+    def setUp(self):
+        super(ReconcilerTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.output = os.path.join(self.tmpdir, 'mismatches.csv')
+
+    def read_output(self):
+        with open(self.output, newline='') as fp:
+            return list(csv.reader(fp))
+
+    def test_execute(self):
+        pay_ids = [self.payment() for _ in range(4)]
+        path = os.path.join(self.tmpdir, 'orders.csv')
+        with open(path, 'w', newline='') as fp:
+            writer = csv.writer(fp, delimiter=';')
+            writer.writerow(('order', 'payId', 'paymentStatus', 'amount'))
+            writer.writerow(('1', pay_ids[0], '1', '10000'))
+            writer.writerow(('2', pay_ids[1], '7|8', ''))
+            writer.writerow(('3', pay_ids[2], '', '9900'))
+            writer.writerow(('4', pay_ids[3], '1|2', '10000'))
+            writer.writerow(('5', 'unknown0000BF', '1', ''))
+
+        progress = []
+        reconciler = Reconciler(self.c, self.output, concurrency=3, progress=progress.append,
+                                gateway_amount=lambda result: 10000)
+        mismatches = list(reconciler.run(read_csv(path, delimiter=';')))
+
+        assert [(m.pay_id, m.reason) for m in mismatches] == [
+            (pay_ids[1], reconcile.STATUS), (pay_ids[2], reconcile.AMOUNT), ('unknown0000BF', reconcile.ERROR)]
+        assert mismatches[0].payment_status == conf.PAYMENT_STATUS_INIT
+        assert mismatches[2].error.startswith('%s: ' % conf.RETURN_CODE_PAYMENT_NOT_FOUND)
+        assert self.read_output() == [
+            list(reconcile.OUTPUT_HEADER),
+            [pay_ids[1], '7|8', '1', '', '10000', 'status', ''],
+            [pay_ids[2], '', '1', '9900', '10000', 'amount', ''],
+            ['unknown0000BF', '1', '', '', '', 'error', mismatches[2].error],
+        ]
+        assert progress[-1][:4] == (5, 2, 1, 0)
+        assert '5 checked (2 mismatched, 1 errors, 0 resumed)' in str(progress[-1])
+
+    def test_resume(self):
+        pay_ids = [self.payment() for _ in range(6)]
+        items = [(pay_id, conf.PAYMENT_STATUS_WAITING, None) for pay_id in pay_ids]
+        checkpoint = Checkpoint(os.path.join(self.tmpdir, 'checkpoint.json'))
+
+        consumed = []
+
+        def source():
+            for item in items:
+                consumed.append(item)
+                yield item
+
+        run = Reconciler(self.c, self.output, checkpoint, concurrency=2, checkpoint_interval=10).run(source())
+        assert next(run).pay_id == pay_ids[0]
+        assert len(consumed) <= 5  # window of 2 * concurrency
+        assert next(run).pay_id == pay_ids[1]
+        run.close()  # interrupted, later rows may have been fetched already
+        state = checkpoint.load()
+        assert (state['position'], state['checked'], state['mismatched']) == (2, 2, 2)
+
+        summary = Reconciler(self.c, self.output, checkpoint, concurrency=2).execute(items)
+        assert summary[:4] == (6, 6, 0, 2)
+        assert [row[0] for row in self.read_output()] == ['payId'] + pay_ids
+        assert checkpoint.load()['position'] == 6
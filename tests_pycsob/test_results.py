@@ -0,0 +1,163 @@
+# coding: utf-8
+import datetime
+import gc
+import json
+import pickle
+import weakref
+from collections import OrderedDict
+from unittest import TestCase
+from unittest.mock import patch
+
+from pycsob import conf, results, utils
+from pycsob.keys import CsobKey
+from pycsob.results import Extension, MaskedCardExtension, PaymentResult, TrxDatesExtension, UnknownExtension
+
+from .gateway import KEY_PATH, PAY_ID, mk_response
+
+
+def mk_result_response(key=KEY_PATH):
+    "Response with extensions of all kinds"
+    payload = utils.mk_payload(key, pairs=(
+        ('payId', PAY_ID),
+        ('dttm', '20190502161426'),
+        ('resultCode', conf.RETURN_CODE_OK),
+        ('resultMessage', 'OK'),
+        ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+        ('authCode', '042760'),
+        ('merchantData', 'AQID'),
+    ))
+    payload['extensions'] = [utils.mk_payload(key, pairs=(
+        ('extension', 'maskClnRP'),
+        ('dttm', '20190502161427'),
+        ('maskedCln', '****1234'),
+        ('expiration', '12/20'),
+        ('longMaskedCln', '423451****1234'),
+    )), utils.mk_payload(key, pairs=(
+        ('extension', 'trxDates'),
+        ('dttm', '20190502161427'),
+        ('createdDate', '2019-05-02T16:14:20+02:00'),
+        ('authDate', '2019-05-02T16:14:25+02:00'),
+    )), {'extension': 'unknown', 'value': 1, 'signature': 'eA=='}]
+    return mk_response(payload=payload)
+
+
+class PaymentResultTests(TestCase):
+
+    def test_typed_fields(self):
+        result = utils.validate_response(mk_result_response(), KEY_PATH)
+        assert isinstance(result, PaymentResult)
+        assert (result.pay_id, result.result_code, result.payment_status, result.auth_code) == (
+            PAY_ID, conf.RETURN_CODE_OK, conf.PAYMENT_STATUS_WAITING, '042760')
+        assert result.dttime == datetime.datetime(2019, 5, 2, 16, 14, 26)
+        assert result.merchant_data == b'\x01\x02\x03'
+        assert result.ok
+        ext, dates, unknown = result.extensions
+        assert (ext.masked_cln, ext.expiration, ext.long_masked_cln) == ('****1234', '12/20', '423451****1234')
+        assert ext.card_provider == (conf.CARD_PROVIDER_VISA, 'Visa')
+        assert not hasattr(result, '__dict__') and not hasattr(ext, '__dict__')
+        assert isinstance(dates, TrxDatesExtension) and dates.auth_date == '2019-05-02T16:14:25+02:00'
+        assert result.get_extension('trxDates') is dates
+        assert unknown == UnknownExtension('unknown', OrderedDict([('extension', 'unknown'), ('value', 1)]))
+
+    def test_payload(self):
+        result = utils.validate_response(mk_result_response(), KEY_PATH)
+        assert result.payload == OrderedDict([
+            ('payId', PAY_ID),
+            ('dttm', '20190502161426'),
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', 'OK'),
+            ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+            ('authCode', '042760'),
+            ('merchantData', 'AQID'),
+            ('dttime', datetime.datetime(2019, 5, 2, 16, 14, 26)),
+        ])
+        assert list(result.payload) == ['payId', 'dttm', 'resultCode', 'resultMessage', 'paymentStatus',
+                                        'authCode', 'merchantData', 'dttime']
+        assert result.extensions[0].payload == OrderedDict([
+            ('extension', 'maskClnRP'),
+            ('dttm', '20190502161427'),
+            ('maskedCln', '****1234'),
+            ('expiration', '12/20'),
+            ('longMaskedCln', '423451****1234'),
+        ])
+        assert result.extensions[0]['longMaskedCln'] == '423451****1234'
+        assert PaymentResult(result_code=0).payload == OrderedDict([('resultCode', 0)])
+        assert PaymentResult(merchant_data='not base64').payload['merchantData'] == 'not base64'
+
+    def test_response_released(self):
+        response = mk_result_response()
+        ref = weakref.ref(response)
+        result = utils.validate_response(response, KEY_PATH)
+        del response
+        gc.collect()
+        assert ref() is None
+        assert result == utils.validate_response(mk_result_response(), KEY_PATH)
+        assert result != PaymentResult(pay_id=PAY_ID)
+        assert 'payment_status=7' in repr(result)
+
+    def test_invalid_extension_signature(self):
+        response = mk_result_response()
+        data = json.loads(response.content.decode())
+        data['extensions'][0]['maskedCln'] = '****9999'
+        response._content = json.dumps(data).encode()
+        with self.assertRaises(utils.CsobVerifyError):
+            utils.validate_response(response, KEY_PATH)
+
+    def test_extension_without_dttm(self):
+        ext = MaskedCardExtension.from_payload({'extension': 'maskClnRP', 'maskedCln': '****1234'})
+        assert ext.dttime is None
+        assert ext.card_provider == (None, None)
+        assert ext.payload == OrderedDict([('extension', 'maskClnRP'), ('maskedCln', '****1234')])
+
+    def test_lazy_extensions(self):
+        key = CsobKey(KEY_PATH)
+        with patch.object(key, 'verify_many', wraps=key.verify_many) as verify_many:
+            result = utils.validate_response(mk_result_response(), key, lazy_extensions=True)
+            assert result.result_code == conf.RETURN_CODE_OK
+            assert [len(call[0][0]) for call in verify_many.call_args_list] == [1]
+            assert result.get_extension('maskClnRP').long_masked_cln == '423451****1234'
+            assert [len(call[0][0]) for call in verify_many.call_args_list] == [1, 2]
+            result.extensions
+            assert verify_many.call_count == 2
+        assert result == utils.validate_response(mk_result_response(), key)
+
+        with patch.object(key, 'verify_many', wraps=key.verify_many) as verify_many:
+            first = utils.validate_response(mk_result_response(), key, lazy_extensions=True)
+            second = utils.validate_response(mk_result_response(), key, lazy_extensions=True)
+            assert 'extensions=<3 pending>' in repr(first) and 'payment_status=7' in repr(first)
+            assert first == second and first != result
+            assert verify_many.call_count == 2
+
+        response = mk_result_response()
+        data = json.loads(response.content.decode())
+        data['extensions'][1]['authDate'] = '2019-05-03T00:00:00+02:00'
+        response._content = json.dumps(data).encode()
+        result = utils.validate_response(response, key, lazy_extensions=True)
+        with self.assertRaisesRegex(utils.CsobVerifyError, 'trxDates'):
+            result.extensions
+
+    def test_pickle(self):
+        result = utils.validate_response(mk_result_response(), KEY_PATH, lazy_extensions=True)
+        copy = pickle.loads(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        assert copy == result and copy._pending is None
+
+    def test_register_extension(self):
+        self.addCleanup(results.EXTENSIONS.pop, 'unknown')
+
+        @results.register_extension
+        class ValueExtension(Extension):
+            __slots__ = ('value',)
+            fields = __slots__
+            extension = 'unknown'
+            keys = ('extension', 'value')
+
+            def __init__(self, value):
+                self.value = value
+
+            @classmethod
+            def from_payload(cls, payload):
+                return cls(payload['value'])
+
+        # now the signature of the extension is verified
+        with self.assertRaises(utils.CsobVerifyError):
+            utils.validate_response(mk_result_response(), KEY_PATH)
@@ -0,0 +1,154 @@
+# coding: utf-8
+from unittest import TestCase
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from pycsob import conf
+from pycsob.client import CsobClient
+from pycsob.retry import CircuitBreaker, CsobCircuitOpenError, RetryPolicy
+
+from .gateway import KEY_PATH, PAY_ID, mk_response
+
+
+class RetryPolicyTests(TestCase):
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+        err503 = requests.HTTPError(response=mk_response(503))
+        assert policy.should_retry(err503, 1)
+        assert not policy.should_retry(err503, 3)
+        assert not policy.should_retry(requests.HTTPError(response=mk_response(400)), 1)
+        assert policy.should_retry(requests.ConnectionError(), 1, CsobClient.transport_errors)
+        assert not RetryPolicy(retry_transport_errors=False).should_retry(
+            requests.ConnectionError(), 1, CsobClient.transport_errors)
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        err = requests.HTTPError(response=mk_response(503))
+        for attempt in range(1, 6):
+            assert 0 <= policy.delay(err, attempt) <= min(5, 2 ** (attempt - 1))
+        assert RetryPolicy(backoff=1, jitter=False).delay(err, 3) == 4
+        err = requests.HTTPError(response=mk_response(429, {'Retry-After': '3'}))
+        assert policy.delay(err, 1) == 3
+        err = requests.HTTPError(response=mk_response(429, {'Retry-After': '60'}))
+        assert policy.delay(err, 1) == 5
+
+
+class CircuitBreakerTests(TestCase):
+
+    @patch('pycsob.retry.time.monotonic')
+    def test_states(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == breaker.OPEN
+        with pytest.raises(CsobCircuitOpenError):
+            breaker.before_call()
+
+        monotonic.return_value = 110
+        breaker.before_call()
+        assert breaker.state == breaker.HALF_OPEN
+        with pytest.raises(CsobCircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == breaker.OPEN
+
+        monotonic.return_value = 120
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == breaker.CLOSED
+        assert breaker.failures == 0
+
+    @patch('pycsob.retry.time.monotonic')
+    def test_trial_aborted(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        breaker.record_abort()
+        assert breaker.state == breaker.OPEN
+
+        monotonic.return_value = 110
+        breaker.before_call()
+        breaker.record_abort()
+        assert breaker.state == breaker.OPEN
+
+        # trial which never records its result does not block the circuit for good
+        monotonic.return_value = 120
+        breaker.before_call()
+        with pytest.raises(CsobCircuitOpenError):
+            breaker.before_call()
+        monotonic.return_value = 130
+        breaker.before_call()
+        assert breaker.state == breaker.HALF_OPEN
+
+    def test_record(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record(requests.HTTPError(response=mk_response(400)))
+        assert breaker.state == breaker.CLOSED
+        breaker.record(requests.Timeout(), CsobClient.transport_errors)
+        assert breaker.state == breaker.OPEN
+
+    @patch('pycsob.retry.time.monotonic')
+    def test_not_sent_not_recorded(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        monotonic.return_value = 110
+        breaker.before_call()
+        breaker.record(ValueError('cannot sign'), CsobClient.transport_errors)
+        assert breaker.state == breaker.HALF_OPEN
+        breaker.before_call()  # next call is the trial
+        assert breaker.state == breaker.HALF_OPEN
+
+
+@patch('pycsob.client.time.sleep')
+class ClientRetryTests(TestCase):
+
+    def setUp(self):
+        self.c = CsobClient('MERCHANT', 'https://gw.cz', KEY_PATH, KEY_PATH,
+                            retry=RetryPolicy(max_attempts=3), circuit_breaker=CircuitBreaker(failure_threshold=3))
+
+    def test_idempotent_retried_and_resigned(self, sleep):
+        with patch.object(self.c, '_send', side_effect=[
+                mk_response(503), requests.ConnectionError(), mk_response(200)]) as send, \
+                patch('pycsob.client.utils.dttm', side_effect=['20190101000000', '20190101000001',
+                                                               '20190101000002', '20190101000003']):
+            out = self.c.payment_status(PAY_ID)
+        assert out.payload['paymentStatus'] == conf.PAYMENT_STATUS_WAITING
+        assert send.call_count == 3
+        assert sleep.call_count == 2
+        sent = [c[0][2] for c in send.call_args_list]
+        assert [p['dttm'] for p in sent] == ['20190101000000', '20190101000001', '20190101000002']
+        assert len(set(p['signature'] for p in sent)) == 3
+        assert self.c.circuit_breaker.state == CircuitBreaker.CLOSED
+
+    def test_retry_limit(self, sleep):
+        with patch.object(self.c, '_send', return_value=mk_response(503)) as send:
+            with pytest.raises(requests.HTTPError):
+                self.c.echo()
+        assert send.call_count == 3
+        assert self.c.circuit_breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CsobCircuitOpenError):
+            self.c.echo()
+        assert send.call_count == 3
+
+    def test_not_idempotent_not_retried(self, sleep):
+        with patch.object(self.c, '_send', return_value=mk_response(503)) as send:
+            with pytest.raises(requests.HTTPError):
+                self.c.payment_close(PAY_ID)
+        assert send.call_count == 1
+        sleep.assert_not_called()
+
+    def test_local_error_not_recorded(self, sleep):
+        breaker = self.c.circuit_breaker
+        breaker.state, breaker.failures = CircuitBreaker.OPEN, 3
+        with patch.object(self.c, '_send') as send, \
+                patch.object(self.c.key, 'sign_digest', side_effect=ValueError('cannot sign')):
+            with pytest.raises(ValueError):
+                self.c.payment_close(PAY_ID)
+        send.assert_not_called()
+        assert (breaker.state, breaker.failures) == (CircuitBreaker.HALF_OPEN, 3)
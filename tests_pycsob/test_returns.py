@@ -0,0 +1,98 @@
+# coding: utf-8
+import datetime
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from unittest import TestCase
+
+from pycsob import conf, utils
+from pycsob.cache import MemoryCache
+from pycsob.returns import ReturnVerifier
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+
+
+def return_data(pay_id='34ae55eb69e2cBF', **extra):
+    pairs = [
+        ('payId', pay_id),
+        ('dttm', '20190502161426'),
+        ('resultCode', str(conf.RETURN_CODE_OK)),
+        ('resultMessage', 'OK'),
+        ('paymentStatus', str(conf.PAYMENT_STATUS_WAITING)),
+        ('authCode', '042760'),
+    ]
+    pairs.extend(extra.items())
+    return dict(utils.mk_payload(KEY_PATH, pairs=pairs))
+
+
+class ReturnVerifierTests(TestCase):
+
+    def setUp(self):
+        self.verifier = ReturnVerifier(KEY_PATH)
+
+    def test_verify(self):
+        data = self.verifier.verify(return_data(merchantData='Rm9v'))
+        self.assertEqual(data, OrderedDict([
+            ('payId', '34ae55eb69e2cBF'),
+            ('dttm', '20190502161426'),
+            ('resultCode', 0),
+            ('resultMessage', 'OK'),
+            ('paymentStatus', 7),
+            ('authCode', '042760'),
+            ('merchantData', b'Foo'),
+            ('dttime', datetime.datetime(2019, 5, 2, 16, 14, 26)),
+        ]))
+
+    def test_verify_invalid(self):
+        data = return_data()
+        data['authCode'] = '000000'
+        with self.assertRaises(utils.CsobVerifyError):
+            self.verifier.verify(data)
+
+    def test_verify_many(self):
+        tampered = return_data('b')
+        tampered['paymentStatus'] = '4'
+        missing = return_data('c')
+        del missing['signature']
+        results = self.verifier.verify_many([return_data('a'), tampered, missing, return_data('d')])
+
+        self.assertEqual([r.data['payId'] if r.data else None for r in results], ['a', None, None, 'd'])
+        self.assertIsInstance(results[1].error, utils.CsobVerifyError)
+        self.assertIsInstance(results[2].error, KeyError)
+        self.assertIsNone(results[3].error)
+
+    def test_threads(self):
+        errors = []
+
+        def run():
+            try:
+                for _ in range(20):
+                    self.verifier.verify(return_data())
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_pickle(self):
+        verifier = pickle.loads(pickle.dumps(self.verifier))
+        self.assertEqual(verifier.pubkey.path, KEY_PATH)
+        self.assertEqual(verifier.verify(return_data())['payId'], '34ae55eb69e2cBF')
+
+        verifier = ReturnVerifier(KEY_PATH, cache=MemoryCache(ttl=30))
+        verifier.verify(return_data())
+        copy = pickle.loads(pickle.dumps(verifier))
+        self.assertEqual((len(copy.cache), copy.cache.ttl), (0, 30))
+        self.assertEqual(copy.verify(return_data())['payId'], '34ae55eb69e2cBF')
+        self.assertEqual(len(copy.cache), 1)
+
+    def test_dttm_decode(self):
+        self.assertEqual(utils.dttm_decode('20191231235959'), datetime.datetime(2019, 12, 31, 23, 59, 59))
+        for value in ('2019123123595', '2019123123595x', '20191331235959'):
+            with self.assertRaises(ValueError):
+                utils.dttm_decode(value)
@@ -0,0 +1,84 @@
+# coding: utf-8
+import json
+import os
+from collections import OrderedDict
+from unittest import TestCase
+
+import pytest
+import requests
+
+from pycsob import conf, serializers, utils
+from pycsob.client import CsobClient
+from pycsob.mock_gateway import MockGateway
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'test.key'))
+PAYLOAD = OrderedDict([
+    ('merchantId', 'MERCHANT'),
+    ('orderNo', '42'),
+    ('closePayment', True),
+    ('totalAmount', 1789600),
+    ('returnUrl', 'https://shop.example.com/return'),
+    ('cart', [OrderedDict([('name', 'Příliš žluťoučký'), ('quantity', 1), ('amount', 1789600)])]),
+    ('merchantData', None),
+])
+
+
+def available():
+    result = []
+    for cls in serializers.SERIALIZERS:
+        try:
+            result.append(cls())
+        except ImportError:
+            pass
+    return result
+
+
+class SerializerTests(TestCase):
+
+    def test_round_trip(self):
+        for serializer in available():
+            body = serializer.dumps(PAYLOAD)
+            assert isinstance(body, bytes)
+            assert list(json.loads(body.decode('utf-8')).items()) == list(PAYLOAD.items())
+            assert serializer.loads(body) == PAYLOAD
+            assert serializer.loads(body.decode('utf-8')) == PAYLOAD
+
+    def test_get_serializer(self):
+        assert serializers.get_serializer('json').name == 'json'
+        assert serializers.get_serializer() is serializers.get_serializer()
+        with pytest.raises(ValueError):
+            serializers.get_serializer('foo')
+
+    def test_orjson_default(self):
+        pytest.importorskip('orjson')
+        assert serializers.get_serializer().name == 'orjson'
+
+    def test_validate_response(self):
+        payload = utils.mk_payload(KEY_PATH, pairs=(
+            ('payId', '34ae55eb69e2cBF'),
+            ('dttm', '20190502161426'),
+            ('resultCode', conf.RETURN_CODE_OK),
+            ('resultMessage', 'Příliš žluťoučký'),
+            ('paymentStatus', conf.PAYMENT_STATUS_WAITING),
+        ))
+        payload['extensions'] = [utils.mk_payload(KEY_PATH, pairs=(
+            ('extension', 'maskClnRP'),
+            ('dttm', '20190502161426'),
+            ('maskedCln', '****1234'),
+            ('longMaskedCln', '423451****1234'),
+        ))]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(payload).encode()
+        results = [utils.validate_response(response, KEY_PATH, serializer) for serializer in available()]
+        assert results[0].result_message == 'Příliš žluťoučký'
+        assert results[0].extensions[0].long_masked_cln == '423451****1234'
+        assert all(result == results[0] for result in results)
+
+    def test_client(self):
+        with MockGateway(key=KEY_PATH, merchant_key=KEY_PATH) as gateway:
+            for serializer in available():
+                c = CsobClient('MERCHANT', gateway.base_url, KEY_PATH, KEY_PATH, serializer=serializer)
+                r = c.payment_init(42, 100, 'http://shop.example.com/return', 'Nákup', return_method='GET')
+                assert r.result_code == conf.RETURN_CODE_OK
+                assert c.payment_status(r.pay_id).payment_status == conf.PAYMENT_STATUS_INIT
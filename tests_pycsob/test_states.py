@@ -0,0 +1,75 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from pycsob import bulk, conf
+from pycsob.bulk import BulkExecutor
+from pycsob.states import CsobStateError, PaymentStateTracker, SQLiteStateStore, is_allowed, reachable
+
+from .gateway import GatewayTestCase
+
+
+class StatesTests(TestCase):
+
+    def test_is_allowed(self):
+        assert reachable(conf.PAYMENT_STATUS_CONFIRMED) == {
+            conf.PAYMENT_STATUS_CONFIRMED, conf.PAYMENT_STATUS_WAITING, conf.PAYMENT_STATUS_RECOGNIZED}
+        assert all(is_allowed(operation, None) for operation in ('close', 'reverse', 'refund'))
+        # customer may have paid meanwhile
+        assert is_allowed('close', conf.PAYMENT_STATUS_INIT)
+        assert is_allowed('refund', conf.PAYMENT_STATUS_CONFIRMED)
+        assert not is_allowed('close', conf.PAYMENT_STATUS_WAITING)
+        assert not is_allowed('reverse', conf.PAYMENT_STATUS_RECOGNIZED)
+        for status in conf.PAYMENT_STATUSES_FINAL:
+            assert not any(is_allowed(operation, status) for operation in ('close', 'reverse', 'refund'))
+
+    def test_sqlite_store(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'states.sqlite')
+        tracker = PaymentStateTracker(SQLiteStateStore(path))
+        tracker.update('a', conf.PAYMENT_STATUS_WAITING)
+        tracker.update('b', None)
+        tracker.store.close()
+
+        tracker = PaymentStateTracker(SQLiteStateStore(path))
+        assert tracker.status('a') == conf.PAYMENT_STATUS_WAITING
+        assert tracker.status('b') is None
+        assert tracker.allowed_operations('a') == ['refund', 'reverse']
+        with pytest.raises(CsobStateError) as e:
+            tracker.check('close', 'a')
+        assert (e.value.operation, e.value.pay_id, e.value.status) == ('close', 'a', conf.PAYMENT_STATUS_WAITING)
+        assert 'Cannot close payment a in status 7 (Waiting)' in str(e.value)
+        tracker.store.close()
+
+
+class ClientStateTests(GatewayTestCase):
+
+    def setUp(self):
+        self.tracker = PaymentStateTracker()
+        self.c = self.client(state_tracker=self.tracker)
+
+    def test_lifecycle(self):
+        pay_id = self.payment(close_payment=False)
+        assert self.tracker.status(pay_id) == conf.PAYMENT_STATUS_INIT
+        self.c.gateway_return(self.process(pay_id))
+        assert self.tracker.status(pay_id) == conf.PAYMENT_STATUS_CONFIRMED
+
+        assert self.c.payment_close(pay_id).result_code == conf.RETURN_CODE_OK
+        assert self.tracker.status(pay_id) == conf.PAYMENT_STATUS_WAITING
+        count = self.gateway.requests_count
+        with pytest.raises(CsobStateError):
+            self.c.payment_close(pay_id)
+        assert self.gateway.requests_count == count
+
+        self.c.payment_reverse(pay_id)
+        assert self.tracker.status(pay_id) == conf.PAYMENT_STATUS_REVERSED
+        with pytest.raises(CsobStateError):
+            self.c.payment_refund(pay_id)
+        result, = BulkExecutor(self.c).run([('close', pay_id, None)])
+        assert result.outcome == bulk.FAILED and isinstance(result.error, CsobStateError)
+        assert self.gateway.requests_count == count + 1
@@ -0,0 +1,169 @@
+# coding: utf-8
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from pycsob import batch, conf
+from pycsob.cache import MemoryCache
+from pycsob.results import PaymentResult
+from pycsob.watch import AsyncStatusWatcher, StatusWatcher
+
+from .gateway import GatewayTestCase
+
+INIT, PROCESS, CONFIRMED, WAITING = (conf.PAYMENT_STATUS_INIT, conf.PAYMENT_STATUS_PROCESS,
+                                     conf.PAYMENT_STATUS_CONFIRMED, conf.PAYMENT_STATUS_WAITING)
+
+
+class FakeClient(object):
+    "Answers statuses from lists, the last status is repeated"
+
+    def __init__(self, **statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def payment_status(self, pay_id):
+        self.calls.append(pay_id)
+        statuses = self.statuses[pay_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return PaymentResult(result_code=conf.RETURN_CODE_OK, payment_status=status)
+
+    def payment_status_many(self, pay_ids, concurrency=10, use_cache=True):
+        assert not use_cache
+        return batch.run_batch(self.payment_status, pay_ids, concurrency=concurrency)
+
+
+class FakeAsyncClient(FakeClient):
+
+    def payment_status_many(self, pay_ids, concurrency=10, use_cache=True):
+        results = list(super(FakeAsyncClient, self).payment_status_many(pay_ids, concurrency, use_cache))
+
+        class Results(object):
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if not results:
+                    raise StopAsyncIteration
+                return results.pop()
+
+        return Results()
+
+
+@patch('pycsob.watch.time.monotonic')
+class StatusWatcherTests(TestCase):
+
+    def poll_at(self, watcher, monotonic, now):
+        monotonic.return_value = now
+        return [(c.pay_id, c.old_status, c.status) for c in watcher.poll()]
+
+    def test_transitions(self, monotonic):
+        monotonic.return_value = 0.0
+        client = FakeClient(a=[INIT, INIT, PROCESS, CONFIRMED, WAITING], b=[conf.PAYMENT_STATUS_CANCELLED])
+        watcher = StatusWatcher(client, intervals={INIT: 10, PROCESS: 1}, backoff=2)
+        changes = []
+        watcher.watch('a', changes.append, until={WAITING})
+        watcher.watch('b', delay=5)
+
+        assert self.poll_at(watcher, monotonic, 0) == [('a', None, INIT)]
+        assert self.poll_at(watcher, monotonic, 4) == []
+        assert self.poll_at(watcher, monotonic, 10) == [('b', None, conf.PAYMENT_STATUS_CANCELLED)]
+        assert 'b' not in watcher
+        # unchanged status, interval doubled
+        assert self.poll_at(watcher, monotonic, 29) == []
+        assert self.poll_at(watcher, monotonic, 30) == [('a', INIT, PROCESS)]
+        assert self.poll_at(watcher, monotonic, 31) == [('a', PROCESS, CONFIRMED)]
+        assert self.poll_at(watcher, monotonic, 61) == [('a', CONFIRMED, WAITING)]
+        assert len(watcher) == 0
+        assert [c.status for c in changes] == [INIT, PROCESS, CONFIRMED, WAITING]
+        assert sorted(client.calls) == ['a'] * 5 + ['b']
+
+    def test_coalesced(self, monotonic):
+        monotonic.return_value = 0.0
+        client = FakeClient(a=[PROCESS, CONFIRMED, WAITING])
+        watcher = StatusWatcher(client, intervals={PROCESS: 1, CONFIRMED: 1})
+        first, second = [], []
+        watcher.watch('a', first.append, until={CONFIRMED})
+        self.poll_at(watcher, monotonic, 0)
+        watcher.watch('a', second.append)
+        self.poll_at(watcher, monotonic, 1)
+        self.poll_at(watcher, monotonic, 2)
+
+        assert client.calls == ['a', 'a', 'a']
+        assert [c.status for c in first] == [PROCESS, CONFIRMED]
+        assert [(c.old_status, c.status) for c in second] == [
+            (None, PROCESS), (PROCESS, CONFIRMED), (CONFIRMED, WAITING)]
+
+    def test_errors(self, monotonic):
+        monotonic.return_value = 0.0
+        error = ValueError('down')
+        watcher = StatusWatcher(FakeClient(a=[error]), max_errors=2, backoff=2)
+        changes = []
+        watcher.watch('a', changes.append)
+        self.poll_at(watcher, monotonic, 0)
+        assert changes == []
+        self.poll_at(watcher, monotonic, 2)
+        assert changes[0].error is error
+        assert 'a' not in watcher
+
+    def test_run(self, monotonic):
+        monotonic.return_value = 0.0
+        watcher = StatusWatcher(FakeClient(a=[INIT, PROCESS, WAITING]), intervals={INIT: 0, PROCESS: 0})
+        changes = []
+        watcher.watch('a', changes.append, until={WAITING})
+        watcher.run()
+        assert [c.status for c in changes] == [INIT, PROCESS, WAITING]
+
+    def test_start_stop(self, monotonic):
+        monotonic.return_value = 0.0
+        watcher = StatusWatcher(FakeClient()).start()
+        watcher.stop(timeout=1)
+        assert not watcher._thread.is_alive()
+
+
+class AsyncStatusWatcherTests(TestCase):
+
+    def run_async(self, coro):
+        # asyncio.run is not in Python 3.5 and 3.6
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_iterate(self):
+        client = FakeAsyncClient(a=[INIT, PROCESS, WAITING], b=[conf.PAYMENT_STATUS_REVERSED])
+        watcher = AsyncStatusWatcher(client, ['a', 'b'], until={WAITING}, intervals={INIT: 0, PROCESS: 0})
+
+        async def main():
+            changes = []
+            async for c in watcher:
+                changes.append((c.pay_id, c.status))
+            return changes
+
+        out = self.run_async(main())
+        assert sorted(out) == [('a', INIT), ('a', PROCESS), ('a', WAITING), ('b', conf.PAYMENT_STATUS_REVERSED)]
+
+    def test_run(self):
+        client = FakeAsyncClient(a=[INIT, PROCESS, WAITING])
+        watcher = AsyncStatusWatcher(client, intervals={INIT: 0, PROCESS: 0})
+        changes = []
+        watcher.watch('a', changes.append, until={WAITING})
+        self.run_async(watcher.run())
+        assert [c.status for c in changes] == [INIT, PROCESS, WAITING]
+
+
+class CachedStatusWatcherTests(GatewayTestCase):
+
+    def test_cache_bypassed(self):
+        c = self.client(cache=MemoryCache(ttl=60))
+        pay_id = self.payment(c)
+        assert c.payment_status(pay_id).payment_status == INIT
+        self.process(pay_id, c)
+
+        watcher = StatusWatcher(c)
+        watcher.watch(pay_id)
+        change, = watcher.poll()
+        assert change.status == WAITING
+        assert c.payment_status(pay_id).payment_status == WAITING  # fresh status is cached